@@ -1,58 +1,261 @@
 import sys
 import os
-import subprocess
+import json
+import time
 from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, 
                              QPushButton, QLabel, QFileDialog, 
-                             QMessageBox, QTextEdit, QListWidget, QMenu,
-                             QTabWidget, QSpinBox, QProgressBar)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QSettings
-from PyQt6.QtGui import QTextCursor, QIcon, QDragEnterEvent, QDropEvent, QPainter, QAction
-
-def get_resource_path(relative_path):
-    if getattr(sys, 'frozen', False):
-        base_path = sys._MEIPASS
-    else:
-        base_path = os.path.dirname(__file__)
+                             QMessageBox, QTextEdit, QPlainTextEdit, QTableView, QHeaderView, QMenu,
+                             QTabWidget, QSpinBox, QProgressBar, QCheckBox, QComboBox, QLineEdit)
+from PyQt6.QtCore import (Qt, QThread, QTimer, pyqtSignal, QSettings, QAbstractTableModel, QModelIndex,
+                          QObject, QRunnable, QThreadPool)
+from PyQt6.QtGui import QIcon, QDragEnterEvent, QDropEvent, QPainter, QAction, QKeySequence
+
+from extender.engine import VIDEO_EXTENSIONS, ExtendOptions, ExtenderEngine, compute_repeat
+from extender.logbuffer import INFO, LOG_CAPACITY, SEVERITY_FILTERS, LogBuffer, default_spill_path
+from extender.probe_cache import ProbeCache, run_ffprobe
+from extender.scan import is_video_file, walk_directory
+from extender.scheduler import MEGABYTE, IoScheduler
+from extender.tools import FFMPEG_PATH, FFPROBE_PATH, binary_stamp, get_resource_path, probe_capabilities
+
+OUTPUT_MODES = [('Single file', 'file'), ('HLS', 'hls'), ('DASH', 'dash'), ('HLS + DASH', 'hls+dash')]
+REQUIRED_MUXERS = {'hls': {'hls'}, 'dash': {'dash'}, 'hls+dash': {'hls', 'dash'}}
+
+def normalize_path(path):
+    if not path:
+        return path
+        
+    normalized_path = os.path.normpath(path)
     
-    return os.path.join(base_path, relative_path)
-
-def get_ffmpeg_path():
-    if getattr(sys, 'frozen', False):
-        ffmpeg_path = get_resource_path('ffmpeg.exe')
-        ffprobe_path = get_resource_path('ffprobe.exe')
-    else:
-        ffmpeg_path = os.path.join(os.path.dirname(__file__), 'ffmpeg.exe')
-        ffprobe_path = os.path.join(os.path.dirname(__file__), 'ffprobe.exe')
+    if len(normalized_path) >= 2 and normalized_path[1] == ':':
+        normalized_path = normalized_path[0].upper() + normalized_path[1:]
     
-    return ffmpeg_path, ffprobe_path
+    return normalized_path
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def ffmpeg_capabilities(settings, ffmpeg_path):
+    # Listing formats costs a few ffmpeg runs, so the result is kept until the binary changes.
+    stamp = binary_stamp(ffmpeg_path)
+    if stamp is None:
+        return None
+    if settings.value('ffmpeg_stamp') == stamp:
+        try:
+            return json.loads(settings.value('ffmpeg_capabilities'))
+        except (TypeError, ValueError):
+            pass
+    capabilities = probe_capabilities(ffmpeg_path)
+    if capabilities is not None:
+        settings.setValue('ffmpeg_stamp', stamp)
+        settings.setValue('ffmpeg_capabilities', json.dumps(capabilities))
+    return capabilities
+
+class ProbeSignals(QObject):
+    probed = pyqtSignal(str, object)
+
+class ProbeTask(QRunnable):
+    def __init__(self, path, probe_cache, signals):
+        super().__init__()
+        self.path = path
+        self.probe_cache = probe_cache
+        self.signals = signals
+
+    def run(self):
+        try:
+            if self.probe_cache is not None:
+                info = self.probe_cache.probe(self.path)
+            else:
+                info = run_ffprobe(self.path)
+            size = os.path.getsize(self.path)
+        except Exception:
+            info, size = None, None
+        self.signals.probed.emit(self.path, (info, size))
+
+class FileTableModel(QAbstractTableModel):
+    """Input files in insertion order, indexed by normalized path so duplicate checks are O(1).
+
+    Metadata columns are filled lazily: the first time the view asks for a row, its probe is
+    queued on a thread pool, and finished probes are announced in one dataChanged per timer tick.
+    """
+
+    COLUMNS = ('Name', 'Duration', 'Codec', 'Size', 'Output')
+    REFRESH_INTERVAL_MS = 200
 
-FFMPEG_PATH, FFPROBE_PATH = get_ffmpeg_path()
+    def __init__(self, probe_cache=None, parent=None):
+        super().__init__(parent)
+        self.probe_cache = probe_cache
+        self.paths = []
+        self.keys = set()
+        self.metadata = {}
+        self.target = (1, 0, 0, 'file')
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(min(4, os.cpu_count() or 1))
+        self.signals = ProbeSignals(self)
+        self.signals.probed.connect(self.on_probed)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(self.REFRESH_INTERVAL_MS)
+        self.refresh_timer.timeout.connect(lambda: self.refresh_columns(1))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.paths[index.row()]
+        column = index.column()
+        if role == Qt.ItemDataRole.TextAlignmentRole and column > 0:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        if role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return None
+        key = normalize_path(path)
+        if key not in self.metadata:
+            self.metadata[key] = None
+            self.pool.start(ProbeTask(path, self.probe_cache, self.signals))
+        info, size = self.metadata[key] or (None, None)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return f"{path}\n{info.describe()}" if info is not None else path
+        if column == 0:
+            return os.path.basename(path)
+        if info is None:
+            return '…' if self.metadata[key] is None else ''
+        if column == 1:
+            return format_duration(info.duration)
+        if column == 2:
+            return info.video_codec or info.audio_codec or ''
+        if column == 3:
+            return format_size(size)
+        projected = self.projected_size(info, size)
+        return format_size(projected) if projected else ''
+
+    def projected_size(self, info, size):
+        hours, minutes, times, output_mode = self.target
+        if info.duration <= 0:
+            return None
+        repeat = compute_repeat(info.duration, hours, minutes, times)
+        return size * repeat if output_mode == 'file' else size
+
+    def on_probed(self, path, result):
+        key = normalize_path(path)
+        if key in self.keys:
+            self.metadata[key] = result
+            if not self.refresh_timer.isActive():
+                self.refresh_timer.start()
+
+    def refresh_columns(self, first_column):
+        if self.paths:
+            self.dataChanged.emit(self.index(0, first_column),
+                                  self.index(len(self.paths) - 1, len(self.COLUMNS) - 1))
+
+    def set_target(self, hours, minutes, times, output_mode):
+        self.target = (hours, minutes, times, output_mode)
+        self.refresh_columns(len(self.COLUMNS) - 1)
+
+    def add_files(self, files):
+        new_files = []
+        for path in files:
+            key = normalize_path(path)
+            if key not in self.keys:
+                self.keys.add(key)
+                new_files.append(path)
+        if new_files:
+            first = len(self.paths)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_files) - 1)
+            self.paths.extend(new_files)
+            self.endInsertRows()
+        return len(new_files)
+
+    def remove_rows(self, rows):
+        # Contiguous runs are removed back to front so earlier row numbers stay valid.
+        runs = []
+        for row in sorted(set(rows), reverse=True):
+            if runs and runs[-1][0] == row + 1:
+                runs[-1][0] = row
+            else:
+                runs.append([row, row])
+        for first, last in runs:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for path in self.paths[first:last + 1]:
+                key = normalize_path(path)
+                self.keys.discard(key)
+                self.metadata.pop(key, None)
+            del self.paths[first:last + 1]
+            self.endRemoveRows()
+
+    def clear(self):
+        self.pool.clear()
+        self.beginResetModel()
+        self.paths = []
+        self.keys = set()
+        self.metadata = {}
+        self.endResetModel()
+
+class FolderScanWorker(QThread):
+    """Walks dropped folders off the GUI thread and streams the videos found in batches."""
+
+    files_found = pyqtSignal(list)
+    BATCH_SIZE = 500
+    BATCH_SECONDS = 0.2
+
+    def __init__(self, folders, parent=None):
+        super().__init__(parent)
+        self.folders = folders
+        self.stopped = False
 
-class DragDropListWidget(QListWidget):
+    def run(self):
+        batch = []
+        last_emit = time.monotonic()
+        for folder in self.folders:
+            for path in walk_directory(folder):
+                if self.stopped:
+                    return
+                batch.append(path)
+                if len(batch) >= self.BATCH_SIZE or time.monotonic() - last_emit >= self.BATCH_SECONDS:
+                    self.files_found.emit(batch)
+                    batch = []
+                    last_emit = time.monotonic()
+        if batch:
+            self.files_found.emit(batch)
+
+    def stop(self):
+        self.stopped = True
+
+class DragDropTableView(QTableView):
     files_dropped = pyqtSignal(list)
+    folders_dropped = pyqtSignal(list)
     
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setAcceptDrops(True)
         self.original_style = self.styleSheet()
+
+    def dropped_paths(self, event):
+        paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+        return [p for p in paths if is_video_file(p)], [p for p in paths if os.path.isdir(p)]
         
     def dragEnterEvent(self, event: QDragEnterEvent):
         if event.mimeData().hasUrls():
-            video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm', '.m4v', 
-                               '.mpg', '.mpeg', '.m2v', '.m2ts', '.mts', '.ts', '.vob', '.3gp',
-                               '.3g2', '.f4v', '.asf', '.rmvb', '.rm', '.ogv', '.mxf', '.dv',
-                               '.divx', '.xvid', '.mpv', '.m2p', '.mp2', '.mpeg2', '.ogm'}
-            has_video = False
-            for url in event.mimeData().urls():
-                if url.isLocalFile():
-                    file_path = url.toLocalFile()
-                    if any(file_path.lower().endswith(ext) for ext in video_extensions):
-                        has_video = True
-                        break
-            
-            if has_video:
+            if any(self.dropped_paths(event)):
                 self.setStyleSheet(self.original_style + """
-                    QListWidget {
+                    QTableView {
                         border: 2px dashed #4CAF50;
                         background-color: #E8F5E8;
                     }
@@ -60,7 +263,7 @@ class DragDropListWidget(QListWidget):
                 event.acceptProposedAction()
             else:
                 self.setStyleSheet(self.original_style + """
-                    QListWidget {
+                    QTableView {
                         border: 2px dashed #F44336;
                         background-color: #FFEBEE;
                     }
@@ -70,23 +273,8 @@ class DragDropListWidget(QListWidget):
             event.ignore()
         
     def dragMoveEvent(self, event):
-        if event.mimeData().hasUrls():
-            video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm', '.m4v', 
-                               '.mpg', '.mpeg', '.m2v', '.m2ts', '.mts', '.ts', '.vob', '.3gp',
-                               '.3g2', '.f4v', '.asf', '.rmvb', '.rm', '.ogv', '.mxf', '.dv',
-                               '.divx', '.xvid', '.mpv', '.m2p', '.mp2', '.mpeg2', '.ogm'}
-            has_video = False
-            for url in event.mimeData().urls():
-                if url.isLocalFile():
-                    file_path = url.toLocalFile()
-                    if any(file_path.lower().endswith(ext) for ext in video_extensions):
-                        has_video = True
-                        break
-            
-            if has_video:
-                event.acceptProposedAction()
-            else:
-                event.ignore()
+        if event.mimeData().hasUrls() and any(self.dropped_paths(event)):
+            event.acceptProposedAction()
         else:
             event.ignore()
     
@@ -98,20 +286,12 @@ class DragDropListWidget(QListWidget):
         self.setStyleSheet(self.original_style)
         
         if event.mimeData().hasUrls():
-            video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm', '.m4v', 
-                               '.mpg', '.mpeg', '.m2v', '.m2ts', '.mts', '.ts', '.vob', '.3gp',
-                               '.3g2', '.f4v', '.asf', '.rmvb', '.rm', '.ogv', '.mxf', '.dv',
-                               '.divx', '.xvid', '.mpv', '.m2p', '.mp2', '.mpeg2', '.ogm'}
-            video_files = []
-            
-            for url in event.mimeData().urls():
-                if url.isLocalFile():
-                    file_path = url.toLocalFile()
-                    if any(file_path.lower().endswith(ext) for ext in video_extensions):
-                        video_files.append(file_path)
-            
+            video_files, folders = self.dropped_paths(event)
             if video_files:
                 self.files_dropped.emit(video_files)
+            if folders:
+                self.folders_dropped.emit(folders)
+            if video_files or folders:
                 event.acceptProposedAction()
             else:
                 event.ignore()
@@ -120,14 +300,14 @@ class DragDropListWidget(QListWidget):
 
     def paintEvent(self, event):
         super().paintEvent(event)
-        if self.count() == 0:
+        if self.model() is None or self.model().rowCount() == 0:
             painter = QPainter(self.viewport())
             painter.save()
             col = self.palette().placeholderText().color()
             painter.setPen(col)
             fm = self.fontMetrics()
             elided_text = fm.elidedText(
-                "📁 Drag & drop video files here or click 'Add Files'", 
+                "📁 Drag & drop video files or folders here", 
                 Qt.TextElideMode.ElideRight, 
                 self.viewport().width()
             )
@@ -144,15 +324,11 @@ class DragDropTextEdit(QTextEdit):
         
     def dragEnterEvent(self, event: QDragEnterEvent):
         if event.mimeData().hasUrls():
-            video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm', '.m4v', 
-                               '.mpg', '.mpeg', '.m2v', '.m2ts', '.mts', '.ts', '.vob', '.3gp',
-                               '.3g2', '.f4v', '.asf', '.rmvb', '.rm', '.ogv', '.mxf', '.dv',
-                               '.divx', '.xvid', '.mpv', '.m2p', '.mp2', '.mpeg2', '.ogm'}
             has_video = False
             for url in event.mimeData().urls():
                 if url.isLocalFile():
                     file_path = url.toLocalFile()
-                    if any(file_path.lower().endswith(ext) for ext in video_extensions):
+                    if is_video_file(file_path):
                         has_video = True
                         break
             
@@ -177,15 +353,11 @@ class DragDropTextEdit(QTextEdit):
         
     def dragMoveEvent(self, event):
         if event.mimeData().hasUrls():
-            video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm', '.m4v', 
-                               '.mpg', '.mpeg', '.m2v', '.m2ts', '.mts', '.ts', '.vob', '.3gp',
-                               '.3g2', '.f4v', '.asf', '.rmvb', '.rm', '.ogv', '.mxf', '.dv',
-                               '.divx', '.xvid', '.mpv', '.m2p', '.mp2', '.mpeg2', '.ogm'}
             has_video = False
             for url in event.mimeData().urls():
                 if url.isLocalFile():
                     file_path = url.toLocalFile()
-                    if any(file_path.lower().endswith(ext) for ext in video_extensions):
+                    if is_video_file(file_path):
                         has_video = True
                         break
             
@@ -204,15 +376,11 @@ class DragDropTextEdit(QTextEdit):
         self.setStyleSheet(self.original_style)
         
         if event.mimeData().hasUrls():
-            video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm', '.m4v', 
-                               '.mpg', '.mpeg', '.m2v', '.m2ts', '.mts', '.ts', '.vob', '.3gp',
-                               '.3g2', '.f4v', '.asf', '.rmvb', '.rm', '.ogv', '.mxf', '.dv',
-                               '.divx', '.xvid', '.mpv', '.m2p', '.mp2', '.mpeg2', '.ogm'}
             
             for url in event.mimeData().urls():
                 if url.isLocalFile():
                     file_path = url.toLocalFile()
-                    if any(file_path.lower().endswith(ext) for ext in video_extensions):
+                    if is_video_file(file_path):
                         self.file_dropped.emit(file_path)
                         event.acceptProposedAction()
                         return
@@ -236,140 +404,98 @@ class DragDropTextEdit(QTextEdit):
             )
             painter.drawText(self.viewport().rect(), Qt.AlignmentFlag.AlignCenter, elided_text)
             painter.restore()
-            
+
+class LogView(QPlainTextEdit):
+    """Shows the last LOG_CAPACITY messages, appending queued messages in one batch per timer tick."""
+
+    FLUSH_INTERVAL_MS = 100
+
+    def __init__(self, capacity=LOG_CAPACITY, parent=None):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(capacity)
+        self.buffer = LogBuffer(capacity)
+        self.min_severity = INFO
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(self.FLUSH_INTERVAL_MS)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start()
+
+    def append_message(self, message):
+        self.buffer.add(message)
+
+    def flush(self):
+        batch = [message for level, message in self.buffer.take_pending() if level >= self.min_severity]
+        if not batch:
+            return
+        scroll_bar = self.verticalScrollBar()
+        at_bottom = scroll_bar.value() >= scroll_bar.maximum() - 2
+        self.appendPlainText('\n'.join(batch))
+        if at_bottom:
+            scroll_bar.setValue(scroll_bar.maximum())
+
+    def set_min_severity(self, level):
+        self.min_severity = level
+        self.buffer.take_pending()
+        self.setPlainText('\n'.join(self.buffer.filtered(level)))
+        self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+
+    def clear_log(self):
+        self.buffer.clear()
+        self.clear()
+
 class VideoExtenderWorker(QThread):
-    progress = pyqtSignal(str)
     progress_percent = pyqtSignal(int)
     file_progress = pyqtSignal(int)
+    job_progress = pyqtSignal(int, int)
+    job_stats = pyqtSignal(int, object)
     status_updated = pyqtSignal(str)
     finished = pyqtSignal(bool, str)
 
-    def __init__(self, input_files, hours, minutes, times):
+    def __init__(self, input_files, hours, minutes, times, jobs=1, doubling=False, keep_intermediates=False,
+                 probe_cache=None, output_mode='file', metrics=None, resumable=False, content_store=None,
+                 seamless=False, output_dir=None, per_device=0, write_limit=0, loop_point=False, loop_cache=None):
         super().__init__()
-        self.input_files = input_files
-        self.hours = hours
-        self.minutes = minutes
-        self.times = times
-        self.total_duration = 0
-        self.is_running = True
-
-    def parse_ffmpeg_progress(self, line):
-        if 'time=' in line and self.total_duration > 0:
-            try:
-                time_part = line.split('time=')[1].split()[0]
-                time_parts = time_part.split(':')
-                if len(time_parts) == 3:
-                    hours = float(time_parts[0])
-                    minutes = float(time_parts[1])
-                    seconds = float(time_parts[2])
-                    current_seconds = hours * 3600 + minutes * 60 + seconds
-                    progress = min(int((current_seconds / self.total_duration) * 100), 100)
-                    self.progress_percent.emit(progress)
-            except:
-                pass
+        self.input_files = list(input_files)
+        options = ExtendOptions(hours, minutes, times, doubling, keep_intermediates, output_mode=output_mode,
+                                resumable=resumable, seamless=seamless, output_dir=output_dir, loop_point=loop_point)
+        scheduler = IoScheduler(per_device, write_limit * MEGABYTE)
+        self.engine = ExtenderEngine(options, jobs, probe_cache, metrics, content_store, scheduler, loop_cache)
+        self.engine.on_status = self.status_updated.emit
+        self.engine.on_progress = self.progress_percent.emit
+        self.engine.on_job_progress = self.job_progress.emit
+        self.engine.on_job_stats = self.job_stats.emit
+        self.engine.on_batch_progress = self.file_progress.emit
+        self.engine.on_job_metrics = self.report_metrics
+
+    def report_metrics(self, index, job):
+        timings = job.describe()
+        if job.success and timings:
+            self.status_updated.emit(f"ℹ️ {os.path.basename(job.input_file)}: {timings}")
 
     def run(self):
-        total_files = len(self.input_files)
-        
-        for i, input_file in enumerate(self.input_files):
-            if not self.is_running:
-                break
-                
-            try:
-                from subprocess import CREATE_NO_WINDOW
-                
-                self.status_updated.emit(f"Processing: {os.path.basename(input_file)}")
-                
-                duration_cmd = [
-                    FFPROBE_PATH, '-v', 'error',
-                    '-show_entries', 'format=duration',
-                    '-of', 'default=noprint_wrappers=1:nokey=1',
-                    input_file
-                ]
-                
-                duration = float(subprocess.check_output(
-                    duration_cmd,
-                    creationflags=CREATE_NO_WINDOW
-                ).decode().strip())
-                
-                if self.times > 0:
-                    repeat = self.times
-                else:
-                    desired_seconds = (self.hours * 3600) + (self.minutes * 60)
-                    repeat = int((desired_seconds + duration - 1) / duration)
-                
-                self.total_duration = duration * repeat
-                
-                concat_file = "concat.txt"
-                with open(concat_file, 'w') as f:
-                    for _ in range(repeat):
-                        f.write(f"file '{input_file}'\n")
-                
-                name, ext = os.path.splitext(input_file)
-                if self.times > 0:
-                    output_file = f"{name}_{self.times}times{ext}"
-                else:
-                    time_str = f"{self.hours}h{self.minutes}m" if self.minutes > 0 else f"{self.hours}h"
-                    output_file = f"{name}_{time_str}{ext}"
-                
-                ffmpeg_cmd = [
-                    FFMPEG_PATH,
-                    '-f', 'concat',
-                    '-safe', '0',
-                    '-i', concat_file,
-                    '-c', 'copy',
-                    '-progress', 'pipe:2',
-                    output_file
-                ]
-                
-                process = subprocess.Popen(
-                    ffmpeg_cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True,
-                    creationflags=CREATE_NO_WINDOW
-                )
-                
-                while True:
-                    if not self.is_running:
-                        process.terminate()
-                        break
-                        
-                    line = process.stderr.readline()
-                    if not line:
-                        break
-                    line = line.strip()
-                    if line:
-                        self.parse_ffmpeg_progress(line)
-                
-                process.wait()
-                os.remove(concat_file)
-                
-                if process.returncode == 0:
-                    self.status_updated.emit(f"✅ Completed: {os.path.basename(input_file)}")
-                    self.progress_percent.emit(100)
-                else:
-                    self.status_updated.emit(f"❌ Failed: {os.path.basename(input_file)}")
-                
-                progress = int((i + 1) / total_files * 100)
-                self.file_progress.emit(progress)
-                
-            except Exception as e:
-                self.status_updated.emit(f"❌ Error: {str(e)}")
-        
-        if self.is_running:
+        if self.engine.run(self.input_files):
             self.finished.emit(True, "All videos processed successfully!")
         else:
             self.finished.emit(False, "Processing cancelled")
     
     def stop(self):
-        self.is_running = False
+        self.engine.stop()
 
 class VideoExtender(QWidget):
     def __init__(self):
         super().__init__()
         self.settings = QSettings('videoextender', 'Video Extender')
-        self.input_files = []
+        try:
+            self.probe_cache = ProbeCache()
+        except Exception:
+            self.probe_cache = None
+        self.file_model = FileTableModel(self.probe_cache)
+        self.scan_workers = []
+        self.content_store = None
+        self.metrics = None
+        self.loop_cache = None
+        self.ffmpeg_info = None
         self.initUI()
         
         self.setWindowTitle('Video Extender')
@@ -377,20 +503,9 @@ class VideoExtender(QWidget):
         if os.path.exists(icon_path):
             self.setWindowIcon(QIcon(icon_path))
 
-    def normalize_path(self, path):
-        if not path:
-            return path
-            
-        normalized_path = os.path.normpath(path)
-        
-        if len(normalized_path) >= 2 and normalized_path[1] == ':':
-            normalized_path = normalized_path[0].upper() + normalized_path[1:]
-        
-        return normalized_path
-
     def initUI(self):
         self.setWindowTitle('Video Extender')
-        self.setFixedSize(400, 330)
+        self.setFixedSize(400, 360)
         main_layout = QVBoxLayout()
         main_layout.setContentsMargins(5, 5, 5, 5)
         main_layout.setSpacing(5)
@@ -421,6 +536,15 @@ class VideoExtender(QWidget):
         self.times_input.setValue(0)
         settings_layout.addWidget(times_label)
         settings_layout.addWidget(self.times_input)
+
+        jobs_label = QLabel('Jobs:')
+        self.jobs_input = QSpinBox()
+        self.jobs_input.setMaximumWidth(60)
+        self.jobs_input.setRange(1, max(1, os.cpu_count() or 1) * 2)
+        self.jobs_input.setValue(int(self.settings.value('jobs', min(4, os.cpu_count() or 1))))
+        self.jobs_input.setToolTip('Number of videos processed in parallel')
+        settings_layout.addWidget(jobs_label)
+        settings_layout.addWidget(self.jobs_input)
         
         settings_layout.addStretch()
 
@@ -438,8 +562,16 @@ class VideoExtender(QWidget):
         main_layout.addWidget(self.tab_widget)
         
         self.create_file_selection_tab()
-        self.create_progress_tab()
-        self.create_about_tab()
+        self.lazy_tabs = {
+            self.tab_widget.addTab(QWidget(), "Progress"): self.create_progress_tab,
+            self.tab_widget.addTab(QWidget(), "About"): self.create_about_tab,
+        }
+        self.tab_widget.currentChanged.connect(self.build_tab)
+
+        for spin_box in (self.hours_input, self.minutes_input, self.times_input):
+            spin_box.valueChanged.connect(self.update_projection)
+        self.output_mode_combo.currentIndexChanged.connect(self.update_projection)
+        self.update_projection()
         
         self.setLayout(main_layout)
 
@@ -460,30 +592,132 @@ class VideoExtender(QWidget):
         button_layout.addWidget(self.clear_files_btn)
         layout.addLayout(button_layout)
         
-        self.file_list = DragDropListWidget()
+        self.file_list = DragDropTableView()
+        self.file_list.setModel(self.file_model)
+        self.file_list.setSelectionMode(QTableView.SelectionMode.ExtendedSelection)
+        self.file_list.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.file_list.setShowGrid(False)
+        self.file_list.setWordWrap(False)
+        self.file_list.verticalHeader().setVisible(False)
+        self.file_list.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.file_list.verticalHeader().setDefaultSectionSize(self.fontMetrics().height() + 4)
+        # Fixed metadata widths keep the header from sizing columns by probing every row.
+        header = self.file_list.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for column, sample in enumerate(('0:00:00', 'mpeg4', '000.0 MB', '000.0 MB'), 1):
+            label = FileTableModel.COLUMNS[column]
+            header.resizeSection(column, max(map(self.fontMetrics().horizontalAdvance, (sample, label))) + 10)
         self.file_list.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.file_list.customContextMenuRequested.connect(self.show_context_menu)
         self.file_list.files_dropped.connect(self.handle_dropped_files)
+        self.file_list.folders_dropped.connect(self.scan_folders)
+        delete_shortcut = QAction(self.file_list)
+        delete_shortcut.setShortcut(QKeySequence.StandardKey.Delete)
+        delete_shortcut.setShortcutContext(Qt.ShortcutContext.WidgetShortcut)
+        delete_shortcut.triggered.connect(self.delete_selected_file)
+        self.file_list.addAction(delete_shortcut)
         layout.addWidget(self.file_list)
         
+        options_layout = QHBoxLayout()
+
+        self.doubling_checkbox = QCheckBox('Doubling')
+        self.doubling_checkbox.setToolTip('Build 2x, 4x, 8x... intermediates for large repeat counts')
+        self.doubling_checkbox.setChecked(self.settings.value('doubling', False, type=bool))
+        options_layout.addWidget(self.doubling_checkbox)
+
+        self.keep_intermediates_checkbox = QCheckBox('Keep parts')
+        self.keep_intermediates_checkbox.setToolTip('Keep doubling intermediates next to the input for reuse')
+        self.keep_intermediates_checkbox.setChecked(self.settings.value('keep_intermediates', False, type=bool))
+        self.keep_intermediates_checkbox.setEnabled(self.doubling_checkbox.isChecked())
+        self.doubling_checkbox.toggled.connect(self.keep_intermediates_checkbox.setEnabled)
+        options_layout.addWidget(self.keep_intermediates_checkbox)
+
+        self.resumable_checkbox = QCheckBox('Resume')
+        self.resumable_checkbox.setToolTip('Write checkpointed segments and join them at the end, '
+                                           'so a stopped job continues where it left off')
+        self.resumable_checkbox.setChecked(self.settings.value('resumable', False, type=bool))
+        options_layout.addWidget(self.resumable_checkbox)
+
+        self.seamless_checkbox = QCheckBox('Seamless')
+        self.seamless_checkbox.setToolTip('Re-encode only the last and first GOP once so loop points play '
+                                          'without a glitch; the rest is still stream copied')
+        self.seamless_checkbox.setChecked(self.settings.value('seamless', False, type=bool))
+        options_layout.addWidget(self.seamless_checkbox)
+
+        self.loop_point_checkbox = QCheckBox('Loop point')
+        self.loop_point_checkbox.setToolTip('Find the keyframes near the start and end whose frames match best '
+                                            'and loop only the range between them')
+        self.loop_point_checkbox.setChecked(self.settings.value('loop_point', False, type=bool))
+        layout.addLayout(options_layout)
+
+        output_layout = QHBoxLayout()
+        self.output_dir_input = QLineEdit(self.settings.value('output_dir', ''))
+        self.output_dir_input.setPlaceholderText('Output folder (default: next to each input)')
+        self.output_dir_input.setClearButtonEnabled(True)
+        output_layout.addWidget(self.output_dir_input)
+        self.output_dir_btn = QPushButton('Browse')
+        self.output_dir_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.output_dir_btn.clicked.connect(self.choose_output_dir)
+        output_layout.addWidget(self.output_dir_btn)
+        layout.addLayout(output_layout)
+
+        io_layout = QHBoxLayout()
+        io_layout.addWidget(QLabel('Jobs per disk:'))
+        self.per_device_input = QSpinBox()
+        self.per_device_input.setRange(0, self.jobs_input.maximum())
+        self.per_device_input.setSpecialValueText('Any')
+        self.per_device_input.setValue(int(self.settings.value('per_device', 0)))
+        self.per_device_input.setToolTip('Most jobs at once that read from or write to the same disk')
+        io_layout.addWidget(self.per_device_input)
+        io_layout.addSpacing(10)
+        io_layout.addWidget(QLabel('Write limit:'))
+        self.write_limit_input = QSpinBox()
+        self.write_limit_input.setRange(0, 10000)
+        self.write_limit_input.setSuffix(' MB/s')
+        self.write_limit_input.setSpecialValueText('None')
+        self.write_limit_input.setValue(int(self.settings.value('write_limit', 0)))
+        self.write_limit_input.setToolTip('Cap the write rate to each output disk')
+        io_layout.addWidget(self.write_limit_input)
+        io_layout.addStretch()
+        layout.addLayout(io_layout)
+
         control_layout = QHBoxLayout()
+
+        self.output_mode_combo = QComboBox()
+        self.output_mode_combo.setToolTip('Write an extended file, or looping HLS/DASH playlists over one set of segments')
+        for label, mode in OUTPUT_MODES:
+            self.output_mode_combo.addItem(label, mode)
+        mode_index = self.output_mode_combo.findData(self.settings.value('output_mode', 'file'))
+        self.output_mode_combo.setCurrentIndex(max(0, mode_index))
+        control_layout.addWidget(self.output_mode_combo)
+        control_layout.addStretch()
         
         self.process_btn = QPushButton('Start Processing')
         self.process_btn.setCursor(Qt.CursorShape.PointingHandCursor)
         self.process_btn.setFixedWidth(150)
         self.process_btn.clicked.connect(self.process_videos)
         control_layout.addWidget(self.process_btn)
+
+        # Balances the combo so the button stays centred.
+        control_layout.addStretch()
+        control_layout.addWidget(self.loop_point_checkbox)
+        control_layout.addSpacing(max(0, self.output_mode_combo.sizeHint().width()
+                                      - self.loop_point_checkbox.sizeHint().width()))
         
         layout.addLayout(control_layout)
         
         self.tab_widget.addTab(tab, "File Selection")
 
-    def create_progress_tab(self):
-        tab = QWidget()
+    def build_tab(self, index):
+        create = self.lazy_tabs.pop(index, None)
+        if create is not None:
+            create(self.tab_widget.widget(index))
+
+    def create_progress_tab(self, tab):
         layout = QVBoxLayout(tab)
         layout.setSpacing(5)
         
-        self.file_progress_label = QLabel("File Progress:")
+        self.file_progress_label = QLabel("Batch Progress:")
         self.file_progress_label.setVisible(False)
         layout.addWidget(self.file_progress_label)
         
@@ -499,11 +733,18 @@ class VideoExtender(QWidget):
         self.ffmpeg_progress_bar.setVisible(False)
         layout.addWidget(self.ffmpeg_progress_bar)
         
-        self.log_text = QTextEdit()
-        self.log_text.setReadOnly(True)
-        layout.addWidget(self.log_text)
+        self.log_view = LogView()
+        layout.addWidget(self.log_view)
         
         stop_layout = QHBoxLayout()
+
+        self.log_filter_combo = QComboBox()
+        self.log_filter_combo.setToolTip('Show only messages of this severity or worse')
+        for label, level in SEVERITY_FILTERS:
+            self.log_filter_combo.addItem(label, level)
+        self.log_filter_combo.currentIndexChanged.connect(
+            lambda: self.log_view.set_min_severity(self.log_filter_combo.currentData()))
+        stop_layout.addWidget(self.log_filter_combo)
         stop_layout.addStretch()
         
         self.stop_btn = QPushButton("Stop")
@@ -514,13 +755,16 @@ class VideoExtender(QWidget):
         stop_layout.addWidget(self.stop_btn)
         
         stop_layout.addStretch()
-        layout.addLayout(stop_layout)
-        
-        self.tab_widget.addTab(tab, "Progress")
 
-    def create_about_tab(self):
+        self.log_spill_checkbox = QCheckBox('Full log')
+        self.log_spill_checkbox.setToolTip('Also write every message of a run to a log file in the cache folder, '
+                                           'beyond the last %d shown here' % LOG_CAPACITY)
+        self.log_spill_checkbox.setChecked(self.settings.value('log_spill', False, type=bool))
+        self.log_spill_checkbox.toggled.connect(lambda checked: self.settings.setValue('log_spill', checked))
+        stop_layout.addWidget(self.log_spill_checkbox)
+        layout.addLayout(stop_layout)
 
-        tab = QWidget()
+    def create_about_tab(self, tab):
         layout = QVBoxLayout(tab)
         layout.setSpacing(10)
         
@@ -532,10 +776,14 @@ class VideoExtender(QWidget):
             icon_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
             layout.addWidget(icon_label)
 
-        about_text = QLabel("""
+        capabilities = self.get_ffmpeg_info()
+        ffmpeg_version = ' '.join(capabilities['version'].split()[:3]) if capabilities else 'not found'
+        about_text = QLabel(f"""
 <h3>Video Extender</h3>
 <p><b>Version:</b> 1.0</p>
 
+<p><b>FFmpeg:</b> {ffmpeg_version}</p>
+
 <p><b>Supported Input Formats:</b><br>
 MP4, AVI, MOV, MKV, WMV, FLV, WEBM, M4V, MPG, MPEG, M2V, M2TS, MTS, TS, VOB, 3GP, 3G2, F4V, ASF, RMVB, RM, OGV, MXF, DV, DIVX, XVID, MPV, M2P, MP2, MPEG2, OGM</p>
 
@@ -548,8 +796,32 @@ MP4, AVI, MOV, MKV, WMV, FLV, WEBM, M4V, MPG, MPEG, M2V, M2TS, MTS, TS, VOB, 3GP
         layout.addWidget(about_text)
 
         layout.addStretch()
-        
-        self.tab_widget.addTab(tab, "About")
+
+    def get_ffmpeg_info(self):
+        if self.ffmpeg_info is None:
+            self.ffmpeg_info = ffmpeg_capabilities(self.settings, FFMPEG_PATH)
+        return self.ffmpeg_info
+
+    def ensure_stores(self):
+        from extender.dedup import ContentStore
+        from extender.looppoint import LoopPointCache
+        from extender.metrics import MetricsRecorder, default_job_log_path, default_textfile_path
+
+        if self.content_store is None:
+            try:
+                self.content_store = ContentStore()
+            except Exception:
+                pass
+        if self.metrics is None:
+            try:
+                self.metrics = MetricsRecorder(default_job_log_path(), default_textfile_path())
+            except OSError:
+                pass
+        if self.loop_cache is None:
+            try:
+                self.loop_cache = LoopPointCache()
+            except Exception:
+                pass
 
     def on_times_changed(self, value):
         if value > 0:
@@ -566,15 +838,7 @@ MP4, AVI, MOV, MKV, WMV, FLV, WEBM, M4V, MPG, MPEG, M2V, M2TS, MTS, TS, VOB, 3GP
             self.times_input.setValue(0)
 
     def add_files(self):
-        video_formats = "Video Files ("
-        extensions = [
-            "*.mp4", "*.avi", "*.mov", "*.mkv", "*.wmv", "*.flv", "*.webm", 
-            "*.m4v", "*.mpg", "*.mpeg", "*.m2v", "*.m2ts", "*.mts", "*.ts", 
-            "*.vob", "*.3gp", "*.3g2", "*.f4v", "*.asf", "*.rmvb", "*.rm", 
-            "*.ogv", "*.mxf", "*.dv", "*.divx", "*.xvid", "*.mpv", "*.m2p", 
-            "*.mp2", "*.mpeg2", "*.ogm"
-        ]
-        video_formats += " ".join(extensions) + ")"
+        video_formats = "Video Files (" + " ".join(f"*{ext}" for ext in sorted(VIDEO_EXTENSIONS)) + ")"
         
         files, _ = QFileDialog.getOpenFileNames(
             self,
@@ -584,27 +848,39 @@ MP4, AVI, MOV, MKV, WMV, FLV, WEBM, M4V, MPG, MPEG, M2V, M2TS, MTS, TS, VOB, 3GP
         )
         
         if files:
-            for file in files:
-                if file not in self.input_files:
-                    self.input_files.append(file)
-                    self.file_list.addItem(os.path.basename(file))                    
-            pass
+            self.file_model.add_files(files)
     
     def handle_dropped_files(self, files):
-        added_count = 0
-        for file in files:
-            if file not in self.input_files:
-                self.input_files.append(file)
-                self.file_list.addItem(os.path.basename(file))
-                added_count += 1
-        
+        self.file_model.add_files(files)
+
+    def scan_folders(self, folders):
+        worker = FolderScanWorker(folders, self)
+        worker.files_found.connect(lambda files: self.add_scanned_files(worker, files))
+        worker.finished.connect(lambda: self.scan_workers.remove(worker))
+        self.scan_workers.append(worker)
+        worker.start()
+
+    def add_scanned_files(self, worker, files):
+        # Batches already queued when Clear All stopped the scan still arrive; they are dropped.
+        if not worker.stopped:
+            self.file_model.add_files(files)
+
+    def choose_output_dir(self):
+        directory = QFileDialog.getExistingDirectory(self, "Select Output Folder", self.output_dir_input.text())
+        if directory:
+            self.output_dir_input.setText(normalize_path(directory))
+
+    def update_projection(self):
+        self.file_model.set_target(self.hours_input.value(), self.minutes_input.value(),
+                                   self.times_input.value(), self.output_mode_combo.currentData())
+
     def clear_files(self):
-        self.input_files.clear()
-        self.file_list.clear()
+        for worker in self.scan_workers:
+            worker.stop()
+        self.file_model.clear()
     
     def show_context_menu(self, position):
-        item = self.file_list.itemAt(position)
-        if item is not None:
+        if self.file_list.indexAt(position).isValid():
             context_menu = QMenu(self)
             delete_action = QAction("Delete", self)
             delete_action.setIcon(self.style().standardIcon(self.style().StandardPixmap.SP_TrashIcon))
@@ -613,38 +889,78 @@ MP4, AVI, MOV, MKV, WMV, FLV, WEBM, M4V, MPG, MPEG, M2V, M2TS, MTS, TS, VOB, 3GP
             context_menu.exec(self.file_list.mapToGlobal(position))
     
     def delete_selected_file(self):
-        current_row = self.file_list.currentRow()
-        if current_row >= 0:
-            item = self.file_list.takeItem(current_row)
-            if current_row < len(self.input_files):
-                removed_file = self.input_files.pop(current_row)
+        rows = [row for selection_range in self.file_list.selectionModel().selection()
+                for row in range(selection_range.top(), selection_range.bottom() + 1)]
+        if not rows and self.file_list.currentIndex().isValid():
+            rows = [self.file_list.currentIndex().row()]
+        self.file_model.remove_rows(rows)
 
     def process_videos(self):
-        if not self.input_files:
+        if not self.file_model.paths:
             QMessageBox.warning(self, 'Warning', 'Please add video files first!')
             return
 
+        if self.hours_input.value() <= 0 and self.minutes_input.value() <= 0 and self.times_input.value() <= 0:
+            QMessageBox.warning(self, 'Warning', 'Please set a duration or a number of times to extend to!')
+            return
+
         if not os.path.exists(FFMPEG_PATH) or not os.path.exists(FFPROBE_PATH):
-            QMessageBox.warning(self, 'Warning', 'FFmpeg files not found. Please ensure ffmpeg.exe and ffprobe.exe are in the same directory as this application.')
+            QMessageBox.warning(self, 'Warning', 'FFmpeg files not found. Please place ffmpeg and ffprobe in the same directory as this application, or install them on PATH.')
+            return
+
+        capabilities = self.get_ffmpeg_info()
+        if capabilities is None:
+            QMessageBox.warning(self, 'Warning', f'FFmpeg could not be run: {FFMPEG_PATH}')
+            return
+        missing = REQUIRED_MUXERS.get(self.output_mode_combo.currentData(), set()) - set(capabilities['muxers'])
+        if missing:
+            QMessageBox.warning(self, 'Warning', f'This FFmpeg build cannot write {", ".join(sorted(missing)).upper()}.')
             return
 
         hours = self.hours_input.value()
         minutes = self.minutes_input.value()
         times = self.times_input.value()
+        jobs = self.jobs_input.value()
+        doubling = self.doubling_checkbox.isChecked()
+        keep_intermediates = self.keep_intermediates_checkbox.isChecked()
+        resumable = self.resumable_checkbox.isChecked()
+        seamless = self.seamless_checkbox.isChecked()
+        loop_point = self.loop_point_checkbox.isChecked()
+        output_mode = self.output_mode_combo.currentData()
+        output_dir = self.output_dir_input.text().strip()
+        per_device = self.per_device_input.value()
+        write_limit = self.write_limit_input.value()
+        self.settings.setValue('output_mode', output_mode)
+        self.settings.setValue('jobs', jobs)
+        self.settings.setValue('doubling', doubling)
+        self.settings.setValue('keep_intermediates', keep_intermediates)
+        self.settings.setValue('resumable', resumable)
+        self.settings.setValue('seamless', seamless)
+        self.settings.setValue('loop_point', loop_point)
+        self.settings.setValue('output_dir', output_dir)
+        self.settings.setValue('per_device', per_device)
+        self.settings.setValue('write_limit', write_limit)
         
         self.tab_widget.setCurrentIndex(1)
+        self.ensure_stores()
         
-        self.worker = VideoExtenderWorker(self.input_files, hours, minutes, times)
-        self.worker.progress.connect(self.update_log)
+        self.worker = VideoExtenderWorker(self.file_model.paths, hours, minutes, times, jobs,
+                                          doubling, keep_intermediates, self.probe_cache, output_mode,
+                                          self.metrics, resumable, self.content_store, seamless,
+                                          output_dir or None, per_device, write_limit, loop_point,
+                                          self.loop_cache)
         self.worker.progress_percent.connect(self.update_ffmpeg_progress)
         self.worker.file_progress.connect(self.update_file_progress)
+        self.worker.job_stats.connect(self.update_job_stats)
+        self.job_stats = {}
+        self.ffmpeg_progress_bar.setFormat("%p%")
         self.worker.status_updated.connect(self.update_status)
         self.worker.finished.connect(self.on_process_finished)
         
         self.process_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
         
-        if len(self.input_files) == 1:
+        if len(self.file_model.paths) == 1:
             self.file_progress_label.setVisible(False)
             self.file_progress_bar.setVisible(False)
             self.ffmpeg_progress_label.setVisible(True)
@@ -654,22 +970,30 @@ MP4, AVI, MOV, MKV, WMV, FLV, WEBM, M4V, MPG, MPEG, M2V, M2TS, MTS, TS, VOB, 3GP
             self.file_progress_label.setVisible(True)
             self.file_progress_bar.setVisible(True)
             self.file_progress_bar.setValue(0)
+            self.ffmpeg_progress_label.setText("Active Jobs Progress:" if jobs > 1 else "Current File Progress:")
             self.ffmpeg_progress_label.setVisible(True)
             self.ffmpeg_progress_bar.setVisible(True)
             self.ffmpeg_progress_bar.setValue(0)
         
-        self.log_text.clear()
-        self.log_text.append(f"Starting processing of {len(self.input_files)} file(s)")
-        if len(self.input_files) > 1:
-            self.log_text.append(f"Hours: {hours}, Minutes: {minutes}, Times: {times}")
-        self.log_text.append("-" * 50)
+        self.log_view.clear_log()
+        if self.log_spill_checkbox.isChecked():
+            try:
+                self.log_view.buffer.start_spill(default_spill_path())
+            except OSError as e:
+                self.log_view.append_message(f"⚠️ Full log disabled: {e}")
+        self.log_view.append_message(f"Starting processing of {len(self.file_model.paths)} file(s)")
+        if self.log_view.buffer.spill_file is not None:
+            self.log_view.append_message(f"Full log: {self.log_view.buffer.spill_file.name}")
+        if len(self.file_model.paths) > 1:
+            self.log_view.append_message(f"Hours: {hours}, Minutes: {minutes}, Times: {times}, Jobs: {jobs}")
+        self.log_view.append_message("-" * 50)
         self.worker.start()
 
     def stop_processing(self):
         if hasattr(self, 'worker') and self.worker.isRunning():
             self.worker.stop()
             self.worker.wait()
-            self.log_text.append("\nProcessing stopped by user")
+            self.log_view.append_message("\nProcessing stopped by user")
             self.process_btn.setEnabled(True)
             self.stop_btn.setEnabled(False)
             self.file_progress_bar.setVisible(False)
@@ -677,20 +1001,28 @@ MP4, AVI, MOV, MKV, WMV, FLV, WEBM, M4V, MPG, MPEG, M2V, M2TS, MTS, TS, VOB, 3GP
             self.file_progress_label.setVisible(False)
             self.ffmpeg_progress_label.setVisible(False)
 
-    def update_log(self, message):
-        if any(keyword in message.lower() for keyword in ['error', 'warning', 'failed', 'success', 'completed']):
-            self.log_text.append(message)
-            self.log_text.moveCursor(QTextCursor.MoveOperation.End)
-
     def update_ffmpeg_progress(self, percent):
         self.ffmpeg_progress_bar.setValue(percent)
 
+    def update_job_stats(self, index, info):
+        if info.finished:
+            self.job_stats.pop(index, None)
+        else:
+            self.job_stats[index] = info
+        speeds = [i.speed for i in self.job_stats.values() if i.speed is not None]
+        parts = ["%p%"]
+        if speeds:
+            parts.append(f"{sum(speeds) / len(speeds):.1f}x")
+        throughput = sum(i.bytes_per_second for i in self.job_stats.values())
+        if throughput:
+            parts.append(f"{throughput / (1024 * 1024):.1f} MB/s")
+        self.ffmpeg_progress_bar.setFormat(" · ".join(parts))
+
     def update_file_progress(self, percent):
         self.file_progress_bar.setValue(percent)
 
     def update_status(self, message):
-        self.log_text.append(message)
-        self.log_text.moveCursor(QTextCursor.MoveOperation.End)
+        self.log_view.append_message(message)
 
     def on_process_finished(self, success, message):
         self.process_btn.setEnabled(True)
@@ -700,10 +1032,10 @@ MP4, AVI, MOV, MKV, WMV, FLV, WEBM, M4V, MPG, MPEG, M2V, M2TS, MTS, TS, VOB, 3GP
         self.file_progress_label.setVisible(False)
         self.ffmpeg_progress_label.setVisible(False)
 
-        if success:
-            self.log_text.append(f"\n{message}")
-        else:
-            self.log_text.append(f"\nError: {message}")
+        self.log_view.append_message(f"\n{message}" if success else f"\nError: {message}")
+        self.log_view.flush()
+        self.log_view.buffer.stop_spill()
+        if not success:
             QMessageBox.critical(self, 'Error', f'An error occurred: {message}')
 
 if __name__ == '__main__':
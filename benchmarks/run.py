@@ -0,0 +1,290 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extender.engine import ExtendOptions, ExtenderEngine
+from extender.tools import FFMPEG_PATH, FFPROBE_PATH
+
+FIXTURE_DIR = os.path.join(ROOT, 'benchmarks', 'fixtures')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+RESULTS_VERSION = 1
+
+CONTAINERS = {
+    'mp4': ('.mp4', ['-c:v', 'libx264', '-preset', 'veryfast', '-c:a', 'aac']),
+    'mov': ('.mov', ['-c:v', 'libx264', '-preset', 'veryfast', '-c:a', 'pcm_s16le']),
+    'mkv': ('.mkv', ['-c:v', 'libx264', '-preset', 'veryfast', '-c:a', 'aac']),
+    'ts': ('.ts', ['-c:v', 'libx264', '-preset', 'veryfast', '-c:a', 'aac']),
+    'mpg': ('.mpg', ['-c:v', 'mpeg2video', '-q:v', '4', '-c:a', 'mp2']),
+}
+MODES = {
+    'native': dict(native=True),
+    'concat': dict(native=False),
+    'doubling': dict(native=False, doubling=True),
+    'hls': dict(output_mode='hls'),
+    'dash': dict(output_mode='dash'),
+}
+DEFAULT_CONTAINERS = ['mp4', 'mkv', 'ts', 'mpg']
+DEFAULT_LENGTHS = [5, 30]
+DEFAULT_GOPS = [25, 250]
+DEFAULT_TIMES = [10, 100]
+DEFAULT_MODES = ['native', 'concat', 'doubling', 'hls']
+# Metrics where a larger number is an improvement; everything else is a cost.
+HIGHER_IS_BETTER = {'throughput_mb_s', 'realtime_factor'}
+COMPARED_METRICS = ('wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'bytes_written', 'throughput_mb_s')
+
+def fixture_path(container, seconds, gop, fixture_dir=FIXTURE_DIR):
+    ext = CONTAINERS[container][0]
+    return os.path.join(fixture_dir, f"{container}_{seconds}s_g{gop}{ext}")
+
+def make_fixture(container, seconds, gop, ffmpeg_path, fixture_dir=FIXTURE_DIR):
+    path = fixture_path(container, seconds, gop, fixture_dir)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(fixture_dir, exist_ok=True)
+    ext, codec_args = CONTAINERS[container]
+    partial = path + '.partial' + ext
+    cmd = [
+        ffmpeg_path, '-v', 'error', '-nostdin', '-y',
+        '-f', 'lavfi', '-i', f'testsrc=size=1280x720:rate=25:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={seconds}',
+        *codec_args, '-g', str(gop), '-pix_fmt', 'yuv420p', '-shortest',
+        partial
+    ]
+    subprocess.run(cmd, check=True)
+    os.replace(partial, path)
+    return path
+
+def tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return total
+
+def resource_usage():
+    if resource is None:
+        return None, None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return cpu, max(own.ru_maxrss, children.ru_maxrss) * scale
+
+def run_case(case):
+    """Runs one benchmark case in this process and returns its measurements."""
+    fixture = case['fixture']
+    work_dir = tempfile.mkdtemp(prefix='videoextender_bench_')
+    try:
+        input_file = os.path.join(work_dir, os.path.basename(fixture))
+        shutil.copyfile(fixture, input_file)
+
+        options = ExtendOptions(times=case['times'], ffmpeg_path=case['ffmpeg'], ffprobe_path=case['ffprobe'],
+                                **MODES[case['mode']])
+        engine = ExtenderEngine(options)
+        outputs = []
+        methods = []
+        engine.on_job_finished = lambda index, input_file, output_file, success: outputs.append(output_file)
+        engine.on_job_metrics = lambda index, job: methods.append(job.method)
+
+        cpu_before, _ = resource_usage()
+        wall_start = time.perf_counter()
+        engine.run([input_file])
+        wall = time.perf_counter() - wall_start
+        cpu_after, peak_rss = resource_usage()
+
+        output = outputs[0] if outputs else None
+        # The engine falls back between methods (native to concat for an unsupported container,
+        # for one), so the method that actually ran is recorded next to the requested mode.
+        method = methods[0] if methods else None
+        if engine.failed_files or not output or not os.path.exists(output):
+            return dict(success=False, method=method)
+        if case['mode'] in ('hls', 'dash'):
+            output = os.path.dirname(output)
+        bytes_written = tree_size(output)
+        return dict(
+            success=True,
+            method=method,
+            wall_seconds=wall,
+            cpu_seconds=None if cpu_before is None else cpu_after - cpu_before,
+            peak_rss_mb=None if peak_rss is None else peak_rss / (1024 * 1024),
+            bytes_written=bytes_written,
+            throughput_mb_s=bytes_written / (1024 * 1024) / wall if wall > 0 else None,
+            realtime_factor=case['seconds'] * case['times'] / wall if wall > 0 else None,
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def run_isolated(case):
+    # Each case gets a fresh interpreter so peak RSS and CPU time belong to that case alone.
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', json.dumps(case)],
+                            stdout=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        return dict(success=False)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def summarize(samples):
+    methods = sorted({s.get('method') or 'unknown' for s in samples})
+    method = '/'.join(methods)
+    successful = [s for s in samples if s.get('success')]
+    if len(successful) < len(samples):
+        return dict(success=False, runs=len(samples), method=method)
+    summary = dict(success=True, runs=len(samples), method=method)
+    for key in successful[0]:
+        values = [s[key] for s in successful if isinstance(s.get(key), (int, float)) and key != 'success']
+        if values:
+            summary[key] = statistics.median(values)
+    return summary
+
+def ran_as_requested(result):
+    # Results written before the method was recorded are taken at their word.
+    return result.get('method', result['mode']) == result['mode']
+
+def case_key(case):
+    return f"{case['container']}/{case['seconds']}s/g{case['gop']}/x{case['times']}/{case['mode']}"
+
+def ffmpeg_version(ffmpeg_path):
+    try:
+        output = subprocess.run([ffmpeg_path, '-version'], stdout=subprocess.PIPE, text=True).stdout
+    except OSError:
+        return None
+    return output.splitlines()[0] if output else None
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_suite(args):
+    ffmpeg_path = args.ffmpeg or FFMPEG_PATH
+    ffprobe_path = args.ffprobe or FFPROBE_PATH
+    results = []
+    matrix = itertools.product(args.containers, args.lengths, args.gops, args.times, args.modes)
+    for container, seconds, gop, times, mode in matrix:
+        fixture = make_fixture(container, seconds, gop, ffmpeg_path, args.fixtures)
+        case = dict(container=container, seconds=seconds, gop=gop, times=times, mode=mode,
+                    fixture=fixture, ffmpeg=ffmpeg_path, ffprobe=ffprobe_path)
+        samples = [run_isolated(case) for _ in range(args.repeat)]
+        summary = summarize(samples)
+        del case['fixture'], case['ffmpeg'], case['ffprobe']
+        results.append(dict(key=case_key(case), **case, **summary))
+        print(format_result(results[-1]), flush=True)
+
+    report = dict(
+        version=RESULTS_VERSION,
+        created=time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        revision=git_revision(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        ffmpeg=ffmpeg_version(ffmpeg_path),
+        results=results,
+    )
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+    return 0 if all(r['success'] for r in results) else 1
+
+def format_result(result):
+    if not result['success']:
+        return f"{result['key']:<32} FAILED"
+    cpu = result.get('cpu_seconds')
+    rss = result.get('peak_rss_mb')
+    mismatch = '' if ran_as_requested(result) else f" (ran as {result['method']})"
+    return (f"{result['key']:<32} {result['wall_seconds']:8.3f}s wall"
+            f" {'-' if cpu is None else f'{cpu:.3f}'}s cpu"
+            f" {'-' if rss is None else f'{rss:.1f}'}MB rss"
+            f" {result['bytes_written'] / (1024 * 1024):9.1f}MB"
+            f" {result['throughput_mb_s']:8.1f}MB/s{mismatch}")
+
+def compare(baseline_path, current_path, threshold):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {r['key']: r for r in json.load(f)['results']}
+    with open(current_path, encoding='utf-8') as f:
+        current = {r['key']: r for r in json.load(f)['results']}
+
+    regressions = 0
+    print(f"{'case':<32} {'metric':<16} {'baseline':>12} {'current':>12} {'change':>8}")
+    for key in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[key], current[key]
+        if not (before['success'] and after['success']):
+            print(f"{key:<32} {'success':<16} {str(before['success']):>12} {str(after['success']):>12}")
+            regressions += before['success'] and not after['success']
+            continue
+        if not (ran_as_requested(before) and ran_as_requested(after)):
+            # A mode that fell back to another method measures that method, not the mode.
+            print(f"{key:<32} {'method':<16} {before.get('method', '-'):>12} {after.get('method', '-'):>12}"
+                  f"  not compared")
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = before.get(metric), after.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = ' !' if worse > threshold else ''
+            regressions += bool(flag)
+            print(f"{key:<32} {metric:<16} {old:>12.3f} {new:>12.3f} {change:>+8.1%}{flag}")
+    for key in sorted(baseline.keys() - current.keys()):
+        print(f"{key:<32} missing from {current_path}")
+    for key in sorted(current.keys() - baseline.keys()):
+        print(f"{key:<32} new in {current_path}")
+    return 1 if regressions else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='benchmarks.run',
+        description='Benchmark the extension engine on synthetic lavfi fixtures.'
+    )
+    parser.add_argument('--containers', nargs='+', choices=sorted(CONTAINERS), default=DEFAULT_CONTAINERS)
+    parser.add_argument('--lengths', nargs='+', type=int, default=DEFAULT_LENGTHS,
+                        help='fixture clip lengths in seconds')
+    parser.add_argument('--gops', nargs='+', type=int, default=DEFAULT_GOPS, help='fixture GOP sizes in frames')
+    parser.add_argument('--times', nargs='+', type=int, default=DEFAULT_TIMES, help='repeat counts')
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=DEFAULT_MODES)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case; the median is recorded')
+    parser.add_argument('--fixtures', default=FIXTURE_DIR, help='directory for generated fixtures')
+    parser.add_argument('--output', help='results JSON path (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two results files instead of running')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative change flagged as a regression when comparing')
+    parser.add_argument('--ffmpeg', help='path to the ffmpeg binary')
+    parser.add_argument('--ffprobe', help='path to the ffprobe binary')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return 0
+    if args.compare:
+        return compare(args.compare[0], args.compare[1], args.threshold)
+    return run_suite(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,4 @@
+from .engine import (VIDEO_EXTENSIONS, ExtendOptions, ExtenderEngine, compute_repeat,
+                     output_path, probe_duration)
+from .tools import FFMPEG_PATH, FFPROBE_PATH, get_ffmpeg_path, get_resource_path
+from .probe_cache import MediaInfo, ProbeCache, run_ffprobe
@@ -0,0 +1,219 @@
+"""asyncio API for running the extender inside an existing event loop.
+
+    output = await extend('clip.mp4', hours=1)
+
+    async for event in extend_batch(paths, hours=1, jobs=8):
+        print(event.to_dict())
+
+ffprobe and ffmpeg run through asyncio subprocesses, so any number of jobs share the loop
+without threads. Cancelling the awaiting task terminates ffmpeg and removes the partial output.
+File work that would block, such as probe cache lookups and writing concat lists, runs in the
+default executor. Outputs are single files stream copied through the concat demuxer; playlist,
+resumable, seamless and loop point outputs, and the native copy paths, are only available
+through ExtenderEngine.
+"""
+import asyncio
+import os
+
+from .engine import (PROGRESS_ARGS, ExtendOptions, TargetOutput, concat_args, loop_entries, remove_files,
+                     write_concat_file)
+from .errors import ExtendError
+from .probe_cache import ProbeCache, ffprobe_command, keyframes_command, parse_ffprobe, parse_keyframes
+from .progress import ProgressParser
+from .tools import creation_flags
+from .uptodate import OutputIndex, partial_path
+
+DEFAULT_JOBS = 4
+
+class ExtendEvent:
+    """One step of a batch: 'started', 'progress', 'finished' or 'failed'."""
+
+    def __init__(self, event, index, input_file, output_file=None, progress=None, error=None):
+        self.event = event
+        self.index = index
+        self.input_file = input_file
+        self.output_file = output_file
+        self.progress = progress
+        self.error = error
+
+    def to_dict(self):
+        data = {'event': self.event, 'index': self.index, 'file': self.input_file}
+        if self.output_file is not None:
+            data['output'] = self.output_file
+        if self.progress is not None:
+            data.update(self.progress.to_dict())
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+async def start_process(args, **kwargs):
+    return await asyncio.create_subprocess_exec(*args, stdin=asyncio.subprocess.DEVNULL,
+                                                creationflags=creation_flags(), **kwargs)
+
+async def stop_process(process):
+    if process.returncode is None:
+        process.terminate()
+        await process.wait()
+
+def last_line(output):
+    lines = output.decode('utf-8', errors='replace').strip().splitlines()
+    return lines[-1] if lines else 'unknown error'
+
+def resolve_options(hours, minutes, times, options):
+    if options is None:
+        return ExtendOptions(hours, minutes, times)
+    if hours or minutes or times:
+        raise ValueError('give the target either as hours, minutes and times or in options, not both')
+    return options
+
+async def run_ffprobe(args):
+    process = await start_process(args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        await stop_process(process)
+        raise
+    if process.returncode != 0:
+        raise ExtendError(f"ffprobe: {last_line(stderr)}")
+    return stdout
+
+async def probe(input_file, ffprobe_path=None, probe_cache=None, keyframes=False):
+    info = None
+    if probe_cache is not None:
+        info = await asyncio.to_thread(probe_cache.lookup, input_file)
+        if info is not None and (info.keyframes is not None or not keyframes):
+            return info
+    if info is None:
+        info = parse_ffprobe(await run_ffprobe(ffprobe_command(input_file, ffprobe_path)))
+    if keyframes:
+        info.keyframes = []
+        if info.video_codec is not None:
+            info.keyframes = parse_keyframes(await run_ffprobe(keyframes_command(input_file, ffprobe_path)))
+    if probe_cache is not None:
+        await asyncio.to_thread(probe_cache.store, input_file, info)
+    return info
+
+async def run_ffmpeg(ffmpeg_path, args, total_seconds, on_progress=None):
+    process = await start_process([ffmpeg_path] + PROGRESS_ARGS + list(args),
+                                  stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    parser = ProgressParser(total_seconds, on_progress or (lambda info: None))
+    # stderr is drained alongside the progress records so a chatty failure cannot fill its pipe.
+    errors = asyncio.ensure_future(process.stderr.read())
+    try:
+        async for line in process.stdout:
+            parser.feed(line)
+        await process.wait()
+        stderr = await errors
+    except asyncio.CancelledError:
+        errors.cancel()
+        await stop_process(process)
+        raise
+    if process.returncode != 0:
+        raise ExtendError(f"ffmpeg: {last_line(stderr)}")
+
+async def extend(input_file, hours=0, minutes=0, times=0, options=None, on_progress=None, output_index=None,
+                 probe_cache=None):
+    """Extends one file and returns the path of its first output.
+
+    `options` takes an ExtendOptions in place of hours, minutes and times, for extra targets,
+    which are cut from the same ffmpeg pass, and everything else beyond the target. Outputs
+    that are up to date with their input and settings are returned without running ffmpeg.
+    Probe results come from `probe_cache`, the shared on-disk cache when it is not given.
+    A shared `output_index` is left for the caller to flush once its batch is done.
+    """
+    options = resolve_options(hours, minutes, times, options)
+    if options.output_mode != 'file' or options.resumable or options.seamless or options.loop_point:
+        raise ValueError('the async API writes single files; use ExtenderEngine for playlist, '
+                         'resumable, seamless and loop point output')
+    targets = [TargetOutput(input_file, target, options) for target in options.target_list()]
+    output_file = targets[0].output_file
+
+    own_index = output_index is None
+    if own_index:
+        output_index = OutputIndex()
+    if options.incremental:
+        current = [await asyncio.to_thread(output_index.lookup, input_file, target.index_key, target.params)
+                   for target in targets]
+        if current[0] is not None:
+            output_file = current[0]
+        targets = [target for target, path in zip(targets, current) if path is None]
+        if not targets:
+            return output_file
+
+    if probe_cache is None:
+        probe_cache = await asyncio.to_thread(ProbeCache)
+    info = await probe(input_file, options.ffprobe_path, probe_cache, options.needs_keyframes())
+    for target in targets:
+        target.plan(info.duration, info, options)
+    ordered = sorted(targets, key=lambda target: target.seconds, reverse=True)
+    partials = [partial_path(target.output_file) for target in ordered]
+    prefixes = [(path, target.seconds) for target, path in zip(ordered[1:], partials[1:])]
+    longest = ordered[0]
+    if options.output_dir:
+        await asyncio.to_thread(os.makedirs, options.output_dir, exist_ok=True)
+
+    concat_file = await asyncio.to_thread(
+        write_concat_file, loop_entries(input_file, longest.repeat, longest.tail, info.start_time))
+    try:
+        await run_ffmpeg(options.ffmpeg_path, concat_args(concat_file, partials[0], prefixes),
+                         longest.seconds, on_progress)
+    except BaseException:
+        # The removal is handed to the executor before the task can be interrupted again,
+        # so it completes even if a second cancellation abandons the wait.
+        await asyncio.to_thread(remove_files, partials)
+        raise
+    finally:
+        await asyncio.to_thread(os.remove, concat_file)
+
+    await asyncio.to_thread(publish, input_file, options, ordered, partials, output_index, own_index)
+    return output_file
+
+def publish(input_file, options, targets, partials, output_index, flush=False):
+    for target, path in zip(targets, partials):
+        os.replace(path, target.output_file)
+        if options.incremental:
+            output_index.record(input_file, target.index_key, target.params, [target.output_file])
+    if flush:
+        output_index.flush()
+
+async def extend_batch(input_files, hours=0, minutes=0, times=0, options=None, jobs=DEFAULT_JOBS):
+    """Extends many files at once and yields an ExtendEvent for each step as it happens.
+
+    A semaphore keeps at most `jobs` ffmpeg processes running. A failed file yields a
+    'failed' event and the batch carries on. Closing the iterator, or cancelling the task
+    consuming it, cancels every job that is still queued or running.
+    """
+    options = resolve_options(hours, minutes, times, options)
+    semaphore = asyncio.Semaphore(max(1, jobs))
+    output_index = OutputIndex()
+    probe_cache = await asyncio.to_thread(ProbeCache)
+    events = asyncio.Queue()
+
+    async def run_job(index, input_file):
+        async with semaphore:
+            events.put_nowait(ExtendEvent('started', index, input_file))
+            try:
+                output_file = await extend(
+                    input_file, options=options, output_index=output_index, probe_cache=probe_cache,
+                    on_progress=lambda info: events.put_nowait(ExtendEvent('progress', index, input_file,
+                                                                           progress=info)))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                events.put_nowait(ExtendEvent('failed', index, input_file, error=str(e)))
+            else:
+                events.put_nowait(ExtendEvent('finished', index, input_file, output_file))
+
+    tasks = [asyncio.ensure_future(run_job(index, input_file)) for index, input_file in enumerate(input_files)]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            event = await events.get()
+            if event.event in ('finished', 'failed'):
+                remaining -= 1
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(output_index.flush)
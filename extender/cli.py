@@ -0,0 +1,217 @@
+import argparse
+import glob
+import json
+import os
+import re
+import signal
+import sys
+import threading
+
+from .dedup import ContentStore
+from .engine import ExtendOptions, ExtenderEngine
+from .metrics import MetricsRecorder
+from .playlist import PLAYLIST_MODES
+from .probe_cache import ProbeCache
+from .resume import SEGMENT_SECONDS
+from .scheduler import MEGABYTE, IoScheduler
+
+TARGET_RE = re.compile(r'(?:(\d+)h)?(?:(\d+)m)?|(\d+)(?:x|times)')
+
+def expand_inputs(patterns):
+    input_files = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            key = os.path.normcase(os.path.abspath(path))
+            if key not in seen and os.path.isfile(path):
+                seen.add(key)
+                input_files.append(path)
+    return input_files
+
+def parse_targets(text):
+    """Parses a comma-separated list such as '1h,90m,3h30m,10x' into (hours, minutes, times) tuples."""
+    targets = []
+    for spec in text.split(','):
+        match = TARGET_RE.fullmatch(spec.strip().lower())
+        if match is None or not any(match.groups()):
+            raise argparse.ArgumentTypeError(f'invalid target: {spec!r} (use e.g. 1h, 90m, 3h30m or 10x)')
+        hours, minutes, times = (int(value or 0) for value in match.groups())
+        hours, minutes = hours + minutes // 60, minutes % 60
+        if hours <= 0 and minutes <= 0 and times <= 0:
+            raise argparse.ArgumentTypeError(f'target must be positive: {spec!r}')
+        targets.append((hours, minutes, times))
+    return targets
+
+class ProgressPrinter:
+    def __init__(self, input_files, stream=None):
+        self.input_files = input_files
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    def emit(self, event, **data):
+        line = json.dumps(dict(event=event, **data), ensure_ascii=False)
+        with self.lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def status(self, message):
+        self.emit('status', message=message)
+
+    def job_progress(self, index, percent):
+        self.emit('job_progress', index=index, file=self.input_files[index], percent=percent)
+
+    def job_stats(self, index, info):
+        self.emit('job_stats', index=index, file=self.input_files[index], **info.to_dict())
+
+    def batch_progress(self, percent):
+        self.emit('batch_progress', percent=percent)
+
+    def job_finished(self, index, input_file, output_file, success):
+        self.emit('job_finished', index=index, file=input_file, output=output_file, success=success)
+
+    def job_metrics(self, index, job):
+        self.emit('job_metrics', index=index, **job.to_dict())
+
+def add_extend_arguments(parser):
+    parser.add_argument('--hours', type=int, default=0)
+    parser.add_argument('--minutes', type=int, default=0)
+    parser.add_argument('--times', type=int, default=0)
+    parser.add_argument('--targets', type=parse_targets, default=[], metavar='LIST',
+                        help='several targets at once, e.g. 1h,3h,10h or 10x,20x; they share a single pass '
+                             'over the input where the output method allows it, playlist targets share '
+                             'one segmenting pass and resumable targets reuse identical segments')
+    parser.add_argument('--jobs', type=int, default=min(4, os.cpu_count() or 1),
+                        help='number of videos processed in parallel')
+    parser.add_argument('--output-dir', help='write outputs to this folder instead of next to each input')
+    parser.add_argument('--per-device', type=int, default=0, metavar='N',
+                        help='run at most N jobs at once that read from or write to the same disk (0: no limit)')
+    parser.add_argument('--write-limit', type=float, default=0, metavar='MB_S',
+                        help='cap the output write rate per destination disk, in MB/s (0: no limit)')
+    parser.add_argument('--doubling', action='store_true',
+                        help='build 2x, 4x, 8x... intermediates for large repeat counts')
+    parser.add_argument('--keep-intermediates', action='store_true',
+                        help='keep doubling intermediates next to the input for reuse')
+    parser.add_argument('--output-mode', choices=('file',) + PLAYLIST_MODES, default='file',
+                        help='write an extended file, or segment once and write looping HLS/DASH playlists')
+    parser.add_argument('--no-native', action='store_true',
+                        help='always mux with ffmpeg instead of the built-in MP4/MOV and TS/PS/DV paths')
+    parser.add_argument('--resumable', action='store_true',
+                        help='write checkpointed segments next to the output and join them at the end, '
+                             'so a restarted job continues from the last complete segment')
+    parser.add_argument('--segment-minutes', type=float, default=SEGMENT_SECONDS / 60,
+                        help='target length of each resumable segment')
+    parser.add_argument('--force', action='store_true',
+                        help='rebuild outputs even when they are up to date with their input and settings')
+    parser.add_argument('--seamless', action='store_true',
+                        help='re-encode only the last and first GOP once as a seam, so loop points play '
+                             'without a glitch while the rest is still stream copied')
+    parser.add_argument('--crossfade', type=float, default=0.0, metavar='SECONDS',
+                        help='crossfade video and audio over each seam (implies --seamless)')
+    parser.add_argument('--loop-point', action='store_true',
+                        help='search the first and last seconds for the keyframe pair whose frames match best '
+                             'and loop only that range (needs numpy)')
+    parser.add_argument('--whole-loops', action='store_true',
+                        help='round duration targets up to whole loops instead of cutting at a keyframe')
+    parser.add_argument('--cache', help='path to the ffprobe metadata cache database')
+    parser.add_argument('--no-cache', action='store_true', help='probe every file without the metadata cache')
+    parser.add_argument('--content-db', help='path to the content fingerprint database used for deduplication')
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help='extend byte-identical inputs separately instead of linking to the first result')
+    parser.add_argument('--job-log', help='append one JSON line of per-stage timings per finished job to this file')
+    parser.add_argument('--metrics-textfile',
+                        help='keep Prometheus textfile-format metrics in this file (e.g. for node_exporter)')
+    parser.add_argument('--ffmpeg', help='path to the ffmpeg binary')
+    parser.add_argument('--ffprobe', help='path to the ffprobe binary')
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='videoextender',
+        description='Extend video duration by stream-copy looping, without Qt. '
+                    'Run "videoextender watch --help" for the watch-folder daemon.'
+    )
+    parser.add_argument('inputs', nargs='+', help='video files or glob patterns')
+    add_extend_arguments(parser)
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the planned repeat counts, output sizes and free space, then exit')
+    return parser
+
+def check_target(parser, args):
+    if args.times <= 0 and args.hours <= 0 and args.minutes <= 0 and not args.targets:
+        parser.error('one of --hours, --minutes or --times must be positive, or --targets given')
+
+def options_from_args(args, hours=None, minutes=None, times=None, targets=None):
+    return ExtendOptions(args.hours if hours is None else hours,
+                         args.minutes if minutes is None else minutes,
+                         args.times if times is None else times,
+                         args.doubling, args.keep_intermediates, args.ffmpeg, args.ffprobe, not args.whole_loops,
+                         args.output_mode, not args.no_native, args.resumable, args.segment_minutes * 60,
+                         not args.force, args.seamless or args.crossfade > 0, args.crossfade,
+                         args.targets if targets is None else targets, args.output_dir, args.loop_point)
+
+def scheduler_from_args(args):
+    return IoScheduler(args.per_device, int(args.write_limit * MEGABYTE))
+
+def loop_cache_from_args(args):
+    if not args.loop_point or args.no_cache:
+        return None
+    from .looppoint import LoopPointCache
+    return LoopPointCache()
+
+def content_store_from_args(args):
+    return None if args.no_dedupe else ContentStore(args.content_db)
+
+def metrics_from_args(args):
+    if args.job_log or args.metrics_textfile:
+        return MetricsRecorder(args.job_log, args.metrics_textfile)
+    return None
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ['watch']:
+        from .daemon import main as watch_main
+        return watch_main(argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    check_target(parser, args)
+
+    input_files = expand_inputs(args.inputs)
+    if not input_files:
+        parser.error('no input files matched')
+
+    options = options_from_args(args)
+    probe_cache = None if args.no_cache else ProbeCache(args.cache, ffprobe_path=args.ffprobe)
+    engine = ExtenderEngine(options, args.jobs, probe_cache, metrics_from_args(args), content_store_from_args(args),
+                            scheduler_from_args(args), loop_cache_from_args(args))
+    printer = ProgressPrinter(input_files)
+    engine.on_status = printer.status
+    engine.on_job_progress = printer.job_progress
+    engine.on_job_stats = printer.job_stats
+    engine.on_batch_progress = printer.batch_progress
+    engine.on_job_finished = printer.job_finished
+    engine.on_job_metrics = printer.job_metrics
+
+    def handle_signal(signum, frame):
+        engine.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, handle_signal)
+
+    if args.dry_run:
+        plan = engine.plan(input_files)
+        for job in plan.jobs:
+            printer.emit('plan', **job.to_dict())
+        for volume in plan.volumes.values():
+            printer.emit('volume', **volume.to_dict())
+        return 1 if plan.rejected else 0
+
+    printer.emit('started', files=len(input_files), jobs=engine.jobs)
+    completed = engine.run(input_files)
+    printer.emit('finished', success=completed and engine.failed_files == 0,
+                 cancelled=not completed, failed=engine.failed_files)
+
+    if not completed:
+        return 130
+    return 1 if engine.failed_files else 0
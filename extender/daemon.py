@@ -0,0 +1,370 @@
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import signal
+import sqlite3
+import struct
+import sys
+import threading
+import time
+
+from .cli import (ProgressPrinter, add_extend_arguments, check_target, content_store_from_args, loop_cache_from_args,
+                  metrics_from_args, options_from_args, scheduler_from_args)
+from .engine import ExtenderEngine, is_output_path
+from .probe_cache import ProbeCache, default_cache_dir
+from .scan import is_video_file
+
+SETTLE_SECONDS = 5.0
+POLL_INTERVAL = 2.0
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30.0
+RETRY_MAX_SECONDS = 3600.0
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+def default_queue_path():
+    return os.path.join(default_cache_dir(), 'queue.sqlite')
+
+def is_candidate(path):
+    # Watched folders also receive the daemon's own outputs and editors' hidden temporary files.
+    if os.path.basename(path).startswith('.') or not is_video_file(path):
+        return False
+    return not is_output_path(path)
+
+def scan_directory(directory):
+    try:
+        with os.scandir(directory) as entries:
+            return [entry.path for entry in entries if entry.is_file() and is_candidate(entry.path)]
+    except OSError:
+        return []
+
+class PollingWatcher:
+    def __init__(self, directories, interval=POLL_INTERVAL):
+        self.directories = directories
+        self.interval = interval
+        self.seen = {}
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        changed = []
+        current = {}
+        for directory in self.directories:
+            for path in scan_directory(directory):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                current[path] = (stat.st_size, stat.st_mtime_ns)
+                if self.seen.get(path) != current[path]:
+                    changed.append(path)
+        self.seen = current
+        return changed
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.directories = directories
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(errno, f'cannot watch {directory}')
+            self.watches[wd] = directory
+
+    def poll(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+            name = data[pos + EVENT_HEADER.size:pos + EVENT_HEADER.size + length].rstrip(b'\0')
+            pos += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # The kernel dropped events, so fall back to a full listing.
+                for directory in self.directories:
+                    changed.extend(scan_directory(directory))
+                continue
+            if mask & IN_ISDIR or not name or wd not in self.watches:
+                continue
+            path = os.path.join(self.watches[wd], os.fsdecode(name))
+            if is_candidate(path):
+                changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+def create_watcher(directories, polling=False):
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directories)
+
+class Debouncer:
+    """Holds back files until their size and mtime have stopped changing for settle_seconds."""
+
+    def __init__(self, settle_seconds=SETTLE_SECONDS, clock=time.monotonic):
+        self.settle_seconds = settle_seconds
+        self.clock = clock
+        self.pending = {}
+
+    def touch(self, path):
+        self.pending[path] = (None, self.clock())
+
+    def ready(self):
+        now = self.clock()
+        stable = []
+        for path, (signature, since) in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != signature:
+                self.pending[path] = (current, now)
+            elif now - since >= self.settle_seconds and stat.st_size > 0:
+                del self.pending[path]
+                stable.append((path, stat.st_size, stat.st_mtime_ns))
+        return stable
+
+def retry_delay(attempts, base=RETRY_BASE_SECONDS, limit=RETRY_MAX_SECONDS):
+    return min(base * 2 ** max(attempts - 1, 0), limit)
+
+class JobQueue:
+    """Durable job queue; a file version (path, size, mtime) is only ever enqueued once per target."""
+
+    def __init__(self, path=None, max_attempts=MAX_ATTEMPTS):
+        if path is None:
+            path = default_queue_path()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id INTEGER PRIMARY KEY, path TEXT, size INTEGER, mtime_ns INTEGER, target TEXT, '
+                "state TEXT DEFAULT 'pending', attempts INTEGER DEFAULT 0, next_attempt REAL DEFAULT 0, "
+                'output TEXT, error TEXT, created REAL, updated REAL, '
+                'UNIQUE (path, size, mtime_ns, target))'
+            )
+            # Jobs that were running when the previous daemon died start over.
+            self.connection.execute("UPDATE jobs SET state = 'pending' WHERE state = 'running'")
+
+    def enqueue(self, path, size, mtime_ns, target):
+        now = time.time()
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                'INSERT OR IGNORE INTO jobs (path, size, mtime_ns, target, created, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (os.path.abspath(path), size, mtime_ns, json.dumps(target, sort_keys=True), now, now)
+            )
+        return cursor.rowcount > 0
+
+    def claim(self, limit=1):
+        now = time.time()
+        with self.lock, self.connection:
+            rows = self.connection.execute(
+                "SELECT id, path, target, attempts FROM jobs WHERE state = 'pending' AND next_attempt <= ? "
+                'ORDER BY next_attempt, id LIMIT ?', (now, limit)
+            ).fetchall()
+            self.connection.executemany(
+                "UPDATE jobs SET state = 'running', updated = ? WHERE id = ?", [(now, row[0]) for row in rows]
+            )
+        return [{'id': row[0], 'path': row[1], 'target': json.loads(row[2]), 'attempts': row[3]} for row in rows]
+
+    def complete(self, job_id, output):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET state = 'done', output = ?, error = NULL, updated = ? WHERE id = ?",
+                (output, time.time(), job_id)
+            )
+
+    def fail(self, job_id, error):
+        now = time.time()
+        with self.lock, self.connection:
+            attempts = self.connection.execute('SELECT attempts FROM jobs WHERE id = ?', (job_id,)).fetchone()[0] + 1
+            state = 'failed' if attempts >= self.max_attempts else 'pending'
+            self.connection.execute(
+                'UPDATE jobs SET state = ?, attempts = ?, next_attempt = ?, error = ?, updated = ? WHERE id = ?',
+                (state, attempts, now + retry_delay(attempts), error, now, job_id)
+            )
+        return state
+
+    def release(self, job_id):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET state = 'pending', updated = ? WHERE id = ?", (time.time(), job_id)
+            )
+
+    def next_due(self):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT MIN(next_attempt) FROM jobs WHERE state = 'pending'"
+            ).fetchone()
+        return row[0]
+
+    def counts(self):
+        with self.lock:
+            return dict(self.connection.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+class WatchDaemon:
+    def __init__(self, directories, queue, args, printer, probe_cache=None, metrics=None,
+                 settle_seconds=SETTLE_SECONDS, polling=False, content_store=None):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.queue = queue
+        self.args = args
+        self.printer = printer
+        self.probe_cache = probe_cache
+        self.metrics = metrics
+        self.content_store = content_store
+        self.scheduler = scheduler_from_args(args)
+        self.loop_cache = loop_cache_from_args(args)
+        self.target = {'hours': args.hours, 'minutes': args.minutes, 'times': args.times}
+        if args.targets:
+            self.target['targets'] = [list(target) for target in args.targets]
+        self.debouncer = Debouncer(settle_seconds)
+        self.watcher = create_watcher(self.directories, polling)
+        self.is_running = True
+        self.engine = None
+
+    def stop(self):
+        self.is_running = False
+        engine = self.engine
+        if engine is not None:
+            engine.stop()
+
+    def run(self):
+        self.printer.emit('watching', directories=self.directories, watcher=type(self.watcher).__name__,
+                          queue=self.queue.path, **self.queue.counts())
+        for directory in self.directories:
+            for path in scan_directory(directory):
+                self.debouncer.touch(path)
+        try:
+            while self.is_running:
+                timeout = 1.0 if self.debouncer.pending else POLL_INTERVAL
+                next_due = self.queue.next_due()
+                if next_due is not None:
+                    timeout = max(0.0, min(timeout, next_due - time.time()))
+                for path in self.watcher.poll(timeout):
+                    self.debouncer.touch(path)
+                for path, size, mtime_ns in self.debouncer.ready():
+                    if self.queue.enqueue(path, size, mtime_ns, self.target):
+                        self.printer.emit('queued', file=path, **self.target)
+                self.process_due()
+        finally:
+            self.watcher.close()
+        return 0
+
+    def process_due(self):
+        while self.is_running:
+            jobs = self.queue.claim(max(1, self.args.jobs))
+            if not jobs:
+                return
+            for target in {json.dumps(job['target'], sort_keys=True) for job in jobs}:
+                self.process_batch([job for job in jobs if json.dumps(job['target'], sort_keys=True) == target])
+
+    def process_batch(self, jobs):
+        input_files = [job['path'] for job in jobs]
+        engine = ExtenderEngine(options_from_args(self.args, **jobs[0]['target']), self.args.jobs,
+                                self.probe_cache, self.metrics, self.content_store, self.scheduler, self.loop_cache)
+        printer = ProgressPrinter(input_files, self.printer.stream)
+
+        def on_job_finished(index, input_file, output_file, success):
+            job = jobs[index]
+            if success:
+                self.queue.complete(job['id'], output_file)
+            elif not self.is_running:
+                self.queue.release(job['id'])
+            else:
+                state = self.queue.fail(job['id'], engine.job_errors.get(index, 'failed'))
+                printer.emit('retry_scheduled' if state == 'pending' else 'gave_up', file=input_file,
+                             attempts=job['attempts'] + 1)
+            printer.job_finished(index, input_file, output_file, success)
+
+        engine.on_status = printer.status
+        engine.on_job_stats = printer.job_stats
+        engine.on_job_finished = on_job_finished
+        engine.on_job_metrics = printer.job_metrics
+        self.engine = engine
+        try:
+            engine.run(input_files)
+        finally:
+            self.engine = None
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='videoextender watch',
+        description='Watch drop folders and extend every video that lands in them.'
+    )
+    parser.add_argument('directories', nargs='+', help='directories to watch')
+    add_extend_arguments(parser)
+    parser.add_argument('--queue', help='path to the SQLite job queue (default: in the cache folder)')
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                        help='seconds a file must stay unchanged before it is queued')
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                        help='give up on a file after this many failed attempts')
+    parser.add_argument('--poll', action='store_true', help='poll the directories instead of using inotify')
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    check_target(parser, args)
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            parser.error(f'not a directory: {directory}')
+
+    queue = JobQueue(args.queue, args.max_attempts)
+    probe_cache = None if args.no_cache else ProbeCache(args.cache, ffprobe_path=args.ffprobe)
+    printer = ProgressPrinter([])
+    daemon = WatchDaemon(args.directories, queue, args, printer, probe_cache, metrics_from_args(args),
+                         args.settle, args.poll, content_store_from_args(args))
+
+    def handle_signal(signum, frame):
+        daemon.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, handle_signal)
+
+    try:
+        return daemon.run()
+    finally:
+        counts = queue.counts()
+        queue.close()
+        printer.emit('stopped', **counts)
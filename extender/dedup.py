@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .probe_cache import cache_key, default_cache_dir
+
+SAMPLE_BLOCK_SIZE = 64 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def sampled_fingerprint(path, block_size=SAMPLE_BLOCK_SIZE):
+    """Hashes the size plus the head, middle and tail blocks; cheap enough to run on every input."""
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(0, size // 2 - block_size // 2), max(0, size - block_size)}):
+            f.seek(offset)
+            digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+def full_hash(path):
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ContentStore:
+    """Fingerprints inputs and remembers which outputs were produced from which content.
+
+    Sampled fingerprints only nominate candidates; a duplicate is confirmed by comparing the full
+    hash of the new input with the one its source had when the output was made, so a source that
+    was edited since cannot vouch for an output it no longer matches. Full hashes are cached by
+    size and mtime.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'content.sqlite')
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sample TEXT, full TEXT)'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'sample TEXT, params TEXT, input TEXT, output TEXT PRIMARY KEY, '
+                'output_size INTEGER, output_mtime_ns INTEGER, created REAL, full TEXT)'
+            )
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(results)')]
+            if 'full' not in columns:
+                # Results recorded before the source hash was kept have full = NULL and never match.
+                self.connection.execute('ALTER TABLE results ADD COLUMN full TEXT')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS results_sample ON results (sample, params)')
+
+    def _row(self, path, stat):
+        row = self.connection.execute(
+            'SELECT size, mtime_ns, sample, full FROM files WHERE path = ?', (cache_key(path),)
+        ).fetchone()
+        if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime_ns:
+            return None
+        return row
+
+    def fingerprint(self, path):
+        stat = os.stat(path)
+        with self.lock:
+            row = self._row(path, stat)
+        if row is not None:
+            return row[2]
+        sample = sampled_fingerprint(path)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO files (path, size, mtime_ns, sample, full) VALUES (?, ?, ?, ?, NULL)',
+                (cache_key(path), stat.st_size, stat.st_mtime_ns, sample)
+            )
+        return sample
+
+    def full_hash(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            row = self._row(path, stat)
+        if row is not None and row[3]:
+            return row[3]
+        sample = row[2] if row is not None else sampled_fingerprint(path)
+        digest = full_hash(path)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO files (path, size, mtime_ns, sample, full) VALUES (?, ?, ?, ?, ?)',
+                (cache_key(path), stat.st_size, stat.st_mtime_ns, sample, digest)
+            )
+        return digest
+
+    def find_result(self, input_file, sample, params, output_file):
+        """Returns an intact earlier output made from identical content with identical settings."""
+        params_text = json.dumps(params, sort_keys=True)
+        ext = os.path.splitext(output_file)[1].lower()
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT output, output_size, output_mtime_ns, full FROM results '
+                'WHERE sample = ? AND params = ? ORDER BY created', (sample, params_text)
+            ).fetchall()
+        mine = None
+        for output, size, mtime_ns, full in rows:
+            if full is None or cache_key(output) == cache_key(output_file) or \
+                    os.path.splitext(output)[1].lower() != ext:
+                continue
+            try:
+                stat = os.stat(output)
+            except OSError:
+                continue
+            if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+                continue
+            if mine is None:
+                mine = self.full_hash(input_file)
+            if mine is not None and mine == full:
+                return output
+        return None
+
+    def record_result(self, input_file, sample, params, output_file):
+        stat = os.stat(output_file)
+        full = self.full_hash(input_file)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO results '
+                '(sample, params, input, output, output_size, output_mtime_ns, created, full) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (sample, json.dumps(params, sort_keys=True), os.path.abspath(input_file),
+                 os.path.abspath(output_file), stat.st_size, stat.st_mtime_ns, time.time(), full)
+            )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
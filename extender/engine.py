@@ -0,0 +1,964 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .fileio import clone_file
+from .keyframes import plan_loops
+from .metrics import JobMetrics
+from .errors import UnsupportedLayout
+from .mp4 import MP4_EXTENSIONS, extend_mp4
+from .packetized import PACKETIZED_EXTENSIONS, extend_packetized
+from .planner import NO_MUXER_EXTENSIONS, BatchPlan, JobPlan
+from .playlist import (PLAYLIST_MODES, build_dash_manifest, build_hls_playlist, dash_segment_args,
+                       hls_segment_args, playlist_dir, write_text)
+from .probe_cache import run_ffprobe
+from .progress import CopyProgress, ProgressParser
+from .resume import SEGMENT_SECONDS, ResumeManifest, parts_dir, segment_loops
+from .scheduler import IoScheduler, resume_process, suspend_process
+from .seams import (PIECE_PATTERN, PieceTiming, plan_seam, seam_args, seam_tag_args, split_args,
+                    timed_entries)
+from .uptodate import OutputIndex, partial_path
+from .tools import FFMPEG_PATH, FFPROBE_PATH, creation_flags
+
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm', '.m4v',
+                    '.mpg', '.mpeg', '.m2v', '.m2ts', '.mts', '.ts', '.vob', '.3gp',
+                    '.3g2', '.f4v', '.asf', '.rmvb', '.rm', '.ogv', '.mxf', '.dv',
+                    '.divx', '.xvid', '.mpv', '.m2p', '.mp2', '.mpeg2', '.ogm'}
+DOUBLING_MIN_REPEAT = 4
+# Errors only on stderr; progress records as key=value lines on stdout.
+PROGRESS_ARGS = ['-nostdin', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1']
+OUTPUT_NAME_RE = re.compile(r'_(\d+times|\d+h(\d+m)?)$')
+
+def _noop(*args):
+    pass
+
+class ExtendOptions:
+    def __init__(self, hours=0, minutes=0, times=0, doubling=False, keep_intermediates=False,
+                 ffmpeg_path=None, ffprobe_path=None, exact_duration=True, output_mode='file',
+                 native=True, resumable=False, segment_seconds=SEGMENT_SECONDS, incremental=True,
+                 seamless=False, crossfade=0.0, targets=None, output_dir=None, loop_point=False):
+        self.hours = hours
+        self.minutes = minutes
+        self.times = times
+        self.doubling = doubling
+        self.keep_intermediates = keep_intermediates
+        self.ffmpeg_path = ffmpeg_path or FFMPEG_PATH
+        self.ffprobe_path = ffprobe_path or FFPROBE_PATH
+        self.exact_duration = exact_duration
+        self.output_mode = output_mode
+        self.native = native
+        self.resumable = resumable
+        self.segment_seconds = segment_seconds
+        self.incremental = incremental
+        self.seamless = seamless
+        self.crossfade = crossfade
+        self.targets = targets
+        self.output_dir = output_dir
+        self.loop_point = loop_point
+        if not self.target_list():
+            raise ValueError('one of hours, minutes or times must be positive, or targets given')
+
+    def target_list(self):
+        # The hours/minutes/times target comes first, followed by any extra (hours, minutes, times) targets.
+        targets = []
+        if self.hours > 0 or self.minutes > 0 or self.times > 0:
+            targets.append((self.hours, self.minutes, self.times))
+        for target in self.targets or ():
+            if tuple(target) not in targets:
+                targets.append(tuple(target))
+        return targets
+
+    def needs_keyframes(self):
+        # Keyframe times place exact-duration tails, seam cuts and loop points; nothing else reads them.
+        return self.exact_duration or self.seamless or self.loop_point
+
+    def output_params(self, target=None):
+        hours, minutes, times = target or (self.hours, self.minutes, self.times)
+        params = {
+            'hours': hours,
+            'minutes': minutes,
+            'times': times,
+            'exact_duration': self.exact_duration,
+            'output_mode': self.output_mode,
+        }
+        # Modes that change how the output is written are only recorded when they differ from the
+        # defaults, so outputs indexed before each mode existed stay up to date.
+        if self.seamless:
+            params['seamless'] = True
+            params['crossfade'] = self.crossfade
+        if self.loop_point:
+            params['loop_point'] = True
+        if self.resumable:
+            params['resumable'] = True
+            params['segment_seconds'] = self.segment_seconds
+        if self.doubling:
+            params['doubling'] = True
+        if not self.native:
+            params['native'] = False
+        return params
+
+def probe_duration(input_file, ffprobe_path=None):
+    duration_cmd = [
+        ffprobe_path or FFPROBE_PATH, '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        input_file
+    ]
+
+    return float(subprocess.check_output(
+        duration_cmd,
+        creationflags=creation_flags()
+    ).decode().strip())
+
+def compute_repeat(duration, hours, minutes, times):
+    if times > 0:
+        return times
+    desired_seconds = (hours * 3600) + (minutes * 60)
+    return int((desired_seconds + duration - 1) / duration)
+
+def output_path(input_file, hours, minutes, times, output_dir=None):
+    if output_dir:
+        input_file = os.path.join(output_dir, os.path.basename(input_file))
+    name, ext = os.path.splitext(input_file)
+    if times > 0:
+        return f"{name}_{times}times{ext}"
+    time_str = f"{hours}h{minutes}m" if minutes > 0 else f"{hours}h"
+    return f"{name}_{time_str}{ext}"
+
+def replace_tree(source, target):
+    # Directories cannot be swapped atomically, so the old tree is moved aside first and the
+    # window where neither exists is a single rename long.
+    previous = None
+    if os.path.exists(target):
+        previous = f"{target}.old"
+        if os.path.exists(previous):
+            shutil.rmtree(previous)
+        os.replace(target, previous)
+    os.replace(source, target)
+    if previous is not None:
+        shutil.rmtree(previous, ignore_errors=True)
+
+def is_output_path(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return name.endswith('.partial') or OUTPUT_NAME_RE.search(name) is not None
+
+def write_concat_file(entries):
+    fd, concat_file = tempfile.mkstemp(prefix='videoextender_', suffix='.txt')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            # An entry is a path or a (path, inpoint, outpoint[, duration]) tuple.
+            entry = (entry,) if isinstance(entry, str) else tuple(entry)
+            path, inpoint, outpoint, duration = entry + (None,) * (4 - len(entry))
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+            if inpoint is not None:
+                f.write(f"inpoint {inpoint:.6f}\n")
+            if outpoint is not None:
+                f.write(f"outpoint {outpoint:.6f}\n")
+            if duration is not None:
+                f.write(f"duration {duration:.6f}\n")
+    return concat_file
+
+def loop_entries(input_file, repeat, tail=None, start_time=0.0, loop=None):
+    if loop is None:
+        entries = [input_file] * repeat
+        if tail is not None:
+            entries.append((input_file, None, start_time + tail))
+        return entries
+    # Every pass is trimmed to the loop point, and a partial last pass counts from its start.
+    start = start_time + loop.start
+    inpoint = start if loop.start > 0 else None
+    entries = [(input_file, inpoint, start_time + loop.end)] * repeat
+    if tail is not None:
+        entries.append((input_file, inpoint, start + tail))
+    return entries
+
+def concat_args(concat_file, output_file, prefixes=(), codec_args=()):
+    args = [
+        '-f', 'concat',
+        '-safe', '0',
+        '-i', concat_file,
+        '-c', 'copy',
+        *codec_args,
+        output_file
+    ]
+    for prefix_file, seconds in prefixes:
+        args += ['-c', 'copy', *codec_args, '-t', f"{seconds:.6f}", prefix_file]
+    return args
+
+def remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+class TargetOutput:
+    """One requested target of a job: where it goes, how it is indexed and, once planned, its loops."""
+
+    def __init__(self, input_file, target, options):
+        self.target = target
+        self.output_file = output_path(input_file, *target, options.output_dir)
+        self.params = options.output_params(target)
+        self.index_key = self.output_file
+        if options.output_mode in PLAYLIST_MODES:
+            self.index_key = playlist_dir(self.output_file, options.output_mode.split('+')[0])
+        self.repeat = None
+        self.tail = None
+        self.seconds = None
+        self.recorded = None
+
+    def plan(self, loop_seconds, info, options, loop_start=0.0):
+        hours, minutes, times = self.target
+        self.repeat, self.tail = plan_loops(loop_seconds, info.keyframes, hours, minutes, times,
+                                            options.exact_duration, info.start_time + loop_start)
+        self.seconds = loop_seconds * self.repeat + (self.tail or 0)
+
+class ExtenderEngine:
+    def __init__(self, options, jobs=1, probe_cache=None, metrics=None, content_store=None, scheduler=None,
+                 loop_cache=None):
+        self.options = options
+        self.jobs = max(1, jobs)
+        self.probe_cache = probe_cache
+        self.metrics = metrics
+        self.content_store = content_store
+        self.scheduler = scheduler or IoScheduler()
+        self.loop_cache = loop_cache
+        self.inflight = {}
+        self.job_metrics = {}
+        self.write_limits = {}
+        self.probed = {}
+        self.output_index = OutputIndex()
+        self.is_running = True
+        self.lock = threading.Lock()
+        self.processes = set()
+        self.job_percents = {}
+        # The latest error reported for each job index, for callers that attribute failures.
+        self.job_errors = {}
+        self.active_jobs = set()
+        self.total_files = 0
+        self.failed_files = 0
+
+        self.on_status = _noop
+        self.on_progress = _noop
+        self.on_job_progress = _noop
+        self.on_job_stats = _noop
+        self.on_batch_progress = _noop
+        self.on_job_finished = _noop
+        self.on_job_metrics = _noop
+
+    def report_error(self, index, message, replace=True):
+        with self.lock:
+            if replace or index not in self.job_errors:
+                self.job_errors[index] = message
+        self.on_status(message)
+
+    def stage(self, index, name):
+        job = self.job_metrics.get(index)
+        return job.stage(name) if job is not None else nullcontext()
+
+    def report_job_progress(self, index, percent, info=None):
+        if info is not None:
+            self.on_job_stats(index, info)
+        with self.lock:
+            if self.job_percents.get(index) == percent:
+                return
+            self.job_percents[index] = percent
+            active = [self.job_percents.get(i, 0) for i in self.active_jobs]
+            current = int(sum(active) / len(active)) if active else percent
+            batch = int(sum(self.job_percents.values()) / max(1, self.total_files))
+        self.on_job_progress(index, percent)
+        self.on_progress(current)
+        self.on_batch_progress(batch)
+
+    def probe(self, input_file):
+        if self.probe_cache is not None:
+            return self.probe_cache.probe(input_file, self.options.ffprobe_path, self.options.needs_keyframes())
+        return run_ffprobe(input_file, self.options.ffprobe_path, self.options.needs_keyframes())
+
+    def run_concat(self, index, entries, output_file, done_seconds, total_seconds, prefixes=(), codec_args=()):
+        # Shorter targets are extra outputs of the same pass, each cut with -t, so the input is
+        # demuxed once for all of them. Stream copy cuts by decode time, so with reordered frames
+        # a cut can land a frame or two off the loop boundary.
+        with self.stage(index, 'concat_list'):
+            concat_file = write_concat_file(entries)
+        try:
+            args = concat_args(concat_file, output_file, prefixes, codec_args)
+            with self.stage(index, 'mux'):
+                return self.run_ffmpeg(index, args, done_seconds, total_seconds)
+        finally:
+            os.remove(concat_file)
+
+    def run_ffmpeg(self, index, args, done_seconds, total_seconds):
+        ffmpeg_cmd = [self.options.ffmpeg_path] + PROGRESS_ARGS
+        bucket = self.write_limits.get(index)
+        if bucket is not None:
+            # Finer progress records keep the bursts between throttling pauses short.
+            ffmpeg_cmd += ['-stats_period', '0.1']
+        ffmpeg_cmd += list(args)
+
+        parser = ProgressParser(
+            total_seconds,
+            lambda info: self.report_job_progress(index, info.percent, info),
+            done_seconds
+        )
+        with tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(
+                ffmpeg_cmd,
+                stdout=subprocess.PIPE,
+                stderr=errors,
+                creationflags=creation_flags()
+            )
+            with self.lock:
+                self.processes.add(process)
+
+            try:
+                written = 0
+                for line in process.stdout:
+                    if not self.is_running:
+                        process.terminate()
+                        break
+                    parser.feed(line)
+                    if bucket is not None and parser.total_size > written:
+                        self.pause_process(process, bucket.reserve(parser.total_size - written))
+                        written = parser.total_size
+
+                process.wait()
+            finally:
+                process.stdout.close()
+                with self.lock:
+                    self.processes.discard(process)
+
+            if process.returncode != 0 and self.is_running:
+                errors.seek(0)
+                message = errors.read().decode('utf-8', errors='replace').strip().splitlines()
+                if message:
+                    self.report_error(index, f"⚠️ ffmpeg: {message[-1]}")
+
+        return process.returncode
+
+    def pause_process(self, process, seconds):
+        # ffmpeg cannot be told to write more slowly, so it is suspended until the write budget
+        # has caught up with what it reported writing.
+        if seconds <= 0:
+            return
+        suspend_process(process)
+        try:
+            deadline = time.monotonic() + seconds
+            remaining = seconds
+            while self.is_running and remaining > 0:
+                time.sleep(min(0.1, remaining))
+                remaining = deadline - time.monotonic()
+        finally:
+            resume_process(process)
+
+    def build_doubling(self, index, input_file, repeat, duration, output_file, tail=None, start_time=0.0,
+                       prefixes=()):
+        keep_intermediates = self.options.keep_intermediates
+        name, ext = os.path.splitext(os.path.basename(input_file))
+        if keep_intermediates:
+            work_dir = os.path.join(os.path.dirname(os.path.abspath(input_file)), '.videoextender')
+            os.makedirs(work_dir, exist_ok=True)
+        else:
+            work_dir = tempfile.mkdtemp(prefix='videoextender_', dir=os.path.dirname(os.path.abspath(output_file)))
+
+        levels = [1]
+        while levels[-1] * 2 <= repeat:
+            levels.append(levels[-1] * 2)
+        parts = {1: input_file}
+        total_seconds = duration * (sum(levels[1:]) + repeat) + (tail or 0)
+        done_seconds = 0
+        created = []
+
+        try:
+            for level in levels[1:]:
+                if not self.is_running:
+                    return 1
+                intermediate = os.path.join(work_dir, f"{name}.x{level}{ext}")
+                reusable = (
+                    keep_intermediates and os.path.exists(intermediate) and
+                    os.path.getmtime(intermediate) >= os.path.getmtime(input_file)
+                )
+                if not reusable:
+                    partial = os.path.join(work_dir, f"{name}.x{level}.partial{ext}")
+                    half = parts[level // 2]
+                    returncode = self.run_concat(index, [half, half], partial, done_seconds, total_seconds)
+                    if returncode != 0:
+                        if os.path.exists(partial):
+                            os.remove(partial)
+                        return returncode
+                    os.replace(partial, intermediate)
+                    created.append(intermediate)
+                parts[level] = intermediate
+                done_seconds += duration * level
+
+            entries = [parts[level] for level in reversed(levels) if repeat & level]
+            if tail is not None:
+                entries.append((input_file, None, start_time + tail))
+            return self.run_concat(index, entries, output_file, done_seconds, total_seconds, prefixes)
+        finally:
+            if not keep_intermediates:
+                for intermediate in created:
+                    if os.path.exists(intermediate):
+                        os.remove(intermediate)
+                os.rmdir(work_dir)
+
+    def build_playlists(self, index, input_file, info, targets):
+        # Segments only depend on the input, so each kind is segmented once into the first
+        # target's folder and cloned into the others, which differ only in their playlist.
+        kinds = self.options.output_mode.split('+')
+        staged = []
+        for target in targets:
+            target.recorded = []
+        for i, kind in enumerate(kinds):
+            out_dirs = []
+            for target in targets:
+                final_dir = playlist_dir(target.output_file, kind)
+                out_dir = f"{final_dir}.partial"
+                if os.path.exists(out_dir):
+                    shutil.rmtree(out_dir)
+                os.makedirs(out_dir)
+                staged.append((out_dir, final_dir))
+                out_dirs.append(out_dir)
+            segment_dir = out_dirs[0]
+            if kind == 'hls':
+                args = hls_segment_args(input_file, segment_dir, info.video_codec)
+                source, name = 'source.m3u8', 'index.m3u8'
+            else:
+                args = dash_segment_args(input_file, segment_dir)
+                source, name = 'source.mpd', 'manifest.mpd'
+
+            with self.stage(index, 'segment'):
+                returncode = self.run_ffmpeg(index, args, info.duration * i, info.duration * len(kinds))
+            if returncode != 0:
+                for out_dir, final_dir in staged:
+                    shutil.rmtree(out_dir, ignore_errors=True)
+                return returncode
+
+            source_path = os.path.join(segment_dir, source)
+            with self.stage(index, 'playlist'):
+                with open(source_path, encoding='utf-8') as f:
+                    source_text = f.read()
+                os.remove(source_path)
+                segments = os.listdir(segment_dir)
+                for target, out_dir in zip(targets, out_dirs):
+                    if out_dir != segment_dir:
+                        for segment in segments:
+                            clone_file(os.path.join(segment_dir, segment), os.path.join(out_dir, segment))
+                    if kind == 'hls':
+                        text = build_hls_playlist(source_text, target.repeat, target.tail)
+                    else:
+                        text = build_dash_manifest(source_text, target.repeat, target.tail)
+                    write_text(os.path.join(out_dir, name), text)
+                    target.recorded.append(os.path.join(playlist_dir(target.output_file, kind), name))
+
+        for out_dir, final_dir in staged:
+            replace_tree(out_dir, final_dir)
+        return 0
+
+    def build_native(self, index, input_file, repeat, tail, info, output_file, done_seconds=0, total_seconds=None):
+        ext = os.path.splitext(input_file)[1].lower()
+        if ext not in MP4_EXTENSIONS and ext not in PACKETIZED_EXTENSIONS:
+            return None
+
+        duration = info.duration
+        piece_seconds = duration * repeat + (tail or 0)
+        progress = CopyProgress(total_seconds or piece_seconds,
+                                lambda info: self.report_job_progress(index, info.percent, info))
+
+        def on_loop(done, loops, bytes_written):
+            progress.update(done_seconds + min(done * duration, piece_seconds), bytes_written, done == loops)
+
+        should_stop = lambda: not self.is_running
+        bucket = self.write_limits.get(index)
+        throttle = bucket.consume if bucket is not None else None
+        try:
+            with self.stage(index, 'copy'):
+                if ext in MP4_EXTENSIONS:
+                    completed = extend_mp4(input_file, output_file, repeat, tail, on_loop, should_stop, throttle)
+                else:
+                    completed = extend_packetized(input_file, output_file, repeat, tail, info.start_time, duration,
+                                                  on_loop, should_stop, throttle)
+        except UnsupportedLayout as e:
+            self.on_status(f"ℹ️ Native path unavailable for {os.path.basename(input_file)} ({e}), using ffmpeg")
+            return None
+        return 0 if completed else 1
+
+    def build_resumable(self, index, input_file, info, repeat, tail, output_file, shared=None):
+        # `shared` maps (loops, tail) to a finished segment of another target of the same job,
+        # so a segment that is the same for several targets is cloned instead of rebuilt.
+        shared = {} if shared is None else shared
+        duration = info.duration
+        ext = os.path.splitext(output_file)[1]
+        directory = parts_dir(output_file)
+        os.makedirs(directory, exist_ok=True)
+        manifest = ResumeManifest.open(directory, input_file, repeat, tail,
+                                       segment_loops(duration, self.options.segment_seconds), ext)
+        for segment in manifest.segments:
+            if segment['size'] is not None:
+                shared.setdefault((segment['loops'], segment['tail']), manifest.segment_path(segment))
+        pending = manifest.pending()
+        if len(pending) < len(manifest.segments):
+            done = len(manifest.segments) - len(pending)
+            self.on_status(f"ℹ️ Resuming {os.path.basename(input_file)} after {done}/{len(manifest.segments)} segments")
+
+        # Segments and the final join each account for half of the job's progress.
+        content_seconds = duration * repeat + (tail or 0)
+        total_seconds = content_seconds * 2
+        done_seconds = duration * manifest.completed_loops()
+        use_native = self.options.native
+        for segment in pending:
+            if not self.is_running:
+                return 1
+            target = manifest.segment_path(segment)
+            partial = f"{os.path.splitext(target)[0]}.partial{ext}"
+            if os.path.exists(partial):
+                os.remove(partial)
+
+            returncode = None
+            key = (segment['loops'], segment['tail'])
+            if key in shared and os.path.exists(shared[key]):
+                with self.stage(index, 'copy'):
+                    clone_file(shared[key], partial)
+                returncode = 0
+            if returncode is None and use_native:
+                returncode = self.build_native(index, input_file, segment['loops'], segment['tail'], info, partial,
+                                               done_seconds, total_seconds)
+                use_native = returncode is not None
+            if returncode is None:
+                entries = [input_file] * segment['loops']
+                if segment['tail'] is not None:
+                    entries.append((input_file, None, info.start_time + segment['tail']))
+                returncode = self.run_concat(index, entries, partial, done_seconds, total_seconds)
+            if returncode != 0:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                return returncode
+
+            os.replace(partial, target)
+            manifest.mark_complete(segment)
+            shared.setdefault(key, target)
+            done_seconds += duration * segment['loops'] + (segment['tail'] or 0)
+
+        partial = partial_path(output_file)
+        if os.path.exists(partial):
+            os.remove(partial)
+        segments = [manifest.segment_path(segment) for segment in manifest.segments]
+        returncode = self.run_concat(index, segments, partial, content_seconds, total_seconds)
+        if returncode != 0:
+            if os.path.exists(partial):
+                os.remove(partial)
+            return returncode
+        os.replace(partial, output_file)
+        return 0
+
+    def build_seamless(self, index, input_file, info, seam, repeat, tail, output_file, prefixes=()):
+        # The input is cut into MPEG-TS pieces at the seam points in one stream-copy pass and
+        # the last GOP plus the first is re-encoded once; the output then concatenates
+        # head, (body, seam) * n and the end without touching the bulk of the video again.
+        # The pieces are probed so the seam's audio and each concat offset line up with them.
+        work_dir = tempfile.mkdtemp(prefix='videoextender_', dir=os.path.dirname(os.path.abspath(output_file)))
+        output_seconds = seam.loop_seconds * repeat + (tail or 0)
+        total_seconds = info.duration + seam.seam_seconds + output_seconds
+        try:
+            with self.stage(index, 'segment'):
+                returncode = self.run_ffmpeg(index, split_args(input_file, seam, info, work_dir, tail),
+                                             0, total_seconds)
+            if returncode != 0:
+                return returncode
+            pieces = [os.path.join(work_dir, PIECE_PATTERN % i) for i in range(len(seam.cut_points(tail)) + 1)]
+            if not all(os.path.exists(piece) for piece in pieces):
+                self.on_status(f"ℹ️ Seam cut failed for {os.path.basename(input_file)}, using stream copy")
+                return None
+
+            seam_file = os.path.join(work_dir, 'seam.ts')
+            timings = self.time_pieces(input_file, pieces)
+            if timings is None:
+                return None
+            tail_pieces = seam.pieces_from(pieces, seam.body_end, tail)
+            head_lead = timings[seam.pieces_from(pieces, seam.head_end, tail)[0]].audio_lead
+            args = seam_args(input_file, seam, info, seam_file, timings[tail_pieces[0]].audio_lead, head_lead,
+                             sum(timings[piece].length for piece in tail_pieces))
+            with self.stage(index, 'seam'):
+                returncode = self.run_ffmpeg(index, args, info.duration, total_seconds)
+            if returncode != 0:
+                return returncode
+            seam_timing = self.time_pieces(input_file, [seam_file])
+            if seam_timing is None:
+                return None
+            timings.update(seam_timing)
+
+            entries = timed_entries(seam.entries(pieces, seam_file, repeat, tail), timings)
+            return self.run_concat(index, entries, output_file, info.duration + seam.seam_seconds, total_seconds,
+                                   prefixes, seam_tag_args(info, output_file))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def time_pieces(self, input_file, pieces):
+        try:
+            return {piece: PieceTiming(run_ffprobe(piece, self.options.ffprobe_path)) for piece in pieces}
+        except (subprocess.CalledProcessError, ValueError, UnsupportedLayout):
+            self.on_status(f"ℹ️ Seam pieces of {os.path.basename(input_file)} could not be timed, using stream copy")
+            return None
+
+    def claim_content(self, key):
+        # Identical inputs in one batch run one at a time, so later copies can link to the first result.
+        while True:
+            with self.lock:
+                event = self.inflight.get(key)
+                if event is None:
+                    self.inflight[key] = threading.Event()
+                    return key
+            event.wait()
+
+    def release_content(self, key):
+        with self.lock:
+            event = self.inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def link_duplicate(self, input_file, existing, output_file):
+        partial = partial_path(output_file)
+        if os.path.exists(partial):
+            os.remove(partial)
+        method = clone_file(existing, partial)
+        os.replace(partial, output_file)
+        self.on_status(f"🔗 Duplicate of {os.path.basename(existing)}: {os.path.basename(input_file)} ({method})")
+
+    def find_loop(self, input_file, info):
+        if self.loop_cache is not None:
+            return self.loop_cache.find(input_file, info, self.options.ffmpeg_path)
+        from .looppoint import find_loop_point
+        return find_loop_point(input_file, info, self.options.ffmpeg_path)
+
+    def build_file(self, index, input_file, info, outputs, seam=None, loop=None):
+        # Every method writes to .partial names that only replace the outputs once complete,
+        # so an interrupted job never leaves a truncated file under a final name. The ffmpeg
+        # methods build the longest target and cut the shorter ones from the same pass.
+        options = self.options
+        job = self.job_metrics.get(index)
+        duration = info.duration
+        ordered = sorted(outputs, key=lambda output: output.seconds, reverse=True)
+        partials = [partial_path(output.output_file) for output in ordered]
+        remove_files(partials)
+        longest, partial = ordered[0], partials[0]
+        repeat, tail = longest.repeat, longest.tail
+        prefixes = [(path, output.seconds) for output, path in zip(ordered[1:], partials[1:])]
+
+        returncode = None
+        if seam is not None:
+            job.method = 'seamless'
+            returncode = self.build_seamless(index, input_file, info, seam, repeat, tail, partial, prefixes)
+        # A loop point is cut with concat inpoints/outpoints, so it always goes through concat.
+        if returncode is None and options.native and loop is None:
+            # The native paths copy from the page-cached input inside the kernel, so each
+            # target is simply written in turn.
+            job.method = 'native'
+            total_seconds = sum(output.seconds for output in ordered)
+            done_seconds = 0
+            for output, path in zip(ordered, partials):
+                returncode = self.build_native(index, input_file, output.repeat, output.tail, info, path,
+                                               done_seconds, total_seconds)
+                if returncode != 0:
+                    break
+                done_seconds += output.seconds
+            if returncode is None:
+                remove_files(partials)
+        if returncode is None and options.doubling and repeat >= DOUBLING_MIN_REPEAT and loop is None:
+            job.method = 'doubling'
+            returncode = self.build_doubling(index, input_file, repeat, duration, partial, tail, info.start_time,
+                                             prefixes)
+        if returncode is None:
+            job.method = 'concat'
+            entries = loop_entries(input_file, repeat, tail, info.start_time, loop)
+            returncode = self.run_concat(index, entries, partial, 0, longest.seconds, prefixes)
+
+        if returncode == 0:
+            for output, path in zip(ordered, partials):
+                os.replace(path, output.output_file)
+        else:
+            remove_files(partials)
+        return returncode
+
+    def process_file(self, index, input_file):
+        if not self.is_running:
+            return False
+
+        options = self.options
+        output_file = None
+        outputs = None
+        success = False
+        content_key = None
+        job = JobMetrics(index, input_file)
+        with self.lock:
+            self.active_jobs.add(index)
+            self.job_metrics[index] = job
+        try:
+            targets = [TargetOutput(input_file, target, options) for target in options.target_list()]
+            output_file = targets[0].output_file
+            if options.incremental:
+                current = [self.output_index.lookup(input_file, target.index_key, target.params)
+                           for target in targets]
+                if all(path is not None for path in current):
+                    job.method = 'skipped'
+                    output_file = current[0]
+                    success = True
+                    self.on_status(f"⏭️ Up to date: {os.path.basename(input_file)}")
+                    return success
+                for path in current:
+                    if path is not None:
+                        self.on_status(f"⏭️ Up to date: {os.path.basename(path)}")
+                targets = [target for target, path in zip(targets, current) if path is None]
+
+            sample = None
+            dedupe = self.content_store is not None and options.output_mode == 'file'
+            if dedupe:
+                with job.stage('dedupe'):
+                    sample = self.content_store.fingerprint(input_file)
+                    all_params = [target.params for target in targets]
+                    content_key = self.claim_content((sample, json.dumps(all_params, sort_keys=True)))
+                    existing = [self.content_store.find_result(input_file, sample, target.params, target.output_file)
+                                for target in targets]
+                for target, path in zip(targets, existing):
+                    if path is not None:
+                        with job.stage('copy'):
+                            self.link_duplicate(input_file, path, target.output_file)
+                        if options.incremental:
+                            self.output_index.record(input_file, target.index_key, target.params,
+                                                     [target.output_file])
+                if all(path is not None for path in existing):
+                    job.method = 'deduplicated'
+                    success = True
+                    return success
+                targets = [target for target, path in zip(targets, existing) if path is None]
+
+            self.on_status(f"Processing: {os.path.basename(input_file)}")
+
+            with job.stage('probe'):
+                info = self.probed.pop(index, None) or self.probe(input_file)
+            duration = info.duration
+            with job.stage('plan'):
+                seam = None
+                if options.seamless and options.output_mode == 'file' and not options.resumable:
+                    try:
+                        seam = plan_seam(info, options.crossfade)
+                    except UnsupportedLayout as e:
+                        self.on_status(f"ℹ️ Seamless loop unavailable for {os.path.basename(input_file)} ({e}), "
+                                       "using stream copy")
+            loop = None
+            # The trimmed loop is muxed by ffmpeg, which cannot write every container the native paths can.
+            if (options.loop_point and seam is None and options.output_mode == 'file' and not options.resumable
+                    and os.path.splitext(input_file)[1].lower() not in NO_MUXER_EXTENSIONS):
+                with job.stage('analyze'):
+                    try:
+                        loop = self.find_loop(input_file, info)
+                    except UnsupportedLayout as e:
+                        self.on_status(f"ℹ️ Loop point search unavailable for {os.path.basename(input_file)} ({e}), "
+                                       "looping the whole file")
+                if loop is not None:
+                    self.on_status(f"ℹ️ Loop point for {os.path.basename(input_file)}: "
+                                   f"{loop.start:.2f}s to {loop.end:.2f}s")
+            with job.stage('plan'):
+                if seam is not None:
+                    loop_seconds = seam.loop_seconds
+                elif loop is not None:
+                    loop_seconds = loop.seconds
+                else:
+                    loop_seconds = duration
+                for target in targets:
+                    target.plan(loop_seconds, info, options, loop.start if loop is not None else 0.0)
+                if all(target.repeat < 2 and target.tail is None for target in targets):
+                    seam = None
+            job.repeat = max(target.repeat for target in targets)
+            job.duration = duration
+
+            if options.output_mode in PLAYLIST_MODES:
+                job.method = options.output_mode
+                kinds = options.output_mode.split('+')
+                outputs = [playlist_dir(target.output_file, kind) for target in targets for kind in kinds]
+                returncode = self.build_playlists(index, input_file, info, targets)
+                output_file = targets[0].recorded[0] if targets[0].recorded else None
+            elif options.resumable:
+                job.method = 'resumable'
+                shared = {}
+                for target in targets:
+                    returncode = self.build_resumable(index, input_file, info, target.repeat, target.tail,
+                                                      target.output_file, shared)
+                    target.recorded = [target.output_file]
+                    if returncode != 0:
+                        break
+                else:
+                    # The parts folders are only removed once no other target can reuse their segments.
+                    for target in targets:
+                        shutil.rmtree(parts_dir(target.output_file), ignore_errors=True)
+            else:
+                outputs = [target.output_file for target in targets]
+                returncode = self.build_file(index, input_file, info, targets, seam, loop)
+                for target in targets:
+                    target.recorded = [target.output_file]
+
+            if returncode == 0:
+                success = True
+                for target in targets:
+                    if options.incremental:
+                        self.output_index.record(input_file, target.index_key, target.params, target.recorded)
+                    if dedupe:
+                        self.content_store.record_result(input_file, sample, target.params, target.output_file)
+                self.on_status(f"✅ Completed: {os.path.basename(input_file)}")
+            elif self.is_running:
+                # ffmpeg's own last error line says more than this, so it is kept if there was one.
+                self.report_error(index, f"❌ Failed: {os.path.basename(input_file)}", replace=False)
+
+        except Exception as e:
+            self.report_error(index, f"❌ Error: {os.path.basename(input_file)}: {str(e)}")
+        finally:
+            if content_key is not None:
+                self.release_content(content_key)
+            with self.lock:
+                self.active_jobs.discard(index)
+                self.job_metrics.pop(index, None)
+                if not success:
+                    self.failed_files += 1
+            job.finish(output_file, success, outputs)
+            self.report_job_progress(index, 100)
+            self.on_job_finished(index, input_file, output_file, success)
+            self.record_metrics(job)
+        return success
+
+    def record_metrics(self, job):
+        self.on_job_metrics(job.index, job)
+        if self.metrics is not None:
+            try:
+                self.metrics.record(job)
+            except OSError as e:
+                self.on_status(f"⚠️ Metrics: {e}")
+
+    def plan_job(self, index, input_file):
+        options = self.options
+        output_dir = options.output_dir or os.path.dirname(os.path.abspath(input_file))
+        job = JobPlan(index, input_file, output_dir)
+        if not self.is_running:
+            return job
+        try:
+            targets = [TargetOutput(input_file, target, options) for target in options.target_list()]
+            if options.incremental:
+                targets = [target for target in targets
+                           if self.output_index.lookup(input_file, target.index_key, target.params) is None]
+            job.outputs = [target.output_file for target in targets]
+            if not targets:
+                job.up_to_date = True
+                return job
+            info = self.probe(input_file)
+            size = info.size or os.path.getsize(input_file)
+        except Exception as e:
+            job.problem = f"unreadable input: {e}"
+            return job
+
+        ext = os.path.splitext(input_file)[1].lower()
+        native = options.native and (ext in MP4_EXTENSIONS or ext in PACKETIZED_EXTENSIONS)
+        job.source_seconds = info.duration
+        if not info.duration or info.duration <= 0:
+            job.problem = 'unknown duration'
+        elif info.video_codec is None and info.audio_codec is None:
+            job.problem = 'no audio or video stream'
+        elif options.output_mode == 'file' and ext in NO_MUXER_EXTENSIONS and not native:
+            job.problem = f"ffmpeg cannot write {ext} files"
+        if job.problem is not None:
+            return job
+        self.probed[index] = info
+
+        # Bytes scale with duration: a loop costs the input size, and a keyframe tail its share.
+        bytes_per_second = size / info.duration
+        for target in targets:
+            target.plan(info.duration, info, options)
+            if options.output_mode in PLAYLIST_MODES:
+                job.output_bytes += size * len(options.output_mode.split('+'))
+            else:
+                job.output_bytes += bytes_per_second * target.seconds
+        longest = max(targets, key=lambda target: target.seconds)
+        job.repeat = longest.repeat
+        job.output_seconds = longest.seconds
+        if options.output_mode in PLAYLIST_MODES:
+            pass
+        elif options.resumable:
+            job.scratch_bytes = bytes_per_second * longest.seconds
+        elif options.doubling and not native and longest.repeat >= DOUBLING_MIN_REPEAT:
+            level = 1
+            while level * 2 <= longest.repeat:
+                level *= 2
+            job.scratch_bytes = size * (level * 2 - 2)
+        elif options.seamless:
+            job.scratch_bytes = size
+        return job
+
+    def plan(self, input_files):
+        """Probes every input and estimates what it will write before anything is muxed."""
+        workers = max(self.jobs, 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            jobs = list(executor.map(self.plan_job, range(len(input_files)), input_files))
+        return BatchPlan(jobs, self.scheduler.device)
+
+    def reject(self, plan):
+        job = JobMetrics(plan.index, plan.input_file)
+        job.method = 'rejected'
+        with self.lock:
+            self.failed_files += 1
+        self.report_error(plan.index, f"❌ Skipped: {os.path.basename(plan.input_file)}: {plan.problem}")
+        job.finish(None, False)
+        self.report_job_progress(plan.index, 100)
+        self.on_job_finished(plan.index, plan.input_file, None, False)
+        self.record_metrics(job)
+
+    def run(self, input_files):
+        input_files = list(input_files)
+        self.total_files = len(input_files)
+        output_dir = self.options.output_dir
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        plan = self.plan(input_files)
+        if not self.is_running:
+            return False
+        for line in plan.describe():
+            self.on_status(f"ℹ️ {line}")
+        for job in plan.rejected:
+            self.reject(job)
+        pending = [self.scheduler.queue(job.index, job.input_file, output_dir) for job in plan.admitted]
+        workers = min(self.jobs, len(input_files)) or 1
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self.run_worker, pending) for _ in range(workers)]
+                for future in as_completed(futures):
+                    future.result()
+        finally:
+            self.output_index.flush()
+        return self.is_running
+
+    def run_worker(self, pending):
+        while True:
+            job = self.scheduler.take(pending, lambda: not self.is_running)
+            if job is None:
+                return
+            with self.lock:
+                self.write_limits[job.index] = self.scheduler.bucket(job.output_device)
+            try:
+                self.process_file(job.index, job.input_file)
+            finally:
+                with self.lock:
+                    self.write_limits.pop(job.index, None)
+                self.scheduler.release(job)
+
+    def stop(self):
+        self.is_running = False
+        self.scheduler.wake()
+        with self.lock:
+            processes = list(self.processes)
+        for process in processes:
+            try:
+                process.terminate()
+            except OSError:
+                pass
@@ -0,0 +1,5 @@
+class UnsupportedLayout(Exception):
+    pass
+
+class ExtendError(Exception):
+    pass
@@ -0,0 +1,93 @@
+import errno
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+def _copy_with_reads(src, dst, src_offset, length, dst_offset, throttle=None):
+    copied = 0
+    while copied < length:
+        src.seek(src_offset + copied)
+        chunk = src.read(min(length - copied, 1024 * 1024))
+        if not chunk:
+            raise EOFError('source ended before the requested range')
+        dst.seek(dst_offset + copied)
+        dst.write(chunk)
+        copied += len(chunk)
+        if throttle is not None:
+            throttle(len(chunk))
+
+def copy_range(src, dst, src_offset, length, dst_offset, throttle=None):
+    # `throttle` is called with the size of every chunk once it is written, and may sleep.
+    dst.flush()
+    src_fd = src.fileno()
+    dst_fd = dst.fileno()
+    copied = 0
+
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    while copy_file_range is not None and copied < length:
+        try:
+            n = copy_file_range(src_fd, dst_fd, min(length - copied, COPY_CHUNK_SIZE),
+                                src_offset + copied, dst_offset + copied)
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRNOS or copied:
+                raise
+            break
+        if n == 0:
+            raise EOFError('source ended before the requested range')
+        copied += n
+        if throttle is not None:
+            throttle(n)
+    if copied == length:
+        return length
+
+    sendfile = getattr(os, 'sendfile', None)
+    if sendfile is not None and hasattr(os, 'pwrite'):
+        try:
+            os.lseek(dst_fd, dst_offset + copied, os.SEEK_SET)
+            while copied < length:
+                n = sendfile(dst_fd, src_fd, src_offset + copied, min(length - copied, COPY_CHUNK_SIZE))
+                if n == 0:
+                    raise EOFError('source ended before the requested range')
+                copied += n
+                if throttle is not None:
+                    throttle(n)
+            return length
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRNOS:
+                raise
+
+    _copy_with_reads(src, dst, src_offset + copied, length - copied, dst_offset + copied, throttle)
+    return length
+
+FICLONE = 0x40049409
+
+def _reflink(src_path, dst_path):
+    if fcntl is None:
+        return False
+    with open(src_path, 'rb') as src, open(dst_path, 'xb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(dst_path)
+    return False
+
+def clone_file(src_path, dst_path):
+    if _reflink(src_path, dst_path):
+        return 'reflink'
+    try:
+        os.link(src_path, dst_path)
+        return 'hardlink'
+    except OSError:
+        pass
+    length = os.path.getsize(src_path)
+    with open(src_path, 'rb') as src, open(dst_path, 'xb') as dst:
+        copy_range(src, dst, 0, length, 0)
+    return 'copy'
@@ -0,0 +1,36 @@
+import bisect
+
+class KeyframeIndex:
+    def __init__(self, times):
+        self.times = sorted(times)
+
+    def __len__(self):
+        return len(self.times)
+
+    def at_or_after(self, seconds):
+        i = bisect.bisect_left(self.times, seconds)
+        return self.times[i] if i < len(self.times) else None
+
+    def at_or_before(self, seconds):
+        i = bisect.bisect_right(self.times, seconds)
+        return self.times[i - 1] if i > 0 else None
+
+def plan_loops(duration, keyframes, hours, minutes, times, exact=True, start_time=0.0):
+    if times > 0:
+        return times, None
+
+    desired_seconds = (hours * 3600) + (minutes * 60)
+    if not exact or not keyframes:
+        return int((desired_seconds + duration - 1) / duration), None
+
+    repeat = int(desired_seconds // duration)
+    remainder = desired_seconds - repeat * duration
+    if remainder <= 1e-3:
+        return max(repeat, 1), None
+
+    cut = KeyframeIndex(keyframes).at_or_after(start_time + remainder)
+    if cut is not None:
+        cut -= start_time
+    if cut is None or cut <= 0 or cut >= duration - 1e-3:
+        return repeat + 1, None
+    return repeat, cut
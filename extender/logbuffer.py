@@ -0,0 +1,64 @@
+import os
+import time
+from collections import deque
+
+from .probe_cache import default_cache_dir
+
+LOG_CAPACITY = 5000
+INFO, WARNING, ERROR = 0, 1, 2
+SEVERITY_FILTERS = [('All messages', INFO), ('Warnings', WARNING), ('Errors', ERROR)]
+
+def severity(message):
+    text = message.lstrip()
+    if text.startswith(('❌', 'Error')):
+        return ERROR
+    if text.startswith('⚠️'):
+        return WARNING
+    return INFO
+
+def default_spill_path():
+    return os.path.join(default_cache_dir(), 'logs', time.strftime('%Y%m%d-%H%M%S') + '.log')
+
+class LogBuffer:
+    """Fixed-capacity log history plus the lines not yet shown, both O(1) per message.
+
+    When a spill file is set, every message is also appended to it so the full history
+    survives even after the ring buffer has dropped it.
+    """
+
+    def __init__(self, capacity=LOG_CAPACITY):
+        self.lines = deque(maxlen=capacity)
+        self.pending = deque(maxlen=capacity)
+        self.spill_file = None
+
+    def add(self, message):
+        entry = (severity(message), message)
+        self.lines.append(entry)
+        self.pending.append(entry)
+        if self.spill_file is not None:
+            self.spill_file.write(message + '\n')
+
+    def take_pending(self):
+        batch = list(self.pending)
+        self.pending.clear()
+        if self.spill_file is not None:
+            self.spill_file.flush()
+        return batch
+
+    def filtered(self, min_severity):
+        return [message for level, message in self.lines if level >= min_severity]
+
+    def clear(self):
+        self.lines.clear()
+        self.pending.clear()
+
+    def start_spill(self, path):
+        self.stop_spill()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.spill_file = open(path, 'a', encoding='utf-8')
+        return path
+
+    def stop_spill(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
@@ -0,0 +1,158 @@
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+
+from .errors import UnsupportedLayout
+from .keyframes import KeyframeIndex
+from .probe_cache import cache_key, default_cache_dir
+from .seams import frame_rate
+from .tools import FFMPEG_PATH, creation_flags
+
+ANALYSIS_WIDTH = 64
+ANALYSIS_HEIGHT = 36
+WINDOW_SECONDS = 10.0
+# The trimmed loop keeps at least this share of the input.
+MIN_LOOP_FRACTION = 0.5
+# A trimmed loop is only used when its seam differs at most this much, relative to the whole-file loop.
+MAX_SCORE_RATIO = 0.5
+ANALYSIS_VERSION = 1
+
+class LoopPoint:
+    """A keyframe-aligned range, in seconds from the start of the input, that loops better than the whole file.
+
+    `score` is the mean squared difference between the first frame of the range and the frame that
+    follows it, `baseline` the same for the whole file looping from its last frame to its first.
+    """
+
+    def __init__(self, start, end, score, baseline):
+        self.start = start
+        self.end = end
+        self.score = score
+        self.baseline = baseline
+
+    @property
+    def seconds(self):
+        return self.end - self.start
+
+    def to_dict(self):
+        return {'start': self.start, 'end': self.end, 'score': self.score, 'baseline': self.baseline}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['start'], data['end'], data['score'], data['baseline'])
+
+def decode_frames(input_file, start, seconds, rate, ffmpeg_path=None):
+    """Decodes a window as downscaled grayscale frames at a constant rate, one row per frame."""
+    import numpy
+
+    args = [ffmpeg_path or FFMPEG_PATH, '-nostdin', '-loglevel', 'error']
+    if start > 0:
+        args += ['-ss', f"{start:.6f}"]
+    args += [
+        '-t', f"{seconds:.6f}", '-i', input_file,
+        '-map', '0:v:0',
+        '-vf', f"fps={rate:.6f},scale={ANALYSIS_WIDTH}:{ANALYSIS_HEIGHT}:flags=area,format=gray",
+        '-f', 'rawvideo', 'pipe:1',
+    ]
+    try:
+        output = subprocess.check_output(args, stderr=subprocess.DEVNULL, creationflags=creation_flags())
+    except subprocess.CalledProcessError:
+        raise UnsupportedLayout('could not decode frames for analysis')
+    frame_size = ANALYSIS_WIDTH * ANALYSIS_HEIGHT
+    frames = numpy.frombuffer(output, dtype=numpy.uint8)
+    return frames[:len(frames) // frame_size * frame_size].reshape(-1, frame_size).astype(numpy.float64)
+
+def distance_matrix(head, tail):
+    import numpy
+
+    # |h - t|^2 = |h|^2 + |t|^2 - 2 h.t, so every head/tail pair is scored by one matrix product.
+    head_norms = numpy.einsum('ij,ij->i', head, head)
+    tail_norms = numpy.einsum('ij,ij->i', tail, tail)
+    distances = head_norms[:, None] + tail_norms[None, :] - 2 * (head @ tail.T)
+    return numpy.maximum(distances, 0) / head.shape[1]
+
+def find_loop_point(input_file, info, ffmpeg_path=None, window=WINDOW_SECONDS):
+    """Returns the best LoopPoint, or None when looping the whole file is as good."""
+    # numpy is only imported once a search runs, so that starting the CLI, daemon or app and
+    # reading cached loop points never pay for it.
+    try:
+        import numpy
+    except ImportError:
+        raise UnsupportedLayout('numpy is not installed')
+    if info.video_codec is None:
+        raise UnsupportedLayout('audio-only input')
+    rate = frame_rate(info)
+    if not rate:
+        raise UnsupportedLayout('unknown frame rate')
+    duration = info.duration
+    keyframes = KeyframeIndex([t - info.start_time for t in info.keyframes])
+    window = min(window, duration * (1 - MIN_LOOP_FRACTION) / 2)
+    if len(keyframes) < 2 or window * rate < 2:
+        raise UnsupportedLayout('too short to search for a loop point')
+
+    tail_start = duration - window
+    head = decode_frames(input_file, 0, window, rate, ffmpeg_path)
+    tail = decode_frames(input_file, tail_start, window, rate, ffmpeg_path)
+    if not len(head) or not len(tail):
+        raise UnsupportedLayout('no frames decoded for analysis')
+    distances = distance_matrix(head, tail)
+
+    # A loop starts on a keyframe in the head window and ends just before a keyframe in the tail
+    # window, so the frame at that keyframe is what the first frame of the loop stands in for.
+    starts = [(t, round(t * rate)) for t in keyframes.times if t < window and round(t * rate) < len(head)]
+    ends = [(t, round((t - tail_start) * rate)) for t in keyframes.times
+            if t >= tail_start and round((t - tail_start) * rate) < len(tail)]
+    if not starts or not ends:
+        return None
+    scores = distances[numpy.ix_([row for _, row in starts], [column for _, column in ends])]
+    i, j = numpy.unravel_index(numpy.argmin(scores), scores.shape)
+    score = float(scores[i, j])
+    # The whole file loops from its last frame back to its first keyframe.
+    baseline = float(distances[starts[0][1], len(tail) - 1])
+    if score > baseline * MAX_SCORE_RATIO:
+        return None
+    return LoopPoint(starts[i][0], ends[j][0], score, baseline)
+
+class LoopPointCache:
+    """Remembers each input's loop point, including that it has none, by size and mtime."""
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'loops.sqlite')
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS loops ('
+                'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, params TEXT, result TEXT)'
+            )
+
+    def find(self, input_file, info, ffmpeg_path=None, window=WINDOW_SECONDS):
+        params = json.dumps({'version': ANALYSIS_VERSION, 'window': window,
+                             'size': [ANALYSIS_WIDTH, ANALYSIS_HEIGHT]}, sort_keys=True)
+        stat = os.stat(input_file)
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT result FROM loops WHERE path = ? AND size = ? AND mtime_ns = ? AND params = ?',
+                (cache_key(input_file), stat.st_size, stat.st_mtime_ns, params)
+            ).fetchone()
+        if row is not None:
+            data = json.loads(row[0])
+            return LoopPoint.from_dict(data) if data else None
+        loop = find_loop_point(input_file, info, ffmpeg_path, window)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO loops (path, size, mtime_ns, params, result) VALUES (?, ?, ?, ?, ?)',
+                (cache_key(input_file), stat.st_size, stat.st_mtime_ns, params,
+                 json.dumps(loop.to_dict() if loop is not None else None))
+            )
+        return loop
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .probe_cache import default_cache_dir
+
+STAGES = ('dedupe', 'probe', 'analyze', 'plan', 'concat_list', 'mux', 'copy', 'segment', 'seam', 'playlist')
+DURATION_BUCKETS = (1, 5, 15, 60, 300, 900, 3600)
+THROUGHPUT_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 10, 50, 100, 250, 500, 1000))
+# Jobs that finish by reusing an existing output, so their output size is not written bytes.
+UNWRITTEN_METHODS = ('skipped', 'deduplicated')
+
+def default_job_log_path():
+    return os.path.join(default_cache_dir(), 'jobs.jsonl')
+
+def default_textfile_path():
+    return os.path.join(default_cache_dir(), 'videoextender.prom')
+
+def path_size(path):
+    if path is None or not os.path.exists(path):
+        return 0
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return total
+
+class JobMetrics:
+    def __init__(self, index, input_file, clock=time.perf_counter):
+        self.index = index
+        self.input_file = input_file
+        self.output_file = None
+        self.method = None
+        self.repeat = None
+        self.duration = None
+        self.success = False
+        self.bytes_written = 0
+        self.stages = {}
+        self.clock = clock
+        self.started = clock()
+        self.wall_seconds = None
+        self.finished_at = None
+
+    @contextmanager
+    def stage(self, name):
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + self.clock() - started
+
+    def finish(self, output_file, success, outputs=None):
+        self.output_file = output_file
+        self.success = success
+        self.wall_seconds = self.clock() - self.started
+        self.finished_at = time.time()
+        if success and self.method not in UNWRITTEN_METHODS:
+            self.bytes_written = sum(path_size(path) for path in (outputs or [output_file]))
+
+    @property
+    def bytes_per_second(self):
+        if not self.wall_seconds:
+            return 0.0
+        return self.bytes_written / self.wall_seconds
+
+    def describe(self):
+        parts = [f"{name} {seconds:.2f}s" for name, seconds in self.stages.items() if seconds >= 0.005]
+        if self.bytes_written:
+            parts.append(f"{self.bytes_per_second / (1024 * 1024):.1f} MB/s")
+        return ' · '.join(parts)
+
+    def to_dict(self):
+        return {
+            'time': round(self.finished_at or time.time(), 3),
+            'input': self.input_file,
+            'output': self.output_file,
+            'success': self.success,
+            'method': self.method,
+            'repeat': self.repeat,
+            'source_seconds': self.duration,
+            'input_bytes': path_size(self.input_file),
+            'bytes_written': self.bytes_written,
+            'wall_seconds': round(self.wall_seconds or 0.0, 4),
+            'bytes_per_second': int(self.bytes_per_second),
+            'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+        }
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name):
+        lines = [f'{name}_bucket{{le="{bound}"}} {count}' for bound, count in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum {self.sum:.6f}')
+        lines.append(f'{name}_count {self.count}')
+        return lines
+
+class MetricsRecorder:
+    """Appends finished jobs to a JSON-lines log and keeps a Prometheus textfile up to date."""
+
+    def __init__(self, job_log_path=None, textfile_path=None):
+        self.job_log_path = job_log_path
+        self.textfile_path = textfile_path
+        self.lock = threading.Lock()
+        self.jobs = {'success': 0, 'failed': 0}
+        self.methods = {}
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self.bytes_written = 0
+        self.durations = Histogram(DURATION_BUCKETS)
+        self.throughput = Histogram(THROUGHPUT_BUCKETS)
+        self.last_job_time = 0.0
+        for path in (job_log_path, textfile_path):
+            if path:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def record(self, job):
+        with self.lock:
+            self.jobs['success' if job.success else 'failed'] += 1
+            if job.method:
+                self.methods[job.method] = self.methods.get(job.method, 0) + 1
+            for name, seconds in job.stages.items():
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+            self.durations.observe(job.wall_seconds or 0.0)
+            if job.success and job.method not in UNWRITTEN_METHODS:
+                self.bytes_written += job.bytes_written
+                self.throughput.observe(job.bytes_per_second)
+            self.last_job_time = job.finished_at or time.time()
+
+            if self.job_log_path:
+                with open(self.job_log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(job.to_dict(), ensure_ascii=False) + '\n')
+            if self.textfile_path:
+                self.write_textfile()
+
+    def textfile_lines(self):
+        lines = [
+            '# HELP videoextender_jobs_total Finished extension jobs by result.',
+            '# TYPE videoextender_jobs_total counter',
+        ]
+        lines += [f'videoextender_jobs_total{{result="{result}"}} {count}' for result, count in self.jobs.items()]
+        lines += [
+            '# HELP videoextender_jobs_by_method_total Finished extension jobs by output method.',
+            '# TYPE videoextender_jobs_by_method_total counter',
+        ]
+        lines += [f'videoextender_jobs_by_method_total{{method="{method}"}} {count}'
+                  for method, count in sorted(self.methods.items())]
+        lines += [
+            '# HELP videoextender_stage_seconds_total Time spent in each pipeline stage.',
+            '# TYPE videoextender_stage_seconds_total counter',
+        ]
+        lines += [f'videoextender_stage_seconds_total{{stage="{stage}"}} {seconds:.6f}'
+                  for stage, seconds in self.stage_seconds.items()]
+        lines += [
+            '# HELP videoextender_bytes_written_total Bytes written by successful jobs.',
+            '# TYPE videoextender_bytes_written_total counter',
+            f'videoextender_bytes_written_total {self.bytes_written}',
+            '# HELP videoextender_job_duration_seconds Wall time per job.',
+            '# TYPE videoextender_job_duration_seconds histogram',
+        ]
+        lines += self.durations.lines('videoextender_job_duration_seconds')
+        lines += [
+            '# HELP videoextender_job_throughput_bytes_per_second Achieved write rate per successful job.',
+            '# TYPE videoextender_job_throughput_bytes_per_second histogram',
+        ]
+        lines += self.throughput.lines('videoextender_job_throughput_bytes_per_second')
+        lines += [
+            '# HELP videoextender_last_job_timestamp_seconds Unix time the last job finished.',
+            '# TYPE videoextender_last_job_timestamp_seconds gauge',
+            f'videoextender_last_job_timestamp_seconds {self.last_job_time:.3f}',
+        ]
+        return lines
+
+    def write_textfile(self):
+        # node_exporter may read the file at any moment, so it is replaced atomically.
+        partial = f"{self.textfile_path}.partial"
+        with open(partial, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.textfile_lines()) + '\n')
+        os.replace(partial, self.textfile_path)
@@ -0,0 +1,565 @@
+import os
+import struct
+import sys
+from array import array
+from fractions import Fraction
+
+from .errors import UnsupportedLayout
+from .fileio import copy_range
+
+MP4_EXTENSIONS = {'.mp4', '.m4v', '.mov', '.3gp', '.3g2', '.f4v'}
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts'}
+TOP_LEVEL_BOXES = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'uuid'}
+STBL_BOXES = {b'stsd', b'stts', b'ctts', b'cslg', b'stss', b'stsz', b'stsc', b'stco', b'co64',
+              b'sdtp', b'sgpd', b'sbgp'}
+UINT32_MAX = 0xFFFFFFFF
+
+class Box:
+    def __init__(self, box_type, payload=b'', children=None):
+        self.type = box_type
+        self.payload = payload
+        self.children = children
+
+    def find(self, box_type):
+        for child in self.children or []:
+            if child.type == box_type:
+                return child
+        return None
+
+    def find_all(self, box_type):
+        return [child for child in self.children or [] if child.type == box_type]
+
+    def serialize(self):
+        if self.children is not None:
+            payload = b''.join(child.serialize() for child in self.children)
+        else:
+            payload = self.payload
+        size = len(payload) + 8
+        if size > UINT32_MAX:
+            return struct.pack('>I4sQ', 1, self.type, size + 8) + payload
+        return struct.pack('>I4s', size, self.type) + payload
+
+def parse_boxes(data):
+    boxes = []
+    pos = 0
+    while pos + 8 <= len(data):
+        size, box_type = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = len(data) - pos
+        if size < header or pos + size > len(data):
+            raise UnsupportedLayout(f"truncated '{box_type.decode('latin-1')}' box")
+        payload = bytes(data[pos + header:pos + size])
+        if box_type in CONTAINER_BOXES:
+            boxes.append(Box(box_type, children=parse_boxes(payload)))
+        else:
+            boxes.append(Box(box_type, payload))
+        pos += size
+    return boxes
+
+def scan_top_level(f, file_size):
+    boxes = []
+    pos = 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header or pos + size > file_size:
+            raise UnsupportedLayout(f"truncated top-level '{box_type.decode('latin-1')}' box")
+        boxes.append((box_type, pos, header, size))
+        pos += size
+    return boxes
+
+def read_runs(payload, fmt):
+    count = struct.unpack_from('>I', payload, 4)[0]
+    size = struct.calcsize(fmt)
+    return [struct.unpack_from(fmt, payload, 8 + i * size) for i in range(count)]
+
+def write_runs(header, runs, fmt):
+    return header + struct.pack('>I', len(runs)) + b''.join(struct.pack(fmt, *run) for run in runs)
+
+def truncate_runs(runs, count):
+    result = []
+    remaining = count
+    for run in runs:
+        if remaining <= 0:
+            break
+        take = min(run[0], remaining)
+        result.append((take,) + tuple(run[1:]))
+        remaining -= take
+    return result
+
+def read_uint_array(payload, offset, count, typecode):
+    values = array(typecode)
+    values.frombytes(payload[offset:offset + count * values.itemsize])
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values
+
+def pack_uint_array(values):
+    values = array(values.typecode, values)
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values.tobytes()
+
+def uint32_array():
+    return array('I') if array('I').itemsize == 4 else array('L')
+
+def rewrite_mvhd(payload, duration):
+    flags = payload[1:4]
+    if payload[0] == 1:
+        creation, modification, timescale = struct.unpack_from('>QQI', payload, 4)
+        rest = payload[4 + 28:]
+    else:
+        creation, modification, timescale = struct.unpack_from('>III', payload, 4)
+        rest = payload[4 + 16:]
+    if payload[0] == 1 or duration > UINT32_MAX:
+        return b'\x01' + flags + struct.pack('>QQIQ', creation, modification, timescale, duration) + rest
+    return b'\x00' + flags + struct.pack('>IIII', creation, modification, timescale, duration) + rest
+
+def rewrite_mdhd(payload, duration):
+    return rewrite_mvhd(payload, duration)
+
+def rewrite_tkhd(payload, duration):
+    version = payload[0]
+    flags = payload[1:4]
+    if version == 1:
+        creation, modification, track_id, reserved = struct.unpack_from('>QQII', payload, 4)
+        rest = payload[4 + 24 + 8:]
+    else:
+        creation, modification, track_id, reserved = struct.unpack_from('>IIII', payload, 4)
+        rest = payload[4 + 16 + 4:]
+    if version == 1 or duration > UINT32_MAX:
+        return b'\x01' + flags + struct.pack('>QQIIQ', creation, modification, track_id, reserved, duration) + rest
+    return b'\x00' + flags + struct.pack('>IIIII', creation, modification, track_id, reserved, duration) + rest
+
+def read_timescale(payload):
+    return struct.unpack_from('>I', payload, 20 if payload[0] == 1 else 12)[0]
+
+def read_elst(payload):
+    version = payload[0]
+    fmt = '>QqI' if version == 1 else '>IiI'
+    return read_runs(payload, fmt)
+
+def write_elst(payload, entries):
+    if any(entry[0] > UINT32_MAX or abs(entry[1]) > 0x7FFFFFFF for entry in entries):
+        return write_runs(b'\x01' + payload[1:4], entries, '>QqI')
+    return write_runs(b'\x00' + payload[1:4], entries, '>IiI')
+
+class Track:
+    def __init__(self, trak):
+        self.trak = trak
+        mdia = trak.find(b'mdia')
+        minf = mdia.find(b'minf') if mdia else None
+        stbl = minf.find(b'stbl') if minf else None
+        if stbl is None:
+            raise UnsupportedLayout('track without sample table')
+        self.mdia = mdia
+        self.stbl = stbl
+        self.timescale = read_timescale(mdia.find(b'mdhd').payload)
+        hdlr = mdia.find(b'hdlr')
+        self.handler = hdlr.payload[8:12] if hdlr else b''
+
+        unsupported = [box.type for box in stbl.children if box.type not in STBL_BOXES]
+        if unsupported:
+            raise UnsupportedLayout(f"unsupported sample table box '{unsupported[0].decode('latin-1')}'")
+        if stbl.find(b'stz2') or not stbl.find(b'stsz') or not stbl.find(b'stts') or not stbl.find(b'stsc'):
+            raise UnsupportedLayout('incomplete sample table')
+
+        self.stts = read_runs(stbl.find(b'stts').payload, '>II')
+        ctts = stbl.find(b'ctts')
+        self.ctts_header = ctts.payload[:4] if ctts else None
+        self.ctts = read_runs(ctts.payload, '>Ii') if ctts else None
+        self.stsc = read_runs(stbl.find(b'stsc').payload, '>III')
+
+        stsz = stbl.find(b'stsz').payload
+        self.sample_size, self.sample_count = struct.unpack_from('>II', stsz, 4)
+        self.sizes = read_uint_array(stsz, 12, self.sample_count, uint32_array().typecode) if self.sample_size == 0 else None
+
+        stss = stbl.find(b'stss')
+        self.stss = read_uint_array(stss.payload, 8, struct.unpack_from('>I', stss.payload, 4)[0],
+                                    uint32_array().typecode) if stss else None
+
+        stco = stbl.find(b'stco')
+        co64 = stbl.find(b'co64')
+        if stco is not None:
+            self.offsets = read_uint_array(stco.payload, 8, struct.unpack_from('>I', stco.payload, 4)[0],
+                                           uint32_array().typecode)
+        elif co64 is not None:
+            self.offsets = read_uint_array(co64.payload, 8, struct.unpack_from('>I', co64.payload, 4)[0], 'Q')
+        else:
+            raise UnsupportedLayout('track without chunk offsets')
+
+        sdtp = stbl.find(b'sdtp')
+        self.sdtp = sdtp.payload if sdtp else None
+        if self.sdtp is not None and len(self.sdtp) - 4 != self.sample_count:
+            raise UnsupportedLayout('sample dependency count mismatch')
+        self.sbgp = [(box.payload, self._read_sbgp(box.payload)) for box in stbl.find_all(b'sbgp')]
+
+        if self.sample_count == 0 or sum(count for count, _ in self.stts) != self.sample_count:
+            raise UnsupportedLayout('sample count mismatch')
+        if self.ctts is not None and sum(count for count, _ in self.ctts) != self.sample_count:
+            raise UnsupportedLayout('composition offset count mismatch')
+        self.media_duration = sum(count * delta for count, delta in self.stts)
+
+        self.chunk_first_sample = []
+        self.chunk_samples = []
+        chunk_count = len(self.offsets)
+        sample = 0
+        for i, (first_chunk, samples_per_chunk, _) in enumerate(self.stsc):
+            last_chunk = self.stsc[i + 1][0] - 1 if i + 1 < len(self.stsc) else chunk_count
+            for _ in range(first_chunk, last_chunk + 1):
+                self.chunk_first_sample.append(sample)
+                self.chunk_samples.append(samples_per_chunk)
+                sample += samples_per_chunk
+        if len(self.chunk_samples) != chunk_count or sample != self.sample_count:
+            raise UnsupportedLayout('chunk map does not cover all samples')
+
+        edts = trak.find(b'edts')
+        elst = edts.find(b'elst') if edts else None
+        self.elst_box = elst
+        self.elst = read_elst(elst.payload) if elst else None
+        if self.elst is not None:
+            normal = [entry for entry in self.elst if entry[1] != -1]
+            if len(normal) != 1 or self.elst[-1][1] == -1 or self.elst[-1][2] != 0x10000:
+                raise UnsupportedLayout('unsupported edit list')
+
+    def _read_sbgp(self, payload):
+        header = 12 if payload[0] == 1 else 8
+        count = struct.unpack_from('>I', payload, header)[0]
+        runs = [struct.unpack_from('>II', payload, header + 4 + i * 8) for i in range(count)]
+        # Samples past the last run belong to no group. They are given an explicit run (group
+        # index 0) so every loop's runs start at its first sample once the loops are joined.
+        covered = sum(run[0] for run in runs)
+        if covered < self.sample_count:
+            runs.append((self.sample_count - covered, 0))
+        return truncate_runs(runs, self.sample_count)
+
+    def sample_byte_size(self, index):
+        return self.sample_size if self.sizes is None else self.sizes[index]
+
+    def chunk_end(self, chunk, samples=None):
+        first = self.chunk_first_sample[chunk]
+        count = self.chunk_samples[chunk] if samples is None else samples
+        if self.sizes is None:
+            return self.offsets[chunk] + self.sample_size * count
+        return self.offsets[chunk] + sum(self.sizes[first:first + count])
+
+    def decode_times(self):
+        times = array('q')
+        t = 0
+        for count, delta in self.stts:
+            for _ in range(count):
+                times.append(t)
+                t += delta
+        return times
+
+    def composition_offsets(self):
+        offsets = array('q')
+        for count, offset in self.ctts or [(self.sample_count, 0)]:
+            offsets.extend([offset] * count)
+        return offsets
+
+    def media_time(self):
+        if not self.elst:
+            return 0
+        return [entry for entry in self.elst if entry[1] != -1][0][1]
+
+    def samples_before(self, seconds):
+        limit = seconds * self.timescale
+        t = 0
+        index = 0
+        for count, delta in self.stts:
+            for _ in range(count):
+                if t >= limit:
+                    return index
+                t += delta
+                index += 1
+        return index
+
+    def chunks_for(self, samples):
+        if samples == self.sample_count:
+            return len(self.offsets), None
+        for chunk in range(len(self.offsets)):
+            first = self.chunk_first_sample[chunk]
+            if first + self.chunk_samples[chunk] >= samples:
+                return chunk + 1, samples - first
+        return len(self.offsets), None
+
+def keyframe_cut(video, tail):
+    # The first sync sample presented at or after the tail, as keyframes.plan_loops picks it,
+    # so the tail never falls short of the target. A millisecond of slack absorbs probe rounding.
+    dts = video.decode_times()
+    cts = video.composition_offsets()
+    target = tail * video.timescale + video.media_time() - Fraction(video.timescale, 1000)
+    sync = video.stss if video.stss is not None else range(1, video.sample_count + 1)
+    best = None
+    for number in sync:
+        index = number - 1
+        if index == 0:
+            continue
+        presented = dts[index] + cts[index]
+        if presented >= target and (best is None or presented < best[0]):
+            best = (presented, index)
+    if best is None:
+        return None
+    return Fraction(dts[best[1]], video.timescale)
+
+class LoopPlan:
+    def __init__(self, samples, chunks, last_chunk_samples, span):
+        self.samples = samples
+        self.chunks = chunks
+        self.last_chunk_samples = last_chunk_samples
+        self.span = span
+
+def build_stbl(track, plans, chunk_offsets_for):
+    runs_stts = []
+    runs_ctts = []
+    stsc = []
+    stss = uint32_array()
+    sizes = uint32_array()
+    sdtp = bytearray()
+    sbgp = [[] for _ in track.sbgp]
+    chunk_offsets = array('Q')
+    sample_base = 0
+    chunk_base = 0
+    elapsed = 0
+    period_end = Fraction(0)
+
+    for k, plan in enumerate(plans):
+        period_end += plan.span
+        loop_end = round(period_end * track.timescale)
+        loop_stts = truncate_runs(track.stts, plan.samples - 1)
+        used = sum(count * delta for count, delta in loop_stts)
+        last_delta = loop_end - elapsed - used
+        if last_delta <= 0:
+            raise UnsupportedLayout('track is longer than the loop period')
+        runs_stts.extend(loop_stts + [(1, last_delta)])
+        elapsed = loop_end
+
+        if track.ctts is not None:
+            runs_ctts.extend(truncate_runs(track.ctts, plan.samples))
+
+        for first_chunk, samples_per_chunk, description in track.stsc:
+            if first_chunk > plan.chunks:
+                break
+            stsc.append((chunk_base + first_chunk, samples_per_chunk, description))
+        if plan.last_chunk_samples is not None:
+            description = stsc[-1][2]
+            if stsc[-1][0] == chunk_base + plan.chunks:
+                stsc[-1] = (chunk_base + plan.chunks, plan.last_chunk_samples, description)
+            else:
+                stsc.append((chunk_base + plan.chunks, plan.last_chunk_samples, description))
+
+        if track.stss is not None:
+            stss.extend(number + sample_base for number in track.stss if number <= plan.samples)
+        if track.sizes is not None:
+            sizes.extend(track.sizes[:plan.samples])
+        if track.sdtp is not None:
+            sdtp.extend(track.sdtp[4:4 + plan.samples])
+        for i, (_, runs) in enumerate(track.sbgp):
+            sbgp[i].extend(truncate_runs(runs, plan.samples))
+
+        chunk_offsets.extend(chunk_offsets_for(k, track.offsets[:plan.chunks]))
+        sample_base += plan.samples
+        chunk_base += plan.chunks
+
+    children = []
+    sbgp_boxes = iter(zip(track.sbgp, sbgp))
+    for box in track.stbl.children:
+        if box.type == b'stts':
+            children.append(Box(b'stts', write_runs(box.payload[:4], merge_runs(runs_stts), '>II')))
+        elif box.type == b'ctts':
+            children.append(Box(b'ctts', write_runs(track.ctts_header, merge_runs(runs_ctts), '>Ii')))
+        elif box.type == b'stsc':
+            children.append(Box(b'stsc', write_runs(box.payload[:4], stsc, '>III')))
+        elif box.type == b'stss':
+            children.append(Box(b'stss', box.payload[:4] + struct.pack('>I', len(stss)) + pack_uint_array(stss)))
+        elif box.type == b'stsz':
+            if track.sizes is None:
+                payload = box.payload[:4] + struct.pack('>II', track.sample_size, sample_base)
+            else:
+                payload = box.payload[:4] + struct.pack('>II', 0, sample_base) + pack_uint_array(sizes)
+            children.append(Box(b'stsz', payload))
+        elif box.type in (b'stco', b'co64'):
+            children.append(Box(b'co64', b'\x00\x00\x00\x00' + struct.pack('>I', len(chunk_offsets)) +
+                                pack_uint_array(chunk_offsets)))
+        elif box.type == b'sdtp':
+            children.append(Box(b'sdtp', track.sdtp[:4] + bytes(sdtp)))
+        elif box.type == b'sbgp':
+            (payload, _), runs = next(sbgp_boxes)
+            header = 12 if payload[0] == 1 else 8
+            runs = merge_runs(runs)
+            children.append(Box(b'sbgp', payload[:header] + struct.pack('>I', len(runs)) +
+                                b''.join(struct.pack('>II', *run) for run in runs)))
+        else:
+            children.append(box)
+    return Box(b'stbl', children=children), elapsed
+
+def merge_runs(runs):
+    merged = []
+    for run in runs:
+        if merged and tuple(merged[-1][1:]) == tuple(run[1:]):
+            merged[-1] = (merged[-1][0] + run[0],) + tuple(run[1:])
+        else:
+            merged.append(tuple(run))
+    return merged
+
+def replace_child(parent, old, new):
+    parent.children[parent.children.index(old)] = new
+
+class Mp4Source:
+    def __init__(self, path):
+        self.path = path
+        self.file_size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            top = scan_top_level(f, self.file_size)
+            unknown = [box_type for box_type, _, _, _ in top if box_type not in TOP_LEVEL_BOXES]
+            if unknown:
+                raise UnsupportedLayout(f"unsupported top-level box '{unknown[0].decode('latin-1')}'")
+            mdats = [box for box in top if box[0] == b'mdat']
+            moovs = [box for box in top if box[0] == b'moov']
+            ftyps = [box for box in top if box[0] == b'ftyp']
+            if len(mdats) != 1 or len(moovs) != 1:
+                raise UnsupportedLayout('expected exactly one moov and one mdat box')
+
+            _, pos, header, size = mdats[0]
+            self.data_start = pos + header
+            self.data_length = size - header
+
+            _, pos, header, size = moovs[0]
+            f.seek(pos + header)
+            self.moov = Box(b'moov', children=parse_boxes(f.read(size - header)))
+
+            self.ftyp = b''
+            if ftyps:
+                _, pos, _, size = ftyps[0]
+                f.seek(pos)
+                self.ftyp = f.read(size)
+
+        if self.moov.find(b'mvex') is not None:
+            raise UnsupportedLayout('fragmented MP4')
+        self.movie_timescale = read_timescale(self.moov.find(b'mvhd').payload)
+        self.tracks = [Track(trak) for trak in self.moov.find_all(b'trak')]
+        if not self.tracks:
+            raise UnsupportedLayout('no tracks')
+
+        data_end = self.data_start + self.data_length
+        for track in self.tracks:
+            for chunk in range(len(track.offsets)):
+                if track.offsets[chunk] < self.data_start or track.chunk_end(chunk) > data_end:
+                    raise UnsupportedLayout('chunk outside the media data box')
+
+        self.period = max(Fraction(track.media_duration, track.timescale) for track in self.tracks)
+
+    def video_track(self):
+        for track in self.tracks:
+            if track.handler == b'vide':
+                return track
+        return None
+
+    def plan(self, repeat, tail=None):
+        plans = {id(track): [LoopPlan(track.sample_count, len(track.offsets), None, self.period)] * repeat
+                 for track in self.tracks}
+        partial_length = 0
+        if tail is not None:
+            video = self.video_track()
+            span = keyframe_cut(video, tail) if video is not None else Fraction(tail).limit_denominator(1000000)
+            if span is not None and 0 < span < self.period:
+                for track in self.tracks:
+                    samples = max(1, track.samples_before(span))
+                    chunks, last = track.chunks_for(samples)
+                    plans[id(track)].append(LoopPlan(samples, chunks, last, span))
+                    ends = [track.chunk_end(chunk) for chunk in range(chunks - 1)]
+                    ends.append(track.chunk_end(chunks - 1, last))
+                    partial_length = max(partial_length, max(ends) - self.data_start)
+            else:
+                for track in self.tracks:
+                    plans[id(track)].append(plans[id(track)][0])
+                partial_length = self.data_length
+        return plans, partial_length
+
+    def build_moov(self, plans, loop_lengths, data_offset):
+        loop_starts = []
+        position = data_offset
+        for length in loop_lengths:
+            loop_starts.append(position)
+            position += length
+
+        def chunk_offsets_for(k, offsets):
+            delta = loop_starts[k] - self.data_start
+            return [offset + delta for offset in offsets]
+
+        moov = Box(b'moov', children=list(self.moov.children))
+        movie_duration = 0
+        for track in self.tracks:
+            stbl, media_duration = build_stbl(track, plans[id(track)], chunk_offsets_for)
+            trak = Box(b'trak', children=list(track.trak.children))
+            mdia = Box(b'mdia', children=list(track.mdia.children))
+            minf = Box(b'minf', children=list(mdia.find(b'minf').children))
+            replace_child(minf, minf.find(b'stbl'), stbl)
+            replace_child(mdia, mdia.find(b'minf'), minf)
+            mdhd = mdia.find(b'mdhd')
+            replace_child(mdia, mdhd, Box(b'mdhd', rewrite_mdhd(mdhd.payload, media_duration)))
+            replace_child(trak, trak.find(b'mdia'), mdia)
+
+            added = Fraction(media_duration - track.media_duration, track.timescale) * self.movie_timescale
+            if track.elst is not None:
+                entries = list(track.elst)
+                last = entries[-1]
+                entries[-1] = (max(0, last[0] + round(added)),) + tuple(last[1:])
+                edts = Box(b'edts', children=[Box(b'elst', write_elst(track.elst_box.payload, entries))])
+                replace_child(trak, trak.find(b'edts'), edts)
+                track_duration = sum(entry[0] for entry in entries)
+            else:
+                track_duration = round(Fraction(media_duration, track.timescale) * self.movie_timescale)
+            tkhd = trak.find(b'tkhd')
+            replace_child(trak, tkhd, Box(b'tkhd', rewrite_tkhd(tkhd.payload, track_duration)))
+            replace_child(moov, track.trak, trak)
+            movie_duration = max(movie_duration, track_duration)
+
+        mvhd = moov.find(b'mvhd')
+        replace_child(moov, mvhd, Box(b'mvhd', rewrite_mvhd(mvhd.payload, movie_duration)))
+        return moov.serialize()
+
+def extend_mp4(input_file, output_file, repeat, tail=None, on_loop=None, should_stop=None, throttle=None):
+    try:
+        source = Mp4Source(input_file)
+        plans, partial_length = source.plan(repeat, tail)
+    except (struct.error, IndexError, AttributeError, ValueError) as e:
+        raise UnsupportedLayout(f'unreadable MP4 structure: {e}')
+    loop_lengths = [source.data_length] * repeat
+    if partial_length:
+        loop_lengths.append(partial_length)
+
+    mdat_length = sum(loop_lengths)
+    try:
+        header_length = len(source.ftyp) + len(source.build_moov(plans, loop_lengths, 0)) + 16
+        moov = source.build_moov(plans, loop_lengths, header_length)
+    except (struct.error, IndexError, AttributeError, ValueError, TypeError, OverflowError) as e:
+        raise UnsupportedLayout(f'cannot rebuild MP4 structure: {e}')
+    if len(source.ftyp) + len(moov) + 16 != header_length:
+        raise UnsupportedLayout('moov size changed while assigning offsets')
+
+    with open(input_file, 'rb') as src, open(output_file, 'xb') as dst:
+        dst.write(source.ftyp)
+        dst.write(moov)
+        dst.write(struct.pack('>I4sQ', 1, b'mdat', mdat_length + 16))
+        dst.flush()
+        position = header_length
+        for k, length in enumerate(loop_lengths):
+            if should_stop is not None and should_stop():
+                return False
+            copy_range(src, dst, source.data_start, length, position, throttle)
+            position += length
+            if on_loop is not None:
+                on_loop(k + 1, len(loop_lengths), position)
+    return True
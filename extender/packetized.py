@@ -0,0 +1,484 @@
+import bisect
+import functools
+import mmap
+import os
+from array import array
+
+from .errors import UnsupportedLayout
+from .fileio import copy_range
+
+TS_EXTENSIONS = {'.ts', '.m2ts', '.mts'}
+PS_EXTENSIONS = {'.mpg', '.mpeg', '.vob', '.m2p'}
+DV_EXTENSIONS = {'.dv'}
+PACKETIZED_EXTENSIONS = TS_EXTENSIONS | PS_EXTENSIONS | DV_EXTENSIONS
+SCAN_BLOCK_PACKETS = 8192
+TIMESTAMP_WRAP = 1 << 33
+ATS_WRAP = 1 << 30
+NON_PES_STREAMS = {0xBB, 0xBC, 0xBE, 0xBF, 0xF0, 0xF1, 0xF2, 0xF8, 0xFF}
+PROGRAM_END_CODE = b'\x00\x00\x01\xb9'
+
+def decode_timestamp(data, pos):
+    return (((data[pos] >> 1) & 0x07) << 30) | (data[pos + 1] << 22) | ((data[pos + 2] >> 1) << 15) | \
+        (data[pos + 3] << 7) | (data[pos + 4] >> 1)
+
+def timestamp_fields(template, value):
+    # The field helpers work on ints and, column-wise, on numpy arrays alike.
+    return (
+        (template[0] & 0xF1) | ((value >> 29) & 0x0E),
+        (value >> 22) & 0xFF,
+        ((value >> 14) & 0xFE) | 0x01,
+        (value >> 7) & 0xFF,
+        ((value << 1) & 0xFE) | 0x01,
+    )
+
+def encode_timestamp(template, value):
+    return bytes(timestamp_fields(template, value))
+
+def decode_pcr(data, pos):
+    return (data[pos] << 25) | (data[pos + 1] << 17) | (data[pos + 2] << 9) | (data[pos + 3] << 1) | \
+        (data[pos + 4] >> 7)
+
+def pcr_fields(template, value):
+    return (
+        (value >> 25) & 0xFF,
+        (value >> 17) & 0xFF,
+        (value >> 9) & 0xFF,
+        (value >> 1) & 0xFF,
+        ((value << 7) & 0x80) | (template[4] & 0x7F),
+        template[5],
+    )
+
+def encode_pcr(template, value):
+    return bytes(pcr_fields(template, value))
+
+def decode_scr(data, pos):
+    return (((data[pos] >> 3) & 0x07) << 30) | ((data[pos] & 0x03) << 28) | (data[pos + 1] << 20) | \
+        ((data[pos + 2] >> 3) << 15) | ((data[pos + 2] & 0x03) << 13) | (data[pos + 3] << 5) | (data[pos + 4] >> 3)
+
+def scr_fields(template, value):
+    return (
+        (template[0] & 0xC4) | (((value >> 30) & 0x07) << 3) | ((value >> 28) & 0x03),
+        (value >> 20) & 0xFF,
+        (((value >> 15) & 0x1F) << 3) | (template[2] & 0x04) | ((value >> 13) & 0x03),
+        (value >> 5) & 0xFF,
+        ((value & 0x1F) << 3) | (template[4] & 0x07),
+    )
+
+def encode_scr(template, value):
+    return bytes(scr_fields(template, value))
+
+FIELDS = {'ts': timestamp_fields, 'pcr': pcr_fields, 'scr': scr_fields}
+PATCH_WIDTHS = {'ts': 5, 'pcr': 6, 'scr': 5}
+
+@functools.cache
+def optional_numpy():
+    # numpy is only imported once a loop is patched, and patching falls back to plain Python without it.
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+class PatchTable:
+    """Every timestamp field of one kind, as parallel arrays of file offsets, values and original bytes.
+
+    Offsets are added in file order, so the fields inside a partial loop are a prefix of the table.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.width = PATCH_WIDTHS[kind]
+        self.offsets = array('q')
+        self.values = array('q')
+        self.templates = bytearray()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def add(self, offset, value, template):
+        self.offsets.append(offset)
+        self.values.append(value)
+        self.templates += template
+
+    def apply(self, mm, base, length, delta):
+        count = bisect.bisect_right(self.offsets, length - self.width)
+        if not count:
+            return
+        numpy = optional_numpy()
+        if numpy is None:
+            self.apply_each(mm, base, count, delta)
+            return
+        values = (numpy.frombuffer(self.values, dtype=numpy.int64, count=count) + delta) % TIMESTAMP_WRAP
+        templates = numpy.frombuffer(self.templates, dtype=numpy.uint8, count=count * self.width)
+        fields = FIELDS[self.kind](templates.reshape(count, self.width).T.astype(numpy.int64), values)
+        positions = numpy.frombuffer(self.offsets, dtype=numpy.int64, count=count)[:, None] + \
+            numpy.arange(base, base + self.width)
+        view = numpy.frombuffer(mm, dtype=numpy.uint8)
+        view[positions] = numpy.stack(fields, axis=1)
+        # The mapping cannot be closed while a numpy view still exports its buffer.
+        del view
+
+    def apply_each(self, mm, base, count, delta):
+        fields = FIELDS[self.kind]
+        width = self.width
+        for i in range(count):
+            offset = base + self.offsets[i]
+            value = (self.values[i] + delta) % TIMESTAMP_WRAP
+            mm[offset:offset + width] = bytes(fields(self.templates[i * width:(i + 1) * width], value))
+
+def pes_timestamps(data, start, end, mpeg1=False):
+    found = []
+    if end - start < 9 or data[start:start + 3] != b'\x00\x00\x01' or data[start + 3] in NON_PES_STREAMS:
+        return found
+    if not mpeg1 and data[start + 6] >> 6 == 0x02:
+        flags = data[start + 7] >> 6
+        if flags & 0x02 and start + 14 <= end:
+            found.append((start + 9, decode_timestamp(data, start + 9)))
+        if flags == 0x03 and start + 19 <= end:
+            found.append((start + 14, decode_timestamp(data, start + 14)))
+        return found
+
+    pos = start + 6
+    while pos < end and data[pos] == 0xFF:
+        pos += 1
+    if pos + 1 < end and data[pos] >> 6 == 0x01:
+        pos += 2
+    if pos + 5 <= end and data[pos] >> 4 in (0x02, 0x03):
+        found.append((pos, decode_timestamp(data, pos)))
+        if data[pos] >> 4 == 0x03 and pos + 10 <= end:
+            found.append((pos + 5, decode_timestamp(data, pos + 5)))
+    return found
+
+def pes_payload_offset(data, start, end, mpeg1=False):
+    if not mpeg1 and data[start + 6] >> 6 == 0x02:
+        return start + 9 + data[start + 8]
+    pos = start + 6
+    while pos < end and data[pos] == 0xFF:
+        pos += 1
+    if pos < end and data[pos] >> 6 == 0x01:
+        pos += 2
+    if pos < end:
+        pos += {0x02: 5, 0x03: 10}.get(data[pos] >> 4, 1)
+    return pos
+
+def estimate_period(timestamps_by_stream):
+    period = 0
+    for values in timestamps_by_stream.values():
+        values = sorted(set(values))
+        steps = [b - a for a, b in zip(values, values[1:]) if b > a]
+        period = max(period, values[-1] + (min(steps) if steps else 0) - values[0])
+    if not period:
+        raise UnsupportedLayout('no timestamps found')
+    return period
+
+class PacketizedSource:
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.patches = {kind: PatchTable(kind) for kind in PATCH_WIDTHS}
+        self.period = 0
+        self.keyframe_offsets = []
+        self.has_keyframe_flags = False
+
+    def loop_length(self, final):
+        return self.size
+
+    def partial_length(self, cut_pts):
+        best = None
+        for pts, offset, keyframe in self.keyframe_offsets:
+            if self.has_keyframe_flags and not keyframe:
+                continue
+            if best is None or abs(pts - cut_pts) < abs(best[0] - cut_pts):
+                best = (pts, offset)
+        if best is None or best[1] <= 0:
+            return None
+        return best[1]
+
+    def partial_edits(self, length):
+        return []
+
+    def patch_loop(self, mm, base, length, k):
+        delta = (k * self.period) % TIMESTAMP_WRAP
+        for table in self.patches.values():
+            table.apply(mm, base, length, delta)
+
+class TsSource(PacketizedSource):
+    def __init__(self, path):
+        super().__init__(path)
+        with open(path, 'rb') as f:
+            head = f.read(192 * 4)
+        if len(head) >= 188 * 3 and all(head[i * 188] == 0x47 for i in range(3)):
+            self.packet_size, self.sync_offset = 188, 0
+        elif len(head) >= 192 * 3 and all(head[i * 192 + 4] == 0x47 for i in range(3)):
+            self.packet_size, self.sync_offset = 192, 4
+        else:
+            raise UnsupportedLayout('not an MPEG transport stream')
+        if self.size % self.packet_size:
+            raise UnsupportedLayout('transport stream ends with a partial packet')
+        self.packet_count = self.size // self.packet_size
+        self.scan()
+
+    def scan(self):
+        classes = {}
+        payload_counts = []
+        hi = bytearray(self.packet_count)
+        keys = bytearray(self.packet_count)
+        ats = [] if self.packet_size == 192 else None
+        timestamps_by_pid = {}
+        video_pid = None
+
+        with open(self.path, 'rb') as f:
+            index = 0
+            while index < self.packet_count:
+                block = f.read(self.packet_size * SCAN_BLOCK_PACKETS)
+                for pos in range(0, len(block), self.packet_size):
+                    offset = index * self.packet_size
+                    p = pos + self.sync_offset
+                    if block[p] != 0x47:
+                        raise UnsupportedLayout(f'lost sync at byte {offset}')
+                    pid = ((block[p + 1] & 0x1F) << 8) | block[p + 2]
+                    flags = block[p + 3]
+                    afc = (flags >> 4) & 0x03
+
+                    if pid not in classes:
+                        if len(classes) >= 16:
+                            raise UnsupportedLayout('too many PIDs to rewrite continuity counters')
+                        classes[pid] = len(classes)
+                        payload_counts.append(0)
+                    cls = classes[pid]
+                    hi[index] = flags & 0xF0
+                    keys[index] = (cls << 4) | (flags & 0x0F)
+                    if afc & 0x01:
+                        payload_counts[cls] += 1
+                    if ats is not None:
+                        ats.append(block[pos:pos + 4])
+
+                    payload = p + 4
+                    random_access = False
+                    if afc & 0x02:
+                        af_length = block[p + 4]
+                        if af_length:
+                            random_access = bool(block[p + 5] & 0x40)
+                            self.has_keyframe_flags |= random_access
+                        if af_length >= 7 and block[p + 5] & 0x10:
+                            self.patches['pcr'].add(offset + self.sync_offset + 6, decode_pcr(block, p + 6),
+                                                    block[p + 6:p + 12])
+                        payload = p + 5 + af_length
+                    end = p + 188
+
+                    if block[p + 1] & 0x40 and afc & 0x01 and payload + 3 < end:
+                        stream_id = block[payload + 3]
+                        timestamps = pes_timestamps(block, payload, end)
+                        for ts_pos, value in timestamps:
+                            self.patches['ts'].add(offset + ts_pos - pos, value, block[ts_pos:ts_pos + 5])
+                        if timestamps:
+                            timestamps_by_pid.setdefault(pid, []).append(timestamps[0][1])
+                            if 0xE0 <= stream_id <= 0xEF and video_pid in (None, pid):
+                                video_pid = pid
+                                self.keyframe_offsets.append((timestamps[0][1], offset, random_access))
+                    index += 1
+
+        self.period = estimate_period(timestamps_by_pid)
+        self.classes = classes
+        self.payload_counts = payload_counts
+        self.hi = bytes(hi)
+        self.keys = bytes(keys)
+        self.ats = b''.join(ats) if ats is not None else None
+
+    def patch_loop(self, mm, base, length, k):
+        super().patch_loop(mm, base, length, k)
+        packets = length // self.packet_size
+
+        table = bytearray(256)
+        for cls, count in enumerate(self.payload_counts):
+            shift = (k * count) % 16
+            for cc in range(16):
+                table[(cls << 4) | cc] = (cc + shift) & 0x0F
+        counters = self.keys[:packets].translate(bytes(table))
+        merged = int.from_bytes(self.hi[:packets], 'big') | int.from_bytes(counters, 'big')
+        column = self.sync_offset + 3
+        mm[base + column:base + packets * self.packet_size:self.packet_size] = merged.to_bytes(packets, 'big')
+
+        if self.ats is not None:
+            self.patch_arrival_times(mm, base, packets, k)
+
+    def patch_arrival_times(self, mm, base, packets, k):
+        # Each 30-bit arrival timestamp is widened to a 64-bit lane so one big-int
+        # addition offsets every packet without carries leaking between lanes.
+        delta = (k * self.period * 300) % ATS_WRAP
+        lanes = bytearray(packets * 8)
+        for i in range(4):
+            lanes[4 + i::8] = self.ats[i:packets * 4:4]
+        values = int.from_bytes(lanes, 'big')
+        lane_mask = int.from_bytes(((ATS_WRAP - 1).to_bytes(8, 'big')) * packets, 'big')
+        permission_mask = int.from_bytes((0xC0000000).to_bytes(8, 'big') * packets, 'big')
+        permissions = values & permission_mask
+        values = (values & lane_mask) + int.from_bytes(delta.to_bytes(8, 'big') * packets, 'big')
+        lanes = ((values & lane_mask) | permissions).to_bytes(packets * 8, 'big')
+        for i in range(4):
+            mm[base + i:base + packets * self.packet_size:self.packet_size] = lanes[4 + i::8]
+
+class PsSource(PacketizedSource):
+    def __init__(self, path):
+        super().__init__(path)
+        if self.size < 4:
+            raise UnsupportedLayout('not an MPEG program stream')
+        # Program streams from DVDs run to gigabytes, so they are scanned through a read-only
+        # mapping and the page cache rather than read into memory.
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:4] != b'\x00\x00\x01\xba':
+                raise UnsupportedLayout('not an MPEG program stream')
+            self.has_end_code = data[-len(PROGRAM_END_CODE):] == PROGRAM_END_CODE
+            self.scan(data)
+
+    def scan(self, data):
+        timestamps_by_stream = {}
+        pending_gops = []
+        self.cut_edits = {}
+        self.in_gop_header = False
+        video_stream = None
+        pos = 0
+        size = len(data)
+        while pos + 4 <= size:
+            if data[pos:pos + 3] != b'\x00\x00\x01':
+                raise UnsupportedLayout(f'lost start code at byte {pos}')
+            code = data[pos + 3]
+            if code == 0xB9:
+                pos += 4
+                continue
+            if code == 0xBA:
+                if data[pos + 4] >> 6 == 0x01:
+                    value = decode_scr(data, pos + 4)
+                    self.patches['scr'].add(pos + 4, value, data[pos + 4:pos + 9])
+                    pos += 14 + (data[pos + 13] & 0x07)
+                else:
+                    value = decode_timestamp(data, pos + 4)
+                    self.patches['ts'].add(pos + 4, value, data[pos + 4:pos + 9])
+                    pos += 12
+                continue
+            if code < 0xBB:
+                raise UnsupportedLayout(f'unexpected start code 0x{code:02x}')
+            length = int.from_bytes(data[pos + 4:pos + 6], 'big')
+            end = min(pos + 6 + length, size)
+            mpeg1 = data[pos + 6] >> 6 != 0x02 if pos + 6 < end else True
+            timestamps = pes_timestamps(data, pos, end, mpeg1)
+            for ts_pos, value in timestamps:
+                self.patches['ts'].add(ts_pos, value, data[ts_pos:ts_pos + 5])
+            if timestamps:
+                timestamps_by_stream.setdefault(code, []).append(timestamps[0][1])
+            if 0xE0 <= code <= 0xEF and video_stream in (None, code):
+                video_stream = code
+                pending_gops = self.scan_gop_headers(data, pos, end, mpeg1, timestamps, pending_gops)
+            pos = end
+        self.period = estimate_period(timestamps_by_stream)
+        self.has_keyframe_flags = bool(self.keyframe_offsets)
+
+    def scan_gop_headers(self, data, start, end, mpeg1, timestamps, pending):
+        # PS packs are not aligned to pictures, so the tail is cut right before a sequence
+        # or GOP header inside the video payload and that PES is shortened to match.
+        if timestamps:
+            for offset in pending:
+                self.keyframe_offsets.append((timestamps[0][1], offset, True))
+            pending = []
+        payload = pes_payload_offset(data, start, end, mpeg1)
+        pos = payload
+        while True:
+            pos = data.find(b'\x00\x00\x01', pos, end)
+            if pos < 0 or pos + 3 >= end:
+                break
+            code = data[pos + 3]
+            if code == 0x00:
+                self.in_gop_header = False
+            elif code in (0xB3, 0xB8) and not self.in_gop_header:
+                self.in_gop_header = True
+                cut = start if pos == payload else pos
+                if cut > start:
+                    self.cut_edits[cut] = (start + 4, (cut - start - 6).to_bytes(2, 'big'))
+                if timestamps:
+                    self.keyframe_offsets.append((timestamps[0][1], cut, True))
+                else:
+                    pending.append(cut)
+            pos += 3
+        return pending
+
+    def partial_edits(self, length):
+        edit = self.cut_edits.get(length)
+        return [edit] if edit is not None else []
+
+    def loop_length(self, final):
+        if self.has_end_code and not final:
+            return self.size - len(PROGRAM_END_CODE)
+        return self.size
+
+class DvSource(PacketizedSource):
+    NTSC_FRAME = 120000
+    PAL_FRAME = 144000
+
+    def __init__(self, path):
+        super().__init__(path)
+        with open(path, 'rb') as f:
+            header = f.read(8)
+            if len(header) < 8 or header[0] >> 5 != 0:
+                raise UnsupportedLayout('not a raw DV stream')
+            self.frame_size = self.PAL_FRAME if header[3] & 0x80 else self.NTSC_FRAME
+            f.seek(self.frame_size)
+            following = f.read(4)
+        if self.size % self.frame_size or (following and following[0] >> 5 != 0):
+            raise UnsupportedLayout('unsupported DV frame size')
+        self.frame_rate = 25.0 if self.frame_size == self.PAL_FRAME else 30000 / 1001
+
+    def partial_length(self, cut_pts):
+        frames = int(round(cut_pts / 90000 * self.frame_rate))
+        length = frames * self.frame_size
+        return length if 0 < length < self.size else None
+
+    def patch_loop(self, mm, base, length, k):
+        pass
+
+def open_source(input_file):
+    ext = os.path.splitext(input_file)[1].lower()
+    if ext in TS_EXTENSIONS:
+        return TsSource(input_file)
+    if ext in PS_EXTENSIONS:
+        return PsSource(input_file)
+    if ext in DV_EXTENSIONS:
+        return DvSource(input_file)
+    raise UnsupportedLayout(f'no byte-level path for {ext} files')
+
+def extend_packetized(input_file, output_file, repeat, tail=None, start_time=0.0, duration=None, on_loop=None,
+                      should_stop=None, throttle=None):
+    try:
+        source = open_source(input_file)
+    except (IndexError, ValueError) as e:
+        raise UnsupportedLayout(f'unreadable stream structure: {e}')
+    if duration:
+        # The container duration already spans every stream, while PES timestamps alone
+        # cannot tell how many audio frames the last packet carries.
+        source.period = round(duration * 90000)
+
+    lengths = [source.loop_length(k == repeat - 1 and tail is None) for k in range(repeat)]
+    edits = []
+    if tail is not None:
+        partial = source.partial_length(round((start_time + tail) * 90000) % TIMESTAMP_WRAP)
+        lengths.append(partial if partial is not None else source.size)
+        edits = source.partial_edits(lengths[-1])
+
+    granularity = mmap.ALLOCATIONGRANULARITY
+    with open(input_file, 'rb') as src, open(output_file, 'xb+') as dst:
+        position = 0
+        for k, length in enumerate(lengths):
+            if should_stop is not None and should_stop():
+                return False
+            copy_range(src, dst, 0, length, position, throttle)
+            final_edits = edits if k == len(lengths) - 1 else []
+            if (k > 0 and not isinstance(source, DvSource)) or final_edits:
+                aligned = position - position % granularity
+                with mmap.mmap(dst.fileno(), position + length - aligned, offset=aligned) as mm:
+                    if k > 0:
+                        source.patch_loop(mm, position - aligned, length, k)
+                    for offset, value in final_edits:
+                        mm[position - aligned + offset:position - aligned + offset + len(value)] = value
+            position += length
+            if on_loop is not None:
+                on_loop(k + 1, len(lengths), position)
+    return True
@@ -0,0 +1,113 @@
+import shutil
+
+# Input extensions ffmpeg has no muxer for, so an extended copy can only be written natively.
+NO_MUXER_EXTENSIONS = {'.rmvb', '.divx', '.xvid', '.mpv', '.m2p', '.mpeg2', '.ogm'}
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+class JobPlan:
+    """What one input will produce, estimated before any muxing starts."""
+
+    def __init__(self, index, input_file, output_dir):
+        self.index = index
+        self.input_file = input_file
+        self.output_dir = output_dir
+        self.outputs = []
+        self.repeat = None
+        self.source_seconds = None
+        self.output_seconds = 0.0
+        self.output_bytes = 0
+        self.scratch_bytes = 0
+        self.up_to_date = False
+        self.problem = None
+
+    @property
+    def required_bytes(self):
+        # Scratch files (doubling intermediates, seam pieces, resumable segments) exist alongside
+        # the output until it is complete, so both count against free space.
+        return self.output_bytes + self.scratch_bytes
+
+    def to_dict(self):
+        return {
+            'index': self.index,
+            'input': self.input_file,
+            'outputs': self.outputs,
+            'repeat': self.repeat,
+            'source_seconds': self.source_seconds,
+            'output_seconds': round(self.output_seconds, 3),
+            'output_bytes': int(self.output_bytes),
+            'scratch_bytes': int(self.scratch_bytes),
+            'up_to_date': self.up_to_date,
+            'problem': self.problem,
+        }
+
+class VolumePlan:
+    def __init__(self, device, path):
+        self.device = device
+        self.path = path
+        self.required = 0
+        self.rejected = 0
+        try:
+            usage = shutil.disk_usage(path)
+            self.free, self.total = usage.free, usage.total
+        except OSError:
+            self.free = self.total = None
+
+    def admit(self, job):
+        if self.free is not None and self.required + job.required_bytes > self.free:
+            self.rejected += 1
+            return False
+        self.required += job.required_bytes
+        return True
+
+    def describe(self):
+        text = f"{self.path}: {format_bytes(self.required)} to write"
+        if self.free is not None:
+            text += f", {format_bytes(self.free)} free"
+        return text
+
+    def to_dict(self):
+        return {'path': self.path, 'required_bytes': int(self.required), 'free_bytes': self.free,
+                'total_bytes': self.total, 'rejected': self.rejected}
+
+class BatchPlan:
+    """Every job's estimate, totalled per destination volume.
+
+    Jobs are admitted in list order while their volume has room. A job that does not fit is
+    rejected, but later, smaller jobs for the same volume can still be admitted, so the batch
+    does as much as the free space allows.
+    """
+
+    def __init__(self, jobs, device_of):
+        self.jobs = jobs
+        self.volumes = {}
+        for job in jobs:
+            if job.problem is not None or job.up_to_date:
+                continue
+            device = device_of(job.output_dir)
+            volume = self.volumes.get(device)
+            if volume is None:
+                volume = self.volumes[device] = VolumePlan(device, job.output_dir)
+            if not volume.admit(job):
+                available = volume.free - volume.required
+                job.problem = (f"needs {format_bytes(job.required_bytes)} but only "
+                               f"{format_bytes(max(0, available))} is free on {volume.path}")
+
+    @property
+    def admitted(self):
+        return [job for job in self.jobs if job.problem is None]
+
+    @property
+    def rejected(self):
+        return [job for job in self.jobs if job.problem is not None]
+
+    def describe(self):
+        admitted = [job for job in self.admitted if not job.up_to_date]
+        total = sum(job.output_bytes for job in admitted)
+        lines = [f"Plan: {len(admitted)} job(s), {format_bytes(total)} of output"]
+        lines += [volume.describe() for volume in self.volumes.values()]
+        return lines
@@ -0,0 +1,145 @@
+import math
+import os
+import re
+import xml.etree.ElementTree as ET
+
+PLAYLIST_MODES = ('hls', 'dash', 'hls+dash')
+SEGMENT_SECONDS = 6
+TS_VIDEO_CODECS = {'h264', 'hevc', 'mpeg1video', 'mpeg2video'}
+DASH_NS = 'urn:mpeg:dash:schema:mpd:2011'
+
+def playlist_dir(output_file, kind):
+    return f"{os.path.splitext(output_file)[0]}_{kind}"
+
+def hls_segment_args(input_file, out_dir, video_codec, segment_seconds=SEGMENT_SECONDS):
+    fmp4 = video_codec is not None and video_codec not in TS_VIDEO_CODECS
+    args = [
+        '-i', input_file,
+        '-map', '0:v?', '-map', '0:a?',
+        '-c', 'copy',
+        '-f', 'hls',
+        '-hls_time', str(segment_seconds),
+        '-hls_playlist_type', 'vod',
+    ]
+    if fmp4:
+        args += ['-hls_segment_type', 'fmp4', '-hls_fmp4_init_filename', 'init.mp4']
+    args += [
+        '-hls_segment_filename', os.path.join(out_dir, 'seg_%05d.m4s' if fmp4 else 'seg_%05d.ts'),
+        os.path.join(out_dir, 'source.m3u8'),
+    ]
+    return args
+
+def parse_hls_playlist(text):
+    version = 3
+    map_tag = None
+    segments = []
+    duration = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-VERSION:'):
+            version = int(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-MAP:'):
+            map_tag = line
+        elif line.startswith('#EXTINF:'):
+            duration = float(line.split(':', 1)[1].split(',', 1)[0])
+        elif line and not line.startswith('#') and duration is not None:
+            segments.append((duration, line))
+            duration = None
+    return version, map_tag, segments
+
+def build_hls_playlist(source_text, repeat, tail=None):
+    version, map_tag, segments = parse_hls_playlist(source_text)
+    if not segments:
+        raise ValueError('segmenter produced no HLS segments')
+
+    loops = [segments] * repeat
+    if tail is not None:
+        partial = []
+        start = 0.0
+        for duration, uri in segments:
+            if start >= tail:
+                break
+            partial.append((duration, uri))
+            start += duration
+        loops.append(partial)
+
+    target_duration = math.ceil(max(duration for duration, _ in segments))
+    lines = [
+        '#EXTM3U',
+        f'#EXT-X-VERSION:{max(version, 3)}',
+        f'#EXT-X-TARGETDURATION:{target_duration}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+    ]
+    for i, loop in enumerate(loops):
+        if i > 0:
+            lines.append('#EXT-X-DISCONTINUITY')
+        if map_tag:
+            lines.append(map_tag)
+        for duration, uri in loop:
+            lines.append(f'#EXTINF:{duration:.6f},')
+            lines.append(uri)
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+def dash_segment_args(input_file, out_dir, segment_seconds=SEGMENT_SECONDS):
+    return [
+        '-i', input_file,
+        '-map', '0:v?', '-map', '0:a?',
+        '-c', 'copy',
+        '-f', 'dash',
+        '-seg_duration', str(segment_seconds),
+        '-use_template', '1',
+        '-use_timeline', '1',
+        '-init_seg_name', 'init-$RepresentationID$.m4s',
+        '-media_seg_name', 'chunk-$RepresentationID$-$Number%05d$.m4s',
+        os.path.join(out_dir, 'source.mpd'),
+    ]
+
+def format_iso_duration(seconds):
+    return f'PT{seconds:.3f}S'
+
+def parse_iso_duration(value):
+    match = re.fullmatch(r'P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:([\d.]+)S)?', value or '')
+    if not match:
+        raise ValueError(f'unsupported ISO 8601 duration: {value}')
+    days, hours, minutes, seconds = (float(v) if v else 0.0 for v in match.groups())
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
+def build_dash_manifest(source_xml, repeat, tail=None):
+    ET.register_namespace('', DASH_NS)
+    root = ET.fromstring(source_xml)
+    ns = {'mpd': DASH_NS}
+    periods = root.findall('mpd:Period', ns)
+    if len(periods) != 1:
+        raise ValueError('expected a single period in the DASH manifest')
+    source_period = periods[0]
+    duration = parse_iso_duration(root.get('mediaPresentationDuration'))
+
+    for template in source_period.iter(f'{{{DASH_NS}}}SegmentTemplate'):
+        first = template.find('mpd:SegmentTimeline/mpd:S', ns)
+        if first is not None and 'presentationTimeOffset' not in template.attrib:
+            template.set('presentationTimeOffset', first.get('t', '0'))
+
+    root.remove(source_period)
+    spans = [duration] * repeat
+    if tail is not None:
+        spans.append(tail)
+    start = 0.0
+    for i, span in enumerate(spans):
+        period = ET.fromstring(ET.tostring(source_period))
+        period.set('id', str(i))
+        period.set('start', format_iso_duration(start))
+        period.set('duration', format_iso_duration(span))
+        root.append(period)
+        start += span
+
+    root.set('type', 'static')
+    root.set('mediaPresentationDuration', format_iso_duration(start))
+    return ET.tostring(root, encoding='unicode', xml_declaration=True)
+
+def write_text(path, text):
+    partial = f"{path}.partial"
+    with open(partial, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(partial, path)
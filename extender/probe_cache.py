@@ -0,0 +1,242 @@
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+
+from .tools import FFPROBE_PATH, creation_flags
+
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+PROBE_VERSION = 4
+
+def default_cache_dir():
+    if os.name == 'nt':
+        base_path = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base_path = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base_path, 'videoextender')
+
+def cache_key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+class MediaInfo:
+    def __init__(self, duration, format_name=None, bit_rate=None, size=None, streams=None, keyframes=None,
+                 start_time=0.0):
+        self.duration = duration
+        self.start_time = start_time
+        self.format_name = format_name
+        self.bit_rate = bit_rate
+        self.size = size
+        self.streams = streams or []
+        # None until the keyframe pass has run; see probe_keyframes.
+        self.keyframes = keyframes
+
+    def codec(self, codec_type):
+        for stream in self.streams:
+            if stream.get('codec_type') == codec_type:
+                return stream.get('codec_name')
+        return None
+
+    @property
+    def video_codec(self):
+        return self.codec('video')
+
+    @property
+    def audio_codec(self):
+        return self.codec('audio')
+
+    def describe(self):
+        parts = [f"Duration: {self.duration:.2f}s"]
+        codecs = [c for c in (self.video_codec, self.audio_codec) if c]
+        if codecs:
+            parts.append(f"Codecs: {', '.join(codecs)}")
+        if self.bit_rate:
+            parts.append(f"Bitrate: {self.bit_rate // 1000} kb/s")
+        if self.keyframes:
+            parts.append(f"Keyframes: {len(self.keyframes)}")
+        return '\n'.join(parts)
+
+    def to_dict(self):
+        return {
+            'version': PROBE_VERSION,
+            'duration': self.duration,
+            'start_time': self.start_time,
+            'format_name': self.format_name,
+            'bit_rate': self.bit_rate,
+            'size': self.size,
+            'streams': self.streams,
+            'keyframes': self.keyframes,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['duration'], data.get('format_name'), data.get('bit_rate'),
+                   data.get('size'), data.get('streams'), data.get('keyframes'), data.get('start_time', 0.0))
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def ffprobe_command(path, ffprobe_path=None):
+    return [
+        ffprobe_path or FFPROBE_PATH, '-v', 'error',
+        '-show_entries',
+        'format=duration,start_time,bit_rate,format_name,size'
+        ':stream=index,codec_type,codec_name,codec_tag_string,profile,level,pix_fmt,bit_rate,width,height,'
+        'r_frame_rate,sample_rate,channels,start_time,duration',
+        '-of', 'json',
+        path
+    ]
+
+def keyframes_command(path, ffprobe_path=None):
+    # Packets of the first video stream only: their flags mark keyframes without decoding anything.
+    return [
+        ffprobe_path or FFPROBE_PATH, '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=print_section=0',
+        path
+    ]
+
+def run_ffprobe(path, ffprobe_path=None, keyframes=False):
+    info = parse_ffprobe(subprocess.check_output(
+        ffprobe_command(path, ffprobe_path),
+        creationflags=creation_flags()
+    ))
+    if keyframes:
+        probe_keyframes(path, info, ffprobe_path)
+    return info
+
+def probe_keyframes(path, info, ffprobe_path=None):
+    """Fills in info.keyframes with a second, video-only pass over the packets."""
+    if info.video_codec is None:
+        info.keyframes = []
+    else:
+        info.keyframes = parse_keyframes(subprocess.check_output(
+            keyframes_command(path, ffprobe_path),
+            creationflags=creation_flags()
+        ))
+    return info
+
+def parse_ffprobe(output):
+    data = json.loads(output.decode('utf-8', errors='replace'))
+
+    fmt = data.get('format', {})
+    streams = []
+    for stream in data.get('streams', []):
+        streams.append({
+            key: (_to_int(value) if key in ('bit_rate', 'sample_rate', 'channels', 'level') else value)
+            for key, value in stream.items()
+        })
+
+    try:
+        start_time = float(fmt.get('start_time', 0))
+    except ValueError:
+        start_time = 0.0
+
+    return MediaInfo(float(fmt['duration']), fmt.get('format_name'), _to_int(fmt.get('bit_rate')),
+                     _to_int(fmt.get('size')), streams, None, start_time)
+
+def parse_keyframes(output):
+    keyframes = []
+    for line in output.decode('utf-8', errors='replace').splitlines():
+        pts_time, _, flags = line.strip().partition(',')
+        if 'K' not in flags:
+            continue
+        try:
+            keyframes.append(float(pts_time))
+        except ValueError:
+            pass
+    keyframes.sort()
+    return keyframes
+
+class ProbeCache:
+    def __init__(self, path=None, max_bytes=CACHE_MAX_BYTES, ffprobe_path=None):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'probe.sqlite')
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ffprobe_path = ffprobe_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS media ('
+                'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, accessed REAL, info TEXT)'
+            )
+
+    def lookup(self, path):
+        key = cache_key(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                'SELECT size, mtime_ns, info FROM media WHERE path = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] != stat.st_size or row[1] != stat.st_mtime_ns:
+                self.connection.execute('DELETE FROM media WHERE path = ?', (key,))
+                return None
+            self.connection.execute('UPDATE media SET accessed = ? WHERE path = ?', (time.time(), key))
+        data = json.loads(row[2])
+        if data.get('version') != PROBE_VERSION:
+            return None
+        return MediaInfo.from_dict(data)
+
+    def store(self, path, info):
+        stat = os.stat(path)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO media (path, size, mtime_ns, accessed, info) VALUES (?, ?, ?, ?, ?)',
+                (cache_key(path), stat.st_size, stat.st_mtime_ns, time.time(), json.dumps(info.to_dict()))
+            )
+            self._evict()
+
+    def probe(self, path, ffprobe_path=None, keyframes=False):
+        """Returns the cached probe, running ffprobe on a miss.
+
+        The keyframe pass reads every video packet, so it only runs when `keyframes` asks for
+        it; its result is cached with the rest of the probe.
+        """
+        ffprobe_path = ffprobe_path or self.ffprobe_path
+        info = self.lookup(path)
+        if info is None:
+            info = run_ffprobe(path, ffprobe_path, keyframes)
+            self.store(path, info)
+        elif keyframes and info.keyframes is None:
+            probe_keyframes(path, info, ffprobe_path)
+            self.store(path, info)
+        return info
+
+    def invalidate(self, path):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM media WHERE path = ?', (cache_key(path),))
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM media')
+
+    def _evict(self):
+        total = self.connection.execute('SELECT COALESCE(SUM(LENGTH(info)), 0) FROM media').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute('SELECT path, LENGTH(info) FROM media ORDER BY accessed').fetchall()
+        stale = []
+        for path, length in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((path,))
+            total -= length
+        self.connection.executemany('DELETE FROM media WHERE path = ?', stale)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,100 @@
+import time
+
+PROGRESS_INTERVAL = 0.25
+
+class ProgressInfo:
+    def __init__(self, percent, out_seconds, total_size, bytes_per_second, speed, finished=False):
+        self.percent = percent
+        self.out_seconds = out_seconds
+        self.total_size = total_size
+        self.bytes_per_second = bytes_per_second
+        self.speed = speed
+        self.finished = finished
+
+    def describe(self):
+        parts = []
+        if self.speed is not None:
+            parts.append(f"{self.speed:.1f}x")
+        if self.bytes_per_second:
+            parts.append(f"{self.bytes_per_second / (1024 * 1024):.1f} MB/s")
+        return ' · '.join(parts)
+
+    def to_dict(self):
+        return {
+            'percent': self.percent,
+            'out_seconds': round(self.out_seconds, 3),
+            'total_size': self.total_size,
+            'bytes_per_second': int(self.bytes_per_second),
+            'speed': self.speed,
+        }
+
+def _parse_number(value):
+    try:
+        return float(value.rstrip(b'x'))
+    except ValueError:
+        return None
+
+class ProgressParser:
+    def __init__(self, total_seconds, callback, offset_seconds=0, interval=PROGRESS_INTERVAL, clock=time.monotonic):
+        self.total_seconds = total_seconds
+        self.callback = callback
+        self.offset_seconds = offset_seconds
+        self.interval = interval
+        self.clock = clock
+        self.started = clock()
+        self.last_emit = None
+        self.record = {}
+        self.total_size = 0
+
+    def feed(self, line):
+        key, sep, value = line.strip().partition(b'=')
+        if not sep:
+            return
+        if key == b'progress':
+            # Kept for every record, not just the emitted ones, so write throttling sees each step.
+            self.total_size = int(_parse_number(self.record.get(b'total_size', b'N/A')) or 0)
+            self.finish_record(value == b'end')
+            self.record = {}
+        else:
+            self.record[key] = value
+
+    def finish_record(self, finished):
+        now = self.clock()
+        if not finished and self.last_emit is not None and now - self.last_emit < self.interval:
+            return
+        self.last_emit = now
+
+        out_time_us = _parse_number(self.record.get(b'out_time_us', b'N/A'))
+        out_seconds = max(0.0, out_time_us / 1000000) if out_time_us is not None else 0.0
+        total_size = self.total_size
+        speed = _parse_number(self.record.get(b'speed', b'N/A'))
+        elapsed = now - self.started
+        bytes_per_second = total_size / elapsed if elapsed > 0 else 0.0
+
+        if finished:
+            percent = int(min((self.offset_seconds + out_seconds) / self.total_seconds, 1) * 100) if self.total_seconds > 0 else 100
+        elif self.total_seconds > 0:
+            percent = min(int((self.offset_seconds + out_seconds) / self.total_seconds * 100), 100)
+        else:
+            percent = 0
+        self.callback(ProgressInfo(percent, out_seconds, total_size, bytes_per_second, speed, finished))
+
+class CopyProgress:
+    def __init__(self, total_seconds, callback, interval=PROGRESS_INTERVAL, clock=time.monotonic):
+        self.total_seconds = total_seconds
+        self.callback = callback
+        self.interval = interval
+        self.clock = clock
+        self.started = clock()
+        self.last_emit = None
+
+    def update(self, out_seconds, total_size, finished=False):
+        now = self.clock()
+        if not finished and self.last_emit is not None and now - self.last_emit < self.interval:
+            return
+        self.last_emit = now
+        elapsed = now - self.started
+        bytes_per_second = total_size / elapsed if elapsed > 0 else 0.0
+        speed = out_seconds / elapsed if elapsed > 0 else None
+        percent = min(int(out_seconds / self.total_seconds * 100), 100) if self.total_seconds > 0 else 100
+        self.callback(ProgressInfo(percent, out_seconds, total_size, bytes_per_second, speed, finished))
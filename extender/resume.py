@@ -0,0 +1,97 @@
+import json
+import os
+
+SEGMENT_SECONDS = 600
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+def parts_dir(output_file):
+    return f"{output_file}.parts"
+
+def segment_loops(duration, segment_seconds=SEGMENT_SECONDS):
+    return max(1, int(segment_seconds // duration)) if duration > 0 else 1
+
+def plan_segments(repeat, tail, loops_per_segment):
+    segments = []
+    remaining = repeat
+    while remaining > 0:
+        loops = min(loops_per_segment, remaining)
+        remaining -= loops
+        segments.append({'loops': loops, 'tail': tail if remaining == 0 else None})
+    if not segments and tail is not None:
+        segments.append({'loops': 0, 'tail': tail})
+    return segments
+
+def source_fingerprint(input_file):
+    st = os.stat(input_file)
+    return {'path': os.path.abspath(input_file), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+class ResumeManifest:
+    """Records which segments of a resumable job are complete.
+
+    A segment only counts as complete once its file has been renamed into place and
+    the manifest rewritten, so a crash at any point leaves at most one partial segment.
+    """
+
+    def __init__(self, path, source, repeat, tail, loops_per_segment, ext):
+        self.path = path
+        self.source = source
+        self.repeat = repeat
+        self.tail = tail
+        self.loops_per_segment = loops_per_segment
+        self.ext = ext
+        self.segments = plan_segments(repeat, tail, loops_per_segment)
+        for i, segment in enumerate(self.segments):
+            segment['name'] = f"segment{i:05d}{ext}"
+            segment['size'] = None
+
+    @classmethod
+    def open(cls, directory, input_file, repeat, tail, loops_per_segment, ext):
+        path = os.path.join(directory, MANIFEST_NAME)
+        manifest = cls(path, source_fingerprint(input_file), repeat, tail, loops_per_segment, ext)
+        try:
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+
+        if saved.get('version') != MANIFEST_VERSION or saved.get('plan') != manifest.plan():
+            return manifest
+        for segment, previous in zip(manifest.segments, saved.get('segments', [])):
+            segment_path = os.path.join(directory, segment['name'])
+            if previous.get('size') is not None and os.path.exists(segment_path) and \
+                    os.path.getsize(segment_path) == previous['size']:
+                segment['size'] = previous['size']
+        return manifest
+
+    def plan(self):
+        return {
+            'source': self.source,
+            'repeat': self.repeat,
+            'tail': self.tail,
+            'loops_per_segment': self.loops_per_segment,
+        }
+
+    @property
+    def directory(self):
+        return os.path.dirname(self.path)
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, segment['name'])
+
+    def pending(self):
+        return [segment for segment in self.segments if segment['size'] is None]
+
+    def completed_loops(self):
+        return sum(segment['loops'] for segment in self.segments if segment['size'] is not None)
+
+    def mark_complete(self, segment):
+        segment['size'] = os.path.getsize(self.segment_path(segment))
+        self.save()
+
+    def save(self):
+        data = {'version': MANIFEST_VERSION, 'plan': self.plan(), 'segments': self.segments}
+        partial = f"{self.path}.partial"
+        with open(partial, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(partial, self.path)
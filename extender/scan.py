@@ -0,0 +1,38 @@
+import os
+
+from .engine import VIDEO_EXTENSIONS, is_output_path
+
+def is_video_file(path):
+    return os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS
+
+def is_output_dir(name):
+    """Folders the extender writes itself: resumable parts, playlists and their in-progress or replaced copies."""
+    if name.endswith(('.parts', '.partial', '.old')):
+        return True
+    stem, _, kind = name.rpartition('_')
+    return kind in ('hls', 'dash') and is_output_path(stem)
+
+def walk_directory(root, accept=is_video_file):
+    """Yields the files below root that `accept` takes, in name order, skipping output folders.
+
+    Every video is yielded by default, including hidden ones and ones named like outputs,
+    since a folder handed over explicitly is meant to be taken as it is.
+    """
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                entries = sorted(it, key=lambda entry: entry.name.lower())
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not is_output_dir(entry.name):
+                        subdirs.append(entry.path)
+                elif entry.is_file() and accept(entry.path):
+                    yield entry.path
+            except OSError:
+                continue
+        stack.extend(reversed(subdirs))
@@ -0,0 +1,124 @@
+import os
+import signal
+import threading
+import time
+
+MEGABYTE = 1024 * 1024
+
+def suspend_process(process):
+    if os.name == 'nt':
+        import ctypes
+        ctypes.windll.ntdll.NtSuspendProcess(int(process._handle))
+    else:
+        process.send_signal(signal.SIGSTOP)
+
+def resume_process(process):
+    if os.name == 'nt':
+        import ctypes
+        ctypes.windll.ntdll.NtResumeProcess(int(process._handle))
+    else:
+        process.send_signal(signal.SIGCONT)
+
+class TokenBucket:
+    """Write budget of `rate` bytes per second with up to one second of burst.
+
+    Callers may overdraw it; the balance then goes negative and consume() sleeps until it is
+    paid back, so concurrent writers share the rate instead of each getting it in full.
+    """
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.tokens = rate
+        self.updated = clock()
+
+    def reserve(self, amount):
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def consume(self, amount):
+        wait = self.reserve(amount)
+        if wait > 0:
+            self.sleep(wait)
+
+class QueuedJob:
+    def __init__(self, index, input_file, devices, output_device):
+        self.index = index
+        self.input_file = input_file
+        self.devices = devices
+        self.output_device = output_device
+
+class IoScheduler:
+    """Hands out queued jobs so that no device runs more than `per_device` of them at once.
+
+    A job counts against the device of its input and the device of its output folder. A job
+    whose devices are busy is passed over for a later one on another device rather than
+    holding up the queue. With a write limit, each output device gets its own token bucket.
+    """
+
+    def __init__(self, per_device=0, write_limit=0):
+        self.per_device = per_device
+        self.write_limit = write_limit
+        self.condition = threading.Condition()
+        self.active = {}
+        self.buckets = {}
+        self.device_cache = {}
+
+    def device(self, directory):
+        directory = os.path.abspath(directory)
+        with self.condition:
+            if directory in self.device_cache:
+                return self.device_cache[directory]
+        try:
+            device = os.stat(directory).st_dev
+        except OSError:
+            device = None
+        with self.condition:
+            self.device_cache[directory] = device
+        return device
+
+    def queue(self, index, input_file, output_dir=None):
+        source = self.device(os.path.dirname(os.path.abspath(input_file)))
+        target = self.device(output_dir) if output_dir else source
+        devices = tuple(device for device in {source, target} if device is not None)
+        return QueuedJob(index, input_file, devices, target)
+
+    def has_slot(self, job):
+        return self.per_device <= 0 or all(self.active.get(device, 0) < self.per_device for device in job.devices)
+
+    def take(self, pending, should_stop):
+        with self.condition:
+            while pending and not should_stop():
+                for i, job in enumerate(pending):
+                    if self.has_slot(job):
+                        del pending[i]
+                        for device in job.devices:
+                            self.active[device] = self.active.get(device, 0) + 1
+                        return job
+                self.condition.wait()
+            return None
+
+    def release(self, job):
+        with self.condition:
+            for device in job.devices:
+                self.active[device] -= 1
+            self.condition.notify_all()
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def bucket(self, device):
+        if self.write_limit <= 0:
+            return None
+        with self.condition:
+            bucket = self.buckets.get(device)
+            if bucket is None:
+                bucket = self.buckets[device] = TokenBucket(self.write_limit)
+            return bucket
@@ -0,0 +1,254 @@
+import os
+from fractions import Fraction
+
+from .errors import UnsupportedLayout
+from .keyframes import KeyframeIndex
+
+SEAM_VIDEO_ENCODERS = {
+    'h264': ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '16'],
+    'hevc': ['-c:v', 'libx265', '-preset', 'veryfast', '-crf', '18'],
+    'mpeg2video': ['-c:v', 'mpeg2video', '-q:v', '2'],
+    'mpeg1video': ['-c:v', 'mpeg1video', '-q:v', '2'],
+}
+SEAM_AUDIO_ENCODERS = {'aac': 'aac', 'mp3': 'libmp3lame', 'mp2': 'mp2', 'ac3': 'ac3'}
+# ffprobe profile names and the encoder profile that reproduces each. A profile that is reported
+# but missing here cannot be matched, so the input is not given a seam.
+SEAM_PROFILES = {
+    'h264': {'Constrained Baseline': 'baseline', 'Baseline': 'baseline', 'Main': 'main', 'High': 'high',
+             'High 10': 'high10', 'High 4:2:2': 'high422', 'High 4:4:4 Predictive': 'high444'},
+    'hevc': {'Main': 'main', 'Main 10': 'main10', 'Main Still Picture': 'mainstillpicture'},
+    'mpeg2video': {'4:2:2': '0', 'High': '1', 'Main': '4', 'Simple': '5'},
+}
+SEAM_PIX_FMTS = {
+    'h264': {'yuv420p', 'yuvj420p', 'yuv422p', 'yuvj422p', 'yuv444p', 'yuvj444p',
+             'yuv420p10le', 'yuv422p10le', 'yuv444p10le'},
+    'hevc': {'yuv420p', 'yuvj420p', 'yuv422p', 'yuv444p', 'yuv420p10le', 'yuv422p10le', 'yuv444p10le'},
+    'mpeg2video': {'yuv420p', 'yuv422p'},
+    'mpeg1video': {'yuv420p'},
+}
+# Sample entry tags that MP4 outputs keep from the source instead of the muxer's default.
+MP4_CODEC_TAGS = {'avc1', 'avc3', 'hvc1', 'hev1'}
+PIECE_PATTERN = 'piece%03d.ts'
+EPSILON = 1e-3
+
+class SeamPlan:
+    """Cut points of a seamless loop, in seconds from the start of the input.
+
+    The first GOP ends at head_end and the last GOP starts at body_end. Everything in between is
+    stream copied; the last GOP followed by the first is re-encoded once as the seam.
+    """
+
+    def __init__(self, duration, head_end, body_end, first_keyframe, frame_rate, min_gop, crossfade=0.0):
+        self.duration = duration
+        self.head_end = head_end
+        self.body_end = body_end
+        self.first_keyframe = first_keyframe
+        self.frame_rate = frame_rate
+        self.min_gop = min_gop
+        self.crossfade = crossfade
+
+    @property
+    def loop_seconds(self):
+        # A crossfade overlaps the end of one loop with the start of the next.
+        return self.duration - self.crossfade
+
+    @property
+    def seam_seconds(self):
+        return self.duration - self.body_end + self.head_end - self.crossfade
+
+    def cut_points(self, tail=None):
+        points = {self.head_end, self.body_end}
+        if tail is not None and self.head_end < tail < self.duration - EPSILON:
+            points.add(tail)
+        return sorted(points)
+
+    def split_frames(self, tail=None):
+        # The segment muxer splits at the first keyframe at or after a video frame count, taken in
+        # decode order. Reordered B-frames can put a keyframe a few frames early in that order,
+        # so each count is backed off by half the shortest GOP.
+        slack = max(1, int(self.min_gop * self.frame_rate) // 2)
+        return [max(1, round((point - self.first_keyframe) * self.frame_rate) - slack)
+                for point in self.cut_points(tail)]
+
+    def pieces_from(self, pieces, point, tail=None):
+        return pieces[self.cut_points(tail).index(point) + 1:]
+
+    def entries(self, pieces, seam, repeat, tail=None):
+        boundaries = [0.0] + self.cut_points(tail) + [self.duration]
+
+        def span(start, end):
+            return [piece for piece, a, b in zip(pieces, boundaries, boundaries[1:])
+                    if a >= start - EPSILON and b <= end + EPSILON]
+
+        body = span(self.head_end, self.body_end)
+        entries = span(0.0, self.head_end)
+        for _ in range(repeat if tail is not None else repeat - 1):
+            entries += body + [seam]
+        entries += span(self.head_end, self.duration if tail is None else tail)
+        return entries
+
+def plan_seam(info, crossfade=0.0):
+    if info.video_codec not in SEAM_VIDEO_ENCODERS:
+        raise UnsupportedLayout(f"no seam encoder for {info.video_codec or 'audio-only input'}")
+    if info.audio_codec is not None and info.audio_codec not in SEAM_AUDIO_ENCODERS:
+        raise UnsupportedLayout(f"no seam encoder for {info.audio_codec} audio")
+    seam_video_args(info)
+    rate = frame_rate(info)
+    if not rate:
+        raise UnsupportedLayout('unknown frame rate')
+    keyframes = KeyframeIndex([t - info.start_time for t in info.keyframes])
+    if len(keyframes) < 3:
+        raise UnsupportedLayout('too few keyframes to cut a seam')
+    head_end = keyframes.at_or_after(keyframes.times[0] + EPSILON)
+    body_end = keyframes.at_or_before(info.duration - EPSILON)
+    if head_end is None or body_end is None or body_end <= head_end:
+        raise UnsupportedLayout('too few keyframes to cut a seam')
+    if crossfade and crossfade >= min(head_end, info.duration - body_end):
+        raise UnsupportedLayout('crossfade is longer than the first or last GOP')
+    min_gop = min(b - a for a, b in zip(keyframes.times, keyframes.times[1:]))
+    return SeamPlan(info.duration, head_end, body_end, keyframes.times[0], rate, min_gop, crossfade)
+
+def video_stream(info):
+    return next((stream for stream in info.streams if stream.get('codec_type') == 'video'), {})
+
+def seam_video_args(info):
+    """Encoder arguments that give the seam the input's profile, level and pixel format.
+
+    A seam that decodes differently from the GOPs around it can make players reinitialise or
+    refuse the stream at each loop, so an input whose format cannot be reproduced is refused.
+    """
+    codec = info.video_codec
+    stream = video_stream(info)
+    args = list(SEAM_VIDEO_ENCODERS[codec])
+    pix_fmt = stream.get('pix_fmt')
+    if pix_fmt:
+        if pix_fmt not in SEAM_PIX_FMTS[codec]:
+            raise UnsupportedLayout(f"no seam encoder for {codec} in {pix_fmt}")
+        args += ['-pix_fmt', pix_fmt]
+    profile = stream.get('profile')
+    if profile and codec in SEAM_PROFILES:
+        if profile not in SEAM_PROFILES[codec]:
+            raise UnsupportedLayout(f"no seam encoder for the {codec} {profile} profile")
+        args += ['-profile:v', SEAM_PROFILES[codec][profile]]
+    level = stream.get('level')
+    if isinstance(level, int) and level > 0:
+        if codec == 'h264':
+            args += ['-level:v', '1b' if level == 9 else f"{level // 10}.{level % 10}"]
+        elif codec == 'hevc':
+            # ffprobe reports HEVC levels times 30, so 123 is level 4.1.
+            args += ['-x265-params', f"level-idc={level / 30:g}"]
+        elif codec == 'mpeg2video':
+            args += ['-level:v', str(level)]
+    return args
+
+def seam_tag_args(info, output_file):
+    # The output takes its sample entry from the first, stream-copied MPEG-TS piece, which has
+    # no tag, so an MP4 output would otherwise get the muxer's default (hev1 rather than hvc1).
+    ext = os.path.splitext(output_file)[1].lower()
+    tag = video_stream(info).get('codec_tag_string')
+    if ext in ('.mp4', '.m4v', '.mov') and tag in MP4_CODEC_TAGS:
+        return ['-tag:v', tag]
+    return []
+
+class PieceTiming:
+    """Where video and audio sit in a cut piece, in seconds.
+
+    `shift` is how far the video starts after the piece's first packet and `audio_lead` how far
+    the audio starts before the video. Cutting at a keyframe leaves the audio interleaved just
+    ahead of it in the piece that starts there, so that audio is missing from the piece before.
+    """
+
+    def __init__(self, info):
+        audio = next((stream for stream in info.streams if stream.get('codec_type') == 'audio'), None)
+        try:
+            video_start = float(video_stream(info)['start_time'])
+            self.length = float(video_stream(info)['duration'])
+            self.audio_lead = video_start - float(audio['start_time']) if audio is not None else 0.0
+        except (KeyError, TypeError, ValueError):
+            raise UnsupportedLayout('no video or audio timing in a seam piece')
+        self.shift = video_start - info.start_time
+
+def timed_entries(paths, timings):
+    # The concat demuxer starts each file where the previous one's duration ends, counted from
+    # the file's first packet. Each piece is given the duration that starts the next piece's
+    # video exactly where its own video ends.
+    entries = []
+    for i, path in enumerate(paths):
+        timing = timings[path]
+        next_shift = timings[paths[i + 1]].shift if i + 1 < len(paths) else timing.shift
+        entries.append((path, None, None, timing.length + timing.shift - next_shift))
+    return entries
+
+def frame_rate(info):
+    for stream in info.streams:
+        if stream.get('codec_type') == 'video':
+            try:
+                rate = Fraction(stream.get('r_frame_rate', '0/1'))
+            except (ValueError, ZeroDivisionError):
+                return None
+            return float(rate) if rate > 0 else None
+    return None
+
+def split_args(input_file, plan, info, out_dir, tail=None):
+    args = ['-i', input_file, '-map', '0:v:0']
+    if info.audio_codec is not None:
+        args += ['-map', '0:a:0']
+    return args + [
+        '-c', 'copy',
+        '-f', 'segment',
+        '-segment_format', 'mpegts',
+        '-segment_frames', ','.join(str(frames) for frames in plan.split_frames(tail)),
+        '-reset_timestamps', '1',
+        os.path.join(out_dir, PIECE_PATTERN),
+    ]
+
+def seam_args(input_file, plan, info, output_file, tail_lead=0.0, head_lead=0.0, tail_seconds=None):
+    """Arguments that encode the last GOP followed by the first as one MPEG-TS piece.
+
+    `tail_lead` and `head_lead` are the audio leads of the pieces starting at body_end and
+    head_end. The seam's audio starts that much before its video and stops short of head_end by
+    the next piece's lead, so the audio joins the stream-copied pieces on either side without
+    a gap or an overlap. Audio running past the last video frame, `tail_seconds` after body_end,
+    is dropped, and a crossfade starts that long after body_end less its own length. Video and audio are joined separately so that neither is padded to the other.
+    """
+    has_audio = info.audio_codec is not None
+    head_end = plan.head_end - EPSILON / 2
+    # The tail is reached with a fast seek. The head is trimmed inside the graph, because an
+    # input -t counts from the container's zero rather than the first video frame.
+    args = [
+        '-ss', f"{plan.body_end - EPSILON / 2:.6f}", '-i', input_file,
+        '-t', f"{plan.head_end + 1:.6f}", '-i', input_file,
+    ]
+    graph = [f"[1:v:0]trim=end={head_end:.6f}[hv]"]
+    if has_audio:
+        args += ['-ss', f"{plan.body_end - tail_lead:.6f}", '-i', input_file]
+        tail_trim = f"atrim=duration={tail_lead + tail_seconds:.6f}," if tail_seconds is not None else ''
+        graph.append(f"[2:a:0]{tail_trim}asetpts=PTS-STARTPTS[ta]")
+        graph.append(f"[1:a:0]atrim=end={plan.head_end - head_lead:.6f},asetpts=PTS-STARTPTS[ha]")
+    # Each part restarts at zero: the head keeps the container's offset, which would open a gap.
+    graph.append("[0:v:0]setpts=PTS-STARTPTS[tv]")
+    graph.append("[hv]setpts=PTS-STARTPTS[hv0]")
+    if plan.crossfade:
+        # The container can outlast the video by its audio, so the timed tail length is preferred.
+        tail_length = plan.duration - plan.body_end if tail_seconds is None else tail_seconds
+        offset = tail_length - plan.crossfade
+        graph.append(f"[tv][hv0]xfade=transition=fade:duration={plan.crossfade:.6f}:offset={offset:.6f}[sv]")
+        if has_audio:
+            graph.append(f"[ta][ha]acrossfade=d={plan.crossfade:.6f}[sa]")
+    else:
+        graph.append('[tv][hv0]concat=n=2:v=1:a=0[sv]')
+        if has_audio:
+            graph.append('[ta][ha]concat=n=2:v=0:a=1[sa]')
+    # Both streams start at zero; whichever the pieces around the seam start later is delayed.
+    graph.append(f"[sv]setpts=PTS+{max(tail_lead, 0):.6f}/TB[v]")
+    if has_audio:
+        graph.append(f"[sa]asetpts=PTS+{max(-tail_lead, 0):.6f}/TB[a]")
+    # Passthrough keeps the encoder from duplicating frames where audio starts before video.
+    args += ['-filter_complex', ';'.join(graph), '-map', '[v]', '-fps_mode', 'passthrough']
+    args += seam_video_args(info)
+    if has_audio:
+        args += ['-map', '[a]', '-c:a', SEAM_AUDIO_ENCODERS[info.audio_codec]]
+        bit_rate = next((s.get('bit_rate') for s in info.streams if s.get('codec_type') == 'audio'), None)
+        if bit_rate:
+            args += ['-b:a', str(bit_rate)]
+    return args + ['-f', 'mpegts', output_file]
@@ -0,0 +1,78 @@
+import sys
+import os
+import shutil
+import subprocess
+
+# Environment variables that point at specific binaries, checked after the bundled copies.
+FFMPEG_ENV = 'VIDEOEXTENDER_FFMPEG'
+FFPROBE_ENV = 'VIDEOEXTENDER_FFPROBE'
+
+def get_resource_path(relative_path):
+    if getattr(sys, 'frozen', False):
+        base_path = sys._MEIPASS
+    else:
+        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    return os.path.join(base_path, relative_path)
+
+def executable_name(name):
+    return f"{name}.exe" if os.name == 'nt' else name
+
+def find_binary(name, env_var):
+    """Bundled copy next to the app first, then the environment variable, then PATH.
+
+    Falls back to the bundled location so a missing binary is reported with a useful path.
+    """
+    bundled = get_resource_path(executable_name(name))
+    if os.path.isfile(bundled):
+        return bundled
+    configured = os.environ.get(env_var)
+    if configured and os.path.isfile(configured):
+        return configured
+    return shutil.which(name) or bundled
+
+def get_ffmpeg_path():
+    return find_binary('ffmpeg', FFMPEG_ENV), find_binary('ffprobe', FFPROBE_ENV)
+
+def creation_flags():
+    return getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
+def binary_stamp(path):
+    """Identifies one build of a binary; it changes when the file is replaced or updated."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}"
+
+def parse_formats(output):
+    # `ffmpeg -muxers` lists " E  name  Description" rows below a "--" separator line.
+    names = set()
+    listing = False
+    for line in output.splitlines():
+        if line.strip() == '--':
+            listing = True
+            continue
+        parts = line.split()
+        if listing and len(parts) >= 2:
+            names.update(parts[1].split(','))
+    return names
+
+def probe_capabilities(ffmpeg_path):
+    """Version line and muxer/demuxer names of an ffmpeg build, or None if it does not run."""
+    def run(*args):
+        result = subprocess.run([ffmpeg_path, '-hide_banner', *args], capture_output=True, text=True,
+                                errors='replace', timeout=30, creationflags=creation_flags())
+        return result.stdout
+
+    try:
+        version = run('-version').splitlines()
+        return {
+            'version': version[0] if version else '',
+            'muxers': sorted(parse_formats(run('-muxers'))),
+            'demuxers': sorted(parse_formats(run('-demuxers'))),
+        }
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+FFMPEG_PATH, FFPROBE_PATH = get_ffmpeg_path()
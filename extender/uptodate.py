@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+import time
+
+INDEX_NAME = '.videoextender.json'
+INDEX_VERSION = 1
+# Records are written out at most this often while a batch runs, and in full by flush().
+FLUSH_SECONDS = 5.0
+
+def partial_path(path):
+    name, ext = os.path.splitext(path)
+    return f"{name}.partial{ext}"
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+class OutputIndex:
+    """Remembers which input version and settings produced each output, one index file per output folder.
+
+    A job is up to date when every recorded output still has the size and mtime it was written
+    with, and the input and parameters are unchanged, so checking a batch costs only stat calls.
+    Records are kept in memory and written per folder every FLUSH_SECONDS; call flush() when a
+    batch ends so the last ones are saved.
+    """
+
+    def __init__(self, flush_seconds=FLUSH_SECONDS, clock=time.monotonic):
+        self.lock = threading.Lock()
+        self.indexes = {}
+        self.dirty = set()
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        self.flushed_at = clock()
+
+    def load(self, directory):
+        index = self.indexes.get(directory)
+        if index is None:
+            try:
+                with open(os.path.join(directory, INDEX_NAME), encoding='utf-8') as f:
+                    data = json.load(f)
+                index = data.get('outputs', {}) if data.get('version') == INDEX_VERSION else {}
+            except (OSError, ValueError):
+                index = {}
+            self.indexes[directory] = index
+        return index
+
+    def lookup(self, input_file, output_file, params):
+        directory, key = os.path.split(os.path.abspath(output_file))
+        with self.lock:
+            entry = self.load(directory).get(key)
+        if entry is None or entry.get('params') != params:
+            return None
+        if entry.get('input') != os.path.abspath(input_file) or entry.get('input_signature') != file_signature(input_file):
+            return None
+        outputs = entry.get('outputs', {})
+        for relative, signature in outputs.items():
+            if file_signature(os.path.join(directory, relative)) != signature:
+                return None
+        return os.path.join(directory, entry['primary']) if outputs else None
+
+    def record(self, input_file, output_file, params, outputs):
+        directory, key = os.path.split(os.path.abspath(output_file))
+        entry = {
+            'input': os.path.abspath(input_file),
+            'input_signature': file_signature(input_file),
+            'params': params,
+            'primary': os.path.relpath(outputs[0], directory),
+            'outputs': {os.path.relpath(path, directory): file_signature(path) for path in outputs},
+        }
+        with self.lock:
+            self.load(directory)[key] = entry
+            self.dirty.add(directory)
+            if self.clock() - self.flushed_at >= self.flush_seconds:
+                self.write_dirty()
+
+    def flush(self):
+        with self.lock:
+            self.write_dirty()
+
+    def write_dirty(self):
+        for directory in sorted(self.dirty):
+            path = os.path.join(directory, INDEX_NAME)
+            partial = f"{path}.partial"
+            with open(partial, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'outputs': self.indexes[directory]}, f, indent=1)
+            os.replace(partial, path)
+        self.dirty.clear()
+        self.flushed_at = self.clock()
+
+    def forget(self, output_file):
+        directory, key = os.path.split(os.path.abspath(output_file))
+        with self.lock:
+            self.load(directory).pop(key, None)
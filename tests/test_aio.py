@@ -0,0 +1,103 @@
+import asyncio
+import os
+import stat
+
+import pytest
+
+from extender import aio
+from extender.engine import ExtendOptions
+from extender.probe_cache import MediaInfo
+
+# Stands in for ffmpeg: creates every partial output it is given, records its pid, then hangs.
+FAKE_FFMPEG = """#!/bin/sh
+for arg; do
+    case "$arg" in *.partial.*) : > "$arg" ;; esac
+done
+echo $$ > "$0.$$.tmp" && mv "$0.$$.tmp" "$0.$$.pid"
+echo progress=continue
+exec sleep 60
+"""
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason='the fake ffmpeg is a shell script')
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    ffmpeg = os.path.join(tmp_path, 'ffmpeg')
+    with open(ffmpeg, 'w') as f:
+        f.write(FAKE_FFMPEG)
+    os.chmod(ffmpeg, os.stat(ffmpeg).st_mode | stat.S_IXUSR)
+    concat_files = []
+
+    def write_concat_file(entries):
+        concat_files.append(real_write_concat_file(entries))
+        return concat_files[-1]
+
+    async def probe(input_file, ffprobe_path=None, probe_cache=None, keyframes=False):
+        return MediaInfo(10.0, streams=[{'codec_type': 'video', 'codec_name': 'h264'}], keyframes=[0.0])
+
+    real_write_concat_file = aio.write_concat_file
+    monkeypatch.setattr(aio, 'write_concat_file', write_concat_file)
+    monkeypatch.setattr(aio, 'probe', probe)
+    monkeypatch.setattr(aio, 'ProbeCache', lambda: None)
+    inputs = []
+    for name in ('a.mp4', 'b.mp4'):
+        inputs.append(os.path.join(tmp_path, name))
+        open(inputs[-1], 'wb').close()
+    return ExtendOptions(times=3, ffmpeg_path=ffmpeg), inputs, concat_files
+
+async def running_pids(options, count):
+    """Waits until `count` fake ffmpeg processes have started and returns their pids."""
+    directory = os.path.dirname(options.ffmpeg_path)
+    while True:
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.pid')]
+        if len(paths) == count:
+            break
+        await asyncio.sleep(0.01)
+    pids = []
+    for path in paths:
+        with open(path) as f:
+            pids.append(int(f.read()))
+    return pids
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+def leftovers(tmp_path, concat_files):
+    partials = [name for name in os.listdir(tmp_path) if '.partial.' in name or '_3times' in name]
+    return partials + [path for path in concat_files if os.path.exists(path)]
+
+def test_cancelling_extend_stops_ffmpeg_and_removes_partials(tmp_path, setup):
+    options, inputs, concat_files = setup
+
+    async def main():
+        task = asyncio.ensure_future(aio.extend(inputs[0], options=options))
+        pids = await running_pids(options, 1)
+        assert [name for name in os.listdir(tmp_path) if '.partial.' in name]
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return pids
+
+    pids = asyncio.run(main())
+    assert not any(is_running(pid) for pid in pids)
+    assert leftovers(tmp_path, concat_files) == []
+
+def test_closing_a_batch_cancels_every_job(tmp_path, setup):
+    options, inputs, concat_files = setup
+
+    async def main():
+        batch = aio.extend_batch(inputs, options=options, jobs=2)
+        started = [await batch.__anext__(), await batch.__anext__()]
+        assert {event.event for event in started} == {'started'}
+        pids = await running_pids(options, 2)
+        await batch.aclose()
+        return pids
+
+    pids = asyncio.run(main())
+    assert len(pids) == 2
+    assert not any(is_running(pid) for pid in pids)
+    assert leftovers(tmp_path, concat_files) == []
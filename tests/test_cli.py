@@ -0,0 +1,29 @@
+import argparse
+import os
+
+import pytest
+
+from extender.cli import build_parser, check_target, expand_inputs, parse_targets
+
+def test_targets_parse_durations_and_repeats():
+    assert parse_targets('1h, 90m,3H30M,10x,4times') == [(1, 0, 0), (1, 30, 0), (3, 30, 0), (0, 0, 10), (0, 0, 4)]
+
+@pytest.mark.parametrize('text', ['', '1h,', 'ten', '1h10x', '0h', '0x', '1.5h'])
+def test_invalid_targets_are_rejected(text):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_targets(text)
+
+def test_a_target_is_required():
+    parser = build_parser()
+    with pytest.raises(SystemExit):
+        check_target(parser, parser.parse_args(['clip.mp4']))
+    check_target(parser, parser.parse_args(['clip.mp4', '--targets', '1h,2h']))
+
+def test_inputs_are_expanded_once(tmp_path):
+    for name in ('b.mp4', 'a.mp4'):
+        open(os.path.join(tmp_path, name), 'wb').close()
+    pattern = os.path.join(tmp_path, '*.mp4')
+    a = os.path.join(tmp_path, 'a.mp4')
+    b = os.path.join(tmp_path, 'b.mp4')
+    missing = os.path.join(tmp_path, 'missing.mp4')
+    assert expand_inputs([pattern, a, missing]) == [a, b]
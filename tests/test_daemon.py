@@ -0,0 +1,97 @@
+import os
+
+from extender.daemon import Debouncer, JobQueue, is_candidate, retry_delay
+
+TARGET = {'hours': 1, 'minutes': 0, 'times': 0}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def write(path, data=b'data'):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def test_candidates_skip_outputs_and_hidden_files():
+    assert is_candidate(os.path.join('drop', 'clip.mp4'))
+    assert not is_candidate(os.path.join('drop', '.clip.mp4'))
+    assert not is_candidate(os.path.join('drop', 'notes.txt'))
+    assert not is_candidate(os.path.join('drop', 'clip_1h.mp4'))
+
+def test_debouncer_waits_for_files_to_settle(tmp_path):
+    clock = FakeClock()
+    debouncer = Debouncer(5, clock)
+    path = write(os.path.join(tmp_path, 'clip.mp4'))
+    debouncer.touch(path)
+    assert debouncer.ready() == []
+    clock.now = 4
+    assert debouncer.ready() == []
+
+    # A write restarts the wait.
+    write(path, b'more data')
+    os.utime(path, ns=(0, 1))
+    clock.now = 6
+    assert debouncer.ready() == []
+    clock.now = 11
+    stat = os.stat(path)
+    assert debouncer.ready() == [(path, stat.st_size, stat.st_mtime_ns)]
+    assert not debouncer.pending
+
+def test_debouncer_drops_deleted_and_holds_empty_files(tmp_path):
+    clock = FakeClock()
+    debouncer = Debouncer(5, clock)
+    gone = write(os.path.join(tmp_path, 'gone.mp4'))
+    empty = write(os.path.join(tmp_path, 'empty.mp4'), b'')
+    debouncer.touch(gone)
+    debouncer.touch(empty)
+    os.remove(gone)
+    debouncer.ready()
+    clock.now = 10
+    assert debouncer.ready() == []
+    assert list(debouncer.pending) == [empty]
+
+def test_retry_delay_backs_off_to_a_limit():
+    assert [retry_delay(attempts, 30, 200) for attempts in range(6)] == [30, 30, 60, 120, 200, 200]
+
+def test_each_file_version_is_queued_once():
+    queue = JobQueue(':memory:')
+    assert queue.enqueue('clip.mp4', 10, 1, TARGET)
+    assert not queue.enqueue('clip.mp4', 10, 1, TARGET)
+    assert queue.enqueue('clip.mp4', 12, 2, TARGET)
+    assert queue.enqueue('clip.mp4', 12, 2, dict(TARGET, hours=2))
+    assert queue.counts() == {'pending': 3}
+
+def test_failed_jobs_are_retried_then_given_up():
+    queue = JobQueue(':memory:', max_attempts=2)
+    queue.enqueue('clip.mp4', 10, 1, TARGET)
+    [job] = queue.claim()
+    assert job['path'] == os.path.abspath('clip.mp4') and job['target'] == TARGET
+    assert queue.claim() == []
+    assert queue.fail(job['id'], 'boom') == 'pending'
+    # The retry is not due until its back-off has passed.
+    assert queue.claim() == []
+    assert queue.next_due() > 0
+    queue.connection.execute('UPDATE jobs SET next_attempt = 0')
+    [job] = queue.claim()
+    assert job['attempts'] == 1
+    assert queue.fail(job['id'], 'boom') == 'failed'
+    assert queue.counts() == {'failed': 1}
+
+def test_interrupted_jobs_run_again(tmp_path):
+    path = os.path.join(tmp_path, 'queue.sqlite')
+    queue = JobQueue(path)
+    queue.enqueue('a.mp4', 10, 1, TARGET)
+    queue.enqueue('b.mp4', 10, 1, TARGET)
+    first, second = queue.claim(2)
+    queue.complete(first['id'], 'a_1h.mp4')
+    queue.close()
+
+    # The second job was left running, as if the daemon had died.
+    queue = JobQueue(path)
+    assert queue.counts() == {'done': 1, 'pending': 1}
+    assert [job['id'] for job in queue.claim(2)] == [second['id']]
+    queue.close()
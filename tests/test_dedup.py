@@ -0,0 +1,71 @@
+import os
+
+from extender.dedup import SAMPLE_BLOCK_SIZE, ContentStore, sampled_fingerprint
+
+PARAMS = {'hours': 1, 'minutes': 0, 'times': 0}
+SIZE = 4 * SAMPLE_BLOCK_SIZE
+# A byte between the head and middle blocks, which the sampled fingerprint never reads.
+UNSAMPLED = SAMPLE_BLOCK_SIZE + 100
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def content(seed=1):
+    return bytes((i * seed) % 251 for i in range(SIZE))
+
+def changed_at(data, offset):
+    return data[:offset] + bytes(((data[offset] + 1) % 256,)) + data[offset + 1:]
+
+def test_fingerprint_samples_size_and_blocks(tmp_path):
+    data = content()
+    base = sampled_fingerprint(write(os.path.join(tmp_path, 'a.mp4'), data))
+    assert sampled_fingerprint(write(os.path.join(tmp_path, 'b.mp4'), data)) == base
+    assert sampled_fingerprint(write(os.path.join(tmp_path, 'c.mp4'), changed_at(data, UNSAMPLED))) == base
+    assert sampled_fingerprint(write(os.path.join(tmp_path, 'd.mp4'), changed_at(data, 0))) != base
+    assert sampled_fingerprint(write(os.path.join(tmp_path, 'e.mp4'), data + b'x')) != base
+
+def record(store, tmp_path, data):
+    source = write(os.path.join(tmp_path, 'source.mp4'), data)
+    output = write(os.path.join(tmp_path, 'source_1h.mp4'), b'output')
+    store.record_result(source, store.fingerprint(source), PARAMS, output)
+    return output
+
+def test_identical_content_reuses_the_output(tmp_path):
+    store = ContentStore(':memory:')
+    output = record(store, tmp_path, content())
+    copy = write(os.path.join(tmp_path, 'copy.mp4'), content())
+    sample = store.fingerprint(copy)
+    assert store.find_result(copy, sample, PARAMS, os.path.join(tmp_path, 'copy_1h.mp4')) == output
+    assert store.find_result(copy, sample, dict(PARAMS, hours=2), os.path.join(tmp_path, 'copy_2h.mp4')) is None
+    # An output in another container is not a duplicate, nor is the output being written.
+    assert store.find_result(copy, sample, PARAMS, os.path.join(tmp_path, 'copy_1h.mkv')) is None
+    assert store.find_result(copy, sample, PARAMS, output) is None
+
+def test_matching_samples_are_confirmed_by_full_hash(tmp_path):
+    store = ContentStore(':memory:')
+    record(store, tmp_path, content())
+    other = write(os.path.join(tmp_path, 'other.mp4'), changed_at(content(), UNSAMPLED))
+    sample = store.fingerprint(other)
+    assert sample == store.fingerprint(os.path.join(tmp_path, 'source.mp4'))
+    assert store.find_result(other, sample, PARAMS, os.path.join(tmp_path, 'other_1h.mp4')) is None
+
+def test_changed_output_is_not_reused(tmp_path):
+    store = ContentStore(':memory:')
+    output = record(store, tmp_path, content())
+    write(output, b'truncated')
+    copy = write(os.path.join(tmp_path, 'copy.mp4'), content())
+    assert store.find_result(copy, store.fingerprint(copy), PARAMS, os.path.join(tmp_path, 'copy_1h.mp4')) is None
+
+def test_hashes_are_cached_until_the_file_changes(tmp_path):
+    store = ContentStore(os.path.join(tmp_path, 'content.sqlite'))
+    path = write(os.path.join(tmp_path, 'a.mp4'), content())
+    digest = store.full_hash(path)
+    store.connection.execute("UPDATE files SET full = 'cached'")
+    assert store.full_hash(path) == 'cached'
+    write(path, content(3))
+    os.utime(path, ns=(0, 1))
+    assert store.full_hash(path) not in ('cached', digest)
+    assert store.full_hash(os.path.join(tmp_path, 'missing.mp4')) is None
+    store.close()
@@ -0,0 +1,45 @@
+import pytest
+
+from extender.engine import ExtendOptions
+from extender.keyframes import KeyframeIndex, plan_loops
+
+KEYFRAMES = [0.0, 2.0, 4.0, 6.0, 8.0]
+
+def test_index_lookups():
+    index = KeyframeIndex([4.0, 0.0, 2.0])
+    assert index.times == [0.0, 2.0, 4.0]
+    assert index.at_or_after(2.0) == 2.0
+    assert index.at_or_after(2.1) == 4.0
+    assert index.at_or_after(4.1) is None
+    assert index.at_or_before(1.9) == 0.0
+    assert index.at_or_before(-1) is None
+
+def test_times_ignore_keyframes():
+    assert plan_loops(10.0, KEYFRAMES, 1, 0, 7) == (7, None)
+
+def test_tail_ends_at_first_keyframe_after_remainder():
+    # 60 s is four 13.5 s loops and 6 s; the tail runs to the keyframe at 6 s, never short of the target.
+    assert plan_loops(13.5, KEYFRAMES, 0, 1, 0) == (4, 6.0)
+    # Four 13.2 s loops leave 7.2 s, so the tail runs on to the keyframe at 8 s.
+    assert plan_loops(13.2, KEYFRAMES, 0, 1, 0) == (4, 8.0)
+
+def test_tail_respects_start_time():
+    keyframes = [t + 1.4 for t in KEYFRAMES]
+    assert plan_loops(13.0, keyframes, 0, 1, 0, start_time=1.4) == (4, pytest.approx(8.0))
+
+def test_whole_loops_round_up():
+    assert plan_loops(13.0, KEYFRAMES, 0, 1, 0, exact=False) == (5, None)
+    assert plan_loops(13.0, [], 0, 1, 0) == (5, None)
+    assert plan_loops(13.0, None, 0, 1, 0) == (5, None)
+
+def test_exact_multiple_has_no_tail():
+    assert plan_loops(10.0, KEYFRAMES, 0, 1, 0) == (6, None)
+
+def test_no_keyframe_after_remainder_adds_a_loop():
+    # 60 s is four loops and 8 s of 13 s; past the last keyframe, a whole loop is added instead.
+    assert plan_loops(13.0, [0.0, 2.0, 4.0, 6.0], 0, 1, 0) == (5, None)
+
+def test_empty_target_is_rejected():
+    with pytest.raises(ValueError):
+        ExtendOptions(0, 0, 0)
+    assert ExtendOptions(targets=[(0, 30, 0)]).target_list() == [(0, 30, 0)]
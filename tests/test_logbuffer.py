@@ -0,0 +1,43 @@
+import os
+
+from extender.logbuffer import ERROR, INFO, WARNING, LogBuffer, severity
+
+def test_severity_follows_the_message_prefix():
+    assert severity('❌ Failed: clip.mp4') == ERROR
+    assert severity('  Error: no ffmpeg') == ERROR
+    assert severity('⚠️ Skipped clip.mp4') == WARNING
+    assert severity('✅ Done') == INFO
+    assert severity('') == INFO
+
+def test_filtered_keeps_messages_at_or_above_severity():
+    buffer = LogBuffer()
+    for message in ('✅ Done', '⚠️ Skipped', '❌ Failed'):
+        buffer.add(message)
+    assert buffer.filtered(INFO) == ['✅ Done', '⚠️ Skipped', '❌ Failed']
+    assert buffer.filtered(WARNING) == ['⚠️ Skipped', '❌ Failed']
+    assert buffer.filtered(ERROR) == ['❌ Failed']
+
+def test_history_and_pending_are_bounded():
+    buffer = LogBuffer(capacity=3)
+    for i in range(5):
+        buffer.add(f'line {i}')
+    assert buffer.filtered(INFO) == ['line 2', 'line 3', 'line 4']
+    assert buffer.take_pending() == [(INFO, 'line 2'), (INFO, 'line 3'), (INFO, 'line 4')]
+    assert buffer.take_pending() == []
+    buffer.add('❌ line 5')
+    buffer.clear()
+    assert buffer.filtered(INFO) == [] and buffer.take_pending() == []
+
+def test_spill_file_keeps_the_full_history(tmp_path):
+    path = os.path.join(tmp_path, 'logs', 'session.log')
+    buffer = LogBuffer(capacity=2)
+    assert buffer.start_spill(path) == path
+    for i in range(4):
+        buffer.add(f'line {i}')
+    buffer.take_pending()
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == 'line 0\nline 1\nline 2\nline 3\n'
+    buffer.stop_spill()
+    buffer.add('not spilled')
+    with open(path, encoding='utf-8') as f:
+        assert 'not spilled' not in f.read()
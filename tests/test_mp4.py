@@ -0,0 +1,210 @@
+import os
+import struct
+from fractions import Fraction
+
+import pytest
+
+from extender import mp4
+from extender.errors import UnsupportedLayout
+from extender.mp4 import Mp4Source, extend_mp4, keyframe_cut
+
+def box(box_type, payload):
+    return struct.pack('>I4s', len(payload) + 8, box_type) + payload
+
+def full_box(box_type, payload, version=0, flags=0):
+    return box(box_type, struct.pack('>I', (version << 24) | flags) + payload)
+
+def runs_of(values):
+    runs = []
+    for value in values:
+        if runs and runs[-1][1] == value:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, value])
+    return runs
+
+def table(box_type, rows, fmt):
+    return full_box(box_type, struct.pack('>I', len(rows)) + b''.join(struct.pack(fmt, *row) for row in rows))
+
+def sample_bytes(track, index, size):
+    seed = struct.pack('>HI', track, index)
+    return (seed * (size // len(seed) + 1))[:size]
+
+class TrackSpec:
+    def __init__(self, handler, timescale, sizes, deltas, chunks, ctts=None, sync=None, groups=None):
+        self.handler = handler
+        self.timescale = timescale
+        self.sizes = sizes
+        self.deltas = deltas
+        self.chunks = chunks
+        self.ctts = ctts
+        self.sync = sync
+        self.groups = groups
+
+    def first_samples(self):
+        firsts = []
+        sample = 0
+        for count in self.chunks:
+            firsts.append(sample)
+            sample += count
+        return firsts
+
+def build_trak(number, spec, offsets):
+    stsc = []
+    for i, count in enumerate(spec.chunks):
+        if not stsc or stsc[-1][1] != count:
+            stsc.append((i + 1, count, 1))
+    stbl = [
+        full_box(b'stsd', struct.pack('>I', 0)),
+        table(b'stts', runs_of(spec.deltas), '>II'),
+    ]
+    if spec.ctts is not None:
+        stbl.append(table(b'ctts', runs_of(spec.ctts), '>Ii'))
+    if spec.sync is not None:
+        stbl.append(full_box(b'stss', struct.pack('>I', len(spec.sync)) +
+                             b''.join(struct.pack('>I', n) for n in spec.sync)))
+    stbl += [
+        table(b'stsc', stsc, '>III'),
+        full_box(b'stsz', struct.pack('>II', 0, len(spec.sizes)) + b''.join(struct.pack('>I', s) for s in spec.sizes)),
+        full_box(b'stco', struct.pack('>I', len(offsets)) + b''.join(struct.pack('>I', o) for o in offsets)),
+    ]
+    if spec.groups is not None:
+        stbl.append(full_box(b'sbgp', b'roll' + struct.pack('>I', len(spec.groups)) +
+                             b''.join(struct.pack('>II', *run) for run in spec.groups)))
+    duration = sum(spec.deltas)
+    mdia = [
+        full_box(b'mdhd', struct.pack('>IIIIHH', 0, 0, spec.timescale, duration, 0x55c4, 0)),
+        full_box(b'hdlr', struct.pack('>I4s12x', 0, spec.handler) + b'test\x00'),
+        box(b'minf', box(b'stbl', b''.join(stbl))),
+    ]
+    tkhd = full_box(b'tkhd', struct.pack('>IIIII', 0, 0, number, 0, duration) + bytes(60), flags=3)
+    return box(b'trak', tkhd + box(b'mdia', b''.join(mdia)))
+
+def write_mp4(path, specs):
+    """Writes an MP4 with interleaved chunks whose samples are tagged with their track and index."""
+    ftyp = box(b'ftyp', b'isom' + struct.pack('>I', 512) + b'isomiso2mp41')
+    layout = []
+    for chunk in range(max(len(spec.chunks) for spec in specs)):
+        for t, spec in enumerate(specs):
+            if chunk < len(spec.chunks):
+                layout.append((t, chunk))
+
+    def moov_for(data_start):
+        offsets = [[] for _ in specs]
+        position = data_start
+        for t, chunk in layout:
+            spec = specs[t]
+            offsets[t].append(position)
+            first = spec.first_samples()[chunk]
+            position += sum(spec.sizes[first:first + spec.chunks[chunk]])
+        mvhd = full_box(b'mvhd', struct.pack('>IIII', 0, 0, 1000, 0) + bytes(76) + struct.pack('>I', len(specs) + 1))
+        return box(b'moov', mvhd + b''.join(build_trak(t + 1, spec, offsets[t]) for t, spec in enumerate(specs)))
+
+    data_start = len(ftyp) + len(moov_for(0)) + 8
+    data = bytearray()
+    for t, chunk in layout:
+        spec = specs[t]
+        first = spec.first_samples()[chunk]
+        for index in range(first, first + spec.chunks[chunk]):
+            data += sample_bytes(t, index, spec.sizes[index])
+    with open(path, 'wb') as f:
+        f.write(ftyp + moov_for(data_start) + box(b'mdat', bytes(data)))
+
+def read_samples(path):
+    source = Mp4Source(path)
+    tracks = []
+    with open(path, 'rb') as f:
+        for track in source.tracks:
+            samples = []
+            for chunk, offset in enumerate(track.offsets):
+                f.seek(offset)
+                first = track.chunk_first_sample[chunk]
+                for index in range(first, first + track.chunk_samples[chunk]):
+                    samples.append(f.read(track.sample_byte_size(index)))
+            tracks.append((track, samples))
+    return source, tracks
+
+def expand(runs):
+    values = []
+    for run in runs:
+        values += [run[1:]] * run[0]
+    return values
+
+def video_spec(groups=None):
+    count = 30
+    return TrackSpec(b'vide', 1000, [100 + (i * 37) % 200 for i in range(count)], [40] * count, [5] * 6,
+                     ctts=[40 if i % 5 == 0 else (80 if i % 2 else 0) for i in range(count)],
+                     sync=[1, 6, 11, 16, 21, 26], groups=groups)
+
+def audio_spec():
+    count = 56
+    return TrackSpec(b'soun', 48000, [20 + i % 7 for i in range(count)], [1024] * count, [10] * 5 + [6])
+
+@pytest.mark.parametrize('specs', [
+    pytest.param(lambda: [video_spec()], id='one-track'),
+    pytest.param(lambda: [video_spec([(10, 1), (2, 0)]), audio_spec()], id='two-tracks'),
+])
+@pytest.mark.parametrize('repeat, tail', [(3, None), (2, 0.9), (0, 1.0), (1, 0.5)])
+def test_extend_round_trip(tmp_path, specs, repeat, tail):
+    input_file = os.path.join(tmp_path, 'in.mp4')
+    output_file = os.path.join(tmp_path, 'out.mp4')
+    specs = specs()
+    write_mp4(input_file, specs)
+    source, source_tracks = read_samples(input_file)
+    plans, _ = source.plan(repeat, tail)
+
+    assert extend_mp4(input_file, output_file, repeat, tail)
+    _, output_tracks = read_samples(output_file)
+
+    for spec, (track, samples), (out_track, out_samples) in zip(specs, source_tracks, output_tracks):
+        tail_samples = plans[id(track)][-1].samples if tail is not None else 0
+        expected = samples * repeat + samples[:tail_samples]
+        assert out_track.sample_count == len(expected)
+        assert out_samples == expected
+
+        assert sum(count for count, _ in out_track.stts) == out_track.sample_count
+        span = sum(plan.span for plan in plans[id(track)])
+        assert out_track.media_duration == round(span * track.timescale)
+        if track.ctts is not None:
+            offsets = list(track.composition_offsets())
+            assert list(out_track.composition_offsets()) == offsets * repeat + offsets[:tail_samples]
+        assert sum(out_track.chunk_samples) == out_track.sample_count
+        assert len(out_track.offsets) == sum(plan.chunks for plan in plans[id(track)])
+        if spec.groups is not None:
+            # Samples past the source's last run are in no group (index 0) in every loop.
+            groups = expand(spec.groups)
+            groups += [(0,)] * (len(samples) - len(groups))
+            (_, out_groups), = out_track.sbgp
+            assert expand(out_groups) == groups * repeat + groups[:tail_samples]
+
+def test_keyframe_tail_cut(tmp_path):
+    input_file = os.path.join(tmp_path, 'in.mp4')
+    write_mp4(input_file, [video_spec(), audio_spec()])
+    source = Mp4Source(input_file)
+    video = source.video_track()
+
+    # Sync samples present at 0.44s and 0.64s; the tail runs to the first at or after the target.
+    assert keyframe_cut(video, 0.44) == Fraction(2, 5)
+    assert keyframe_cut(video, 0.45) == Fraction(3, 5)
+    plans, _ = source.plan(1, 0.45)
+    assert [plans[id(track)][-1].samples for track in source.tracks] == [15, 29]
+
+def test_uncovered_sample_groups_are_padded(tmp_path):
+    input_file = os.path.join(tmp_path, 'in.mp4')
+    write_mp4(input_file, [video_spec([(10, 1), (2, 0)])])
+    (_, runs), = Mp4Source(input_file).video_track().sbgp
+    assert sum(count for count, _ in runs) == 30
+    assert runs[-1] == (18, 0)
+
+def test_moov_errors_are_unsupported(tmp_path, monkeypatch):
+    input_file = os.path.join(tmp_path, 'in.mp4')
+    output_file = os.path.join(tmp_path, 'out.mp4')
+    write_mp4(input_file, [video_spec()])
+
+    def fail(self, plans, loop_lengths, data_offset):
+        raise struct.error('bad layout')
+
+    monkeypatch.setattr(mp4.Mp4Source, 'build_moov', fail)
+    with pytest.raises(UnsupportedLayout):
+        extend_mp4(input_file, output_file, 2)
+    assert not os.path.exists(output_file)
@@ -0,0 +1,198 @@
+import os
+import struct
+
+import pytest
+
+from extender import packetized
+from extender.errors import UnsupportedLayout
+from extender.packetized import (ATS_WRAP, PROGRAM_END_CODE, TIMESTAMP_WRAP, decode_pcr, decode_scr,
+                                 decode_timestamp, encode_pcr, encode_scr, encode_timestamp, extend_packetized)
+
+VIDEO_PID = 0x100
+AUDIO_PID = 0x101
+FRAMES = 10
+FRAME_TICKS = 3600
+AUDIO_TICKS = 1800
+FIRST_PTS = 90000
+# One loop of the stream spans this many 90 kHz ticks in every stream.
+PERIOD = FRAMES * FRAME_TICKS
+
+def timestamp(prefix, value):
+    return encode_timestamp(bytes((prefix,)), value)
+
+def pes(stream_id, pts, dts=None, payload=b'', length=True):
+    if dts is None:
+        header = b'\x80\x80\x05' + timestamp(0x21, pts)
+    else:
+        header = b'\x80\xc0\x0a' + timestamp(0x31, pts) + timestamp(0x11, dts)
+    body = header + payload
+    return b'\x00\x00\x01' + bytes((stream_id,)) + struct.pack('>H', len(body) if length else 0) + body
+
+def ts_packet(pid, cc, payload, start=False, pcr=None, random_access=False):
+    adaptation = b''
+    if pcr is not None or random_access or len(payload) < 184:
+        flags = (0x40 if random_access else 0) | (0x10 if pcr is not None else 0)
+        fields = bytes((flags,))
+        if pcr is not None:
+            fields += encode_pcr(b'\x00\x00\x00\x00\x7e\x00', pcr)
+        stuffing = 183 - len(payload) - len(fields)
+        assert stuffing >= 0
+        adaptation = bytes((183 - len(payload),)) + fields + b'\xff' * stuffing
+    afc = 0x30 if adaptation else 0x10
+    header = bytes((0x47, (0x40 if start else 0) | pid >> 8, pid & 0xFF, afc | cc))
+    packet = header + adaptation + payload
+    assert len(packet) == 188
+    return packet
+
+def write_ts(path, packet_size=188):
+    """Writes one PERIOD of video, two packets per frame, and audio at twice the frame rate."""
+    packets = []
+    counters = {VIDEO_PID: 0, AUDIO_PID: 0}
+
+    def add(pid, payload, **kwargs):
+        packets.append(ts_packet(pid, counters[pid], payload, **kwargs))
+        counters[pid] = (counters[pid] + 1) % 16
+
+    for frame in range(FRAMES):
+        pts = FIRST_PTS + frame * FRAME_TICKS
+        video = pes(0xE0, pts + FRAME_TICKS, pts, bytes(140), length=False)
+        add(VIDEO_PID, video[:150], start=True, pcr=pts - FRAME_TICKS, random_access=frame % 5 == 0)
+        add(VIDEO_PID, video[150:])
+        for half in range(2):
+            add(AUDIO_PID, pes(0xC0, pts + half * AUDIO_TICKS, payload=bytes(60)), start=True)
+
+    with open(path, 'wb') as f:
+        step = PERIOD * 300 // len(packets)
+        for i, packet in enumerate(packets):
+            if packet_size == 192:
+                f.write(struct.pack('>I', 0x40000000 | (1000 + i * step)))
+            f.write(packet)
+
+def read_ts(path, packet_size=188):
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = packet_size - 188
+    for pos in range(0, len(data), packet_size):
+        ats = int.from_bytes(data[pos:pos + 4], 'big') if offset else None
+        yield ats, data[pos + offset:pos + packet_size]
+
+@pytest.fixture(params=['numpy', 'python'])
+def patching(request, monkeypatch):
+    """Runs a test with timestamps patched by numpy, and again by the plain Python fallback."""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(packetized, 'optional_numpy', lambda: None)
+    return request.param
+
+def steps(values, wrap=TIMESTAMP_WRAP):
+    return {(b - a) % wrap for a, b in zip(values, values[1:])}
+
+@pytest.mark.parametrize('packet_size', [188, 192])
+@pytest.mark.parametrize('repeat', [1, 4])
+def test_transport_stream_loops_continue(tmp_path, patching, packet_size, repeat):
+    input_file = os.path.join(tmp_path, 'in.ts')
+    output_file = os.path.join(tmp_path, 'out.ts')
+    write_ts(input_file, packet_size)
+    assert extend_packetized(input_file, output_file, repeat)
+    assert os.path.getsize(output_file) == os.path.getsize(input_file) * repeat
+
+    counters = {}
+    pts = {}
+    dts = []
+    pcrs = []
+    arrivals = []
+    for ats, packet in read_ts(output_file, packet_size):
+        pid = ((packet[1] & 0x1F) << 8) | packet[2]
+        counters.setdefault(pid, []).append(packet[3] & 0x0F)
+        payload = 4
+        if packet[3] & 0x20:
+            if packet[5] & 0x10:
+                pcrs.append(decode_pcr(packet, 6))
+            payload = 5 + packet[4]
+        if packet[1] & 0x40:
+            pts.setdefault(pid, []).append(decode_timestamp(packet, payload + 9))
+            if packet[payload + 7] & 0x40:
+                dts.append(decode_timestamp(packet, payload + 14))
+        if ats is not None:
+            arrivals.append(ats)
+
+    for values in counters.values():
+        assert steps(values, 16) == {1}
+    assert len(pts[VIDEO_PID]) == FRAMES * repeat
+    assert steps(pts[VIDEO_PID]) == {FRAME_TICKS}
+    assert steps(dts) == {FRAME_TICKS}
+    assert steps(pcrs) == {FRAME_TICKS}
+    assert steps(pts[AUDIO_PID]) == {AUDIO_TICKS}
+    if arrivals:
+        assert {ats >> 30 for ats in arrivals} == {1}
+        assert len(steps([ats & (ATS_WRAP - 1) for ats in arrivals], ATS_WRAP)) == 1
+
+def pack_header(scr):
+    return b'\x00\x00\x01\xba' + encode_scr(b'\x44\x00\x04\x00\x04', scr) + b'\x01\x01\x89\xc3\xf8'
+
+def write_ps(path):
+    """Writes one PERIOD as a pack per frame, with a GOP starting every fifth frame."""
+    data = b''
+    for frame in range(FRAMES):
+        pts = FIRST_PTS + frame * FRAME_TICKS
+        picture = b'\x00\x00\x01\x00' + bytes(40)
+        if frame % 5 == 0:
+            picture = b'\x00\x00\x01\xb3' + bytes(8) + b'\x00\x00\x01\xb8' + bytes(4) + picture
+        data += pack_header(pts - FRAME_TICKS)
+        data += pes(0xE0, pts + FRAME_TICKS, pts, picture)
+        data += pes(0xC0, pts, payload=bytes(30))
+    with open(path, 'wb') as f:
+        f.write(data + PROGRAM_END_CODE)
+
+def read_ps(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    scrs = []
+    timestamps = {}
+    end_codes = 0
+    pos = 0
+    while pos < len(data):
+        assert data[pos:pos + 3] == b'\x00\x00\x01'
+        code = data[pos + 3]
+        if code == 0xB9:
+            end_codes += 1
+            pos += 4
+        elif code == 0xBA:
+            scrs.append(decode_scr(data, pos + 4))
+            pos += 14
+        else:
+            values = timestamps.setdefault(code, ([], []))
+            values[0].append(decode_timestamp(data, pos + 9))
+            if data[pos + 7] & 0x40:
+                values[1].append(decode_timestamp(data, pos + 14))
+            pos += 6 + int.from_bytes(data[pos + 4:pos + 6], 'big')
+    return data, scrs, timestamps, end_codes
+
+@pytest.mark.parametrize('repeat, tail', [(3, None), (2, 0.25)])
+def test_program_stream_loops_continue(tmp_path, patching, repeat, tail):
+    input_file = os.path.join(tmp_path, 'in.mpg')
+    output_file = os.path.join(tmp_path, 'out.mpg')
+    write_ps(input_file)
+    start_time = FIRST_PTS / 90000
+    assert extend_packetized(input_file, output_file, repeat, tail, start_time=start_time)
+
+    data, scrs, timestamps, end_codes = read_ps(output_file)
+    # The end code is dropped between loops; a keyframe-cut tail ends without one.
+    assert end_codes == (1 if tail is None else 0)
+    assert data.endswith(PROGRAM_END_CODE) == (tail is None)
+    frames = FRAMES * repeat + (5 if tail is not None else 0)
+    assert steps(scrs) == {FRAME_TICKS}
+    video_pts, video_dts = timestamps[0xE0]
+    assert len(video_pts) == frames
+    assert steps(video_pts) == {FRAME_TICKS}
+    assert steps(video_dts) == {FRAME_TICKS}
+    audio_pts, _ = timestamps[0xC0]
+    assert steps(audio_pts) == {FRAME_TICKS}
+
+def test_program_stream_rejects_other_files(tmp_path):
+    input_file = os.path.join(tmp_path, 'in.mpg')
+    with open(input_file, 'wb') as f:
+        f.write(b'\x00\x00')
+    with pytest.raises(UnsupportedLayout):
+        extend_packetized(input_file, os.path.join(tmp_path, 'out.mpg'), 2)
@@ -0,0 +1,79 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from extender.playlist import (DASH_NS, build_dash_manifest, build_hls_playlist, hls_segment_args,
+                               parse_iso_duration)
+
+HLS_SOURCE = """#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-TARGETDURATION:6
+#EXT-X-MEDIA-SEQUENCE:0
+#EXT-X-PLAYLIST-TYPE:VOD
+#EXT-X-MAP:URI="init.mp4"
+#EXTINF:6.000000,
+seg_00000.m4s
+#EXTINF:5.500000,
+seg_00001.m4s
+#EXT-X-ENDLIST
+"""
+
+DASH_SOURCE = f"""<?xml version="1.0" encoding="utf-8"?>
+<MPD xmlns="{DASH_NS}" type="static" mediaPresentationDuration="PT11.5S">
+  <Period id="0" start="PT0.0S">
+    <AdaptationSet contentType="video">
+      <Representation id="0">
+        <SegmentTemplate timescale="1000" initialization="init-$RepresentationID$.m4s"
+                         media="chunk-$RepresentationID$-$Number%05d$.m4s" startNumber="1">
+          <SegmentTimeline><S t="1400" d="6000" /><S d="5500" /></SegmentTimeline>
+        </SegmentTemplate>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+def uris(playlist):
+    return [line for line in playlist.splitlines() if line and not line.startswith('#')]
+
+def test_hls_loops_segments_with_discontinuities():
+    playlist = build_hls_playlist(HLS_SOURCE, 3)
+    assert uris(playlist) == ['seg_00000.m4s', 'seg_00001.m4s'] * 3
+    assert playlist.count('#EXT-X-DISCONTINUITY') == 2
+    # Each loop repeats the init segment after its discontinuity.
+    assert playlist.count('#EXT-X-MAP:URI="init.mp4"') == 3
+    assert '#EXT-X-VERSION:7' in playlist and '#EXT-X-TARGETDURATION:6' in playlist
+    assert playlist.endswith('#EXT-X-ENDLIST\n')
+
+def test_hls_tail_keeps_segments_that_start_before_it():
+    assert uris(build_hls_playlist(HLS_SOURCE, 1, tail=6.0))[2:] == ['seg_00000.m4s']
+    assert uris(build_hls_playlist(HLS_SOURCE, 1, tail=6.5))[2:] == ['seg_00000.m4s', 'seg_00001.m4s']
+
+def test_hls_without_segments_is_rejected():
+    with pytest.raises(ValueError):
+        build_hls_playlist('#EXTM3U\n#EXT-X-ENDLIST\n', 2)
+
+def test_hls_segment_type_follows_codec():
+    assert '-hls_segment_type' not in hls_segment_args('in.mp4', 'out', 'h264')
+    assert 'fmp4' in hls_segment_args('in.mp4', 'out', 'av1')
+
+def test_dash_repeats_the_period():
+    root = ET.fromstring(build_dash_manifest(DASH_SOURCE, 2, tail=3.0))
+    periods = root.findall(f'{{{DASH_NS}}}Period')
+    assert [(p.get('id'), p.get('start'), p.get('duration')) for p in periods] == [
+        ('0', 'PT0.000S', 'PT11.500S'), ('1', 'PT11.500S', 'PT11.500S'), ('2', 'PT23.000S', 'PT3.000S')]
+    assert root.get('mediaPresentationDuration') == 'PT26.000S'
+    templates = list(root.iter(f'{{{DASH_NS}}}SegmentTemplate'))
+    # Every period's media timeline is shifted back to start at the period start.
+    assert {template.get('presentationTimeOffset') for template in templates} == {'1400'}
+
+def test_dash_rejects_several_periods():
+    source = DASH_SOURCE.replace('</MPD>', '<Period id="1" />\n</MPD>')
+    with pytest.raises(ValueError):
+        build_dash_manifest(source, 2)
+
+def test_iso_durations():
+    assert parse_iso_duration('PT1H2M3.5S') == 3723.5
+    assert parse_iso_duration('P1DT0.5S') == 86400.5
+    with pytest.raises(ValueError):
+        parse_iso_duration('1 minute')
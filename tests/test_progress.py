@@ -0,0 +1,69 @@
+import pytest
+
+from extender.progress import CopyProgress, ProgressParser
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def feed_record(parser, out_time_us, total_size, speed='1.5x', end=False):
+    for line in (f'out_time_us={out_time_us}', f'total_size={total_size}', f'speed={speed}',
+                 'progress=' + ('end' if end else 'continue')):
+        parser.feed(line.encode() + b'\n')
+
+def test_parser_reports_percent_rate_and_speed():
+    clock = FakeClock()
+    updates = []
+    parser = ProgressParser(100, updates.append, offset_seconds=20, clock=clock)
+    clock.now = 2
+    feed_record(parser, 30000000, 4 * 1024 * 1024)
+    info = updates[-1]
+    assert info.percent == 50
+    assert info.out_seconds == 30
+    assert info.bytes_per_second == 2 * 1024 * 1024
+    assert info.speed == 1.5
+    assert info.describe() == '1.5x · 2.0 MB/s'
+    assert not info.finished
+
+def test_parser_throttles_until_the_end():
+    clock = FakeClock()
+    updates = []
+    parser = ProgressParser(10, updates.append, clock=clock)
+    feed_record(parser, 1000000, 100)
+    clock.now = 0.1
+    feed_record(parser, 2000000, 200)
+    assert len(updates) == 1
+    # Throttled records still update the size that write throttling reads.
+    assert parser.total_size == 200
+    feed_record(parser, 9000000, 900, end=True)
+    assert len(updates) == 2
+    assert updates[-1].finished and updates[-1].percent == 90
+
+def test_parser_tolerates_missing_values():
+    updates = []
+    parser = ProgressParser(0, updates.append, clock=FakeClock())
+    parser.feed(b'out_time_us=N/A\n')
+    parser.feed(b'not a key value line\n')
+    parser.feed(b'speed=N/A\n')
+    parser.feed(b'progress=end\n')
+    info = updates[-1]
+    assert (info.percent, info.out_seconds, info.total_size, info.speed) == (100, 0.0, 0, None)
+    assert info.describe() == ''
+
+def test_copy_progress():
+    clock = FakeClock()
+    updates = []
+    progress = CopyProgress(60, updates.append, clock=clock)
+    clock.now = 2
+    progress.update(30, 1024 * 1024)
+    clock.now = 2.1
+    progress.update(40, 2 * 1024 * 1024)
+    assert len(updates) == 1
+    assert (updates[0].percent, updates[0].speed) == (50, 15)
+    assert updates[0].to_dict()['bytes_per_second'] == 512 * 1024
+    progress.update(90, 3 * 1024 * 1024, finished=True)
+    assert updates[-1].percent == 100 and updates[-1].finished
+    assert updates[-1].speed == pytest.approx(90 / 2.1)
@@ -0,0 +1,75 @@
+import os
+import threading
+
+from extender.scheduler import IoScheduler, QueuedJob, TokenBucket
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_bucket_allows_a_burst_then_sleeps_off_overdrafts():
+    clock = FakeClock()
+    sleeps = []
+    bucket = TokenBucket(100, clock, sleeps.append)
+    bucket.consume(100)
+    assert sleeps == []
+    bucket.consume(50)
+    assert sleeps == [0.5]
+    # Idle time pays the debt back, but never banks more than one second of burst.
+    clock.now = 10
+    assert bucket.reserve(100) == 0.0
+    assert bucket.reserve(100) == 1.0
+
+def job(index, *devices):
+    return QueuedJob(index, f'{index}.mp4', devices, devices[-1])
+
+def test_busy_devices_are_passed_over():
+    scheduler = IoScheduler(per_device=1)
+    pending = [job(0, 'a'), job(1, 'a'), job(2, 'b', 'c'), job(3, 'c')]
+    first = scheduler.take(pending, lambda: False)
+    second = scheduler.take(pending, lambda: False)
+    assert (first.index, second.index) == (0, 2)
+    scheduler.release(first)
+    assert scheduler.take(pending, lambda: False).index == 1
+    assert [queued.index for queued in pending] == [3]
+
+def test_take_waits_for_a_release():
+    scheduler = IoScheduler(per_device=1)
+    running = scheduler.take([job(0, 'a')], lambda: False)
+    taken = []
+    waiter = threading.Thread(target=lambda: taken.append(scheduler.take([job(1, 'a')], lambda: False)))
+    waiter.start()
+    waiter.join(0.05)
+    assert waiter.is_alive() and not taken
+    scheduler.release(running)
+    waiter.join(5)
+    assert taken[0].index == 1
+
+def test_stopping_wakes_waiting_takers():
+    scheduler = IoScheduler(per_device=1)
+    scheduler.take([job(0, 'a')], lambda: False)
+    stopped = threading.Event()
+    taken = []
+    waiter = threading.Thread(target=lambda: taken.append(scheduler.take([job(1, 'a')], stopped.is_set)))
+    waiter.start()
+    stopped.set()
+    scheduler.wake()
+    waiter.join(5)
+    assert taken == [None]
+
+def test_unlimited_scheduler_runs_everything():
+    scheduler = IoScheduler()
+    pending = [job(0, 'a'), job(1, 'a')]
+    assert [scheduler.take(pending, lambda: False).index for _ in range(2)] == [0, 1]
+    assert scheduler.bucket('a') is None
+
+def test_jobs_count_against_input_and_output_devices(tmp_path):
+    scheduler = IoScheduler(per_device=1, write_limit=1000)
+    device = os.stat(tmp_path).st_dev
+    queued = scheduler.queue(0, os.path.join(tmp_path, 'clip.mp4'), str(tmp_path))
+    assert queued.devices == (device,) and queued.output_device == device
+    assert scheduler.bucket(device) is scheduler.bucket(device)
+    assert scheduler.queue(1, os.path.join(tmp_path, 'missing', 'clip.mp4')).devices == ()
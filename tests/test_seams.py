@@ -0,0 +1,100 @@
+import os
+import subprocess
+
+import pytest
+
+from extender.engine import ExtendOptions, ExtenderEngine
+from extender.probe_cache import MediaInfo
+from extender.seams import PieceTiming, SeamPlan, timed_entries
+from extender.tools import FFMPEG_PATH, FFPROBE_PATH
+
+FRAME_RATE = 25
+SOURCE_SECONDS = 4
+
+def piece_info(format_start, video_start, video_length, audio_start=None):
+    streams = [{'codec_type': 'video', 'start_time': str(video_start), 'duration': str(video_length)}]
+    if audio_start is not None:
+        streams.append({'codec_type': 'audio', 'start_time': str(audio_start)})
+    return MediaInfo(video_length, streams=streams, start_time=format_start)
+
+def test_piece_timing():
+    timing = PieceTiming(piece_info(1.42, 1.48, 2.0, audio_start=1.42))
+    assert timing.shift == pytest.approx(0.06)
+    assert timing.audio_lead == pytest.approx(0.06)
+    assert timing.length == 2.0
+    assert PieceTiming(piece_info(1.48, 1.48, 1.0)).audio_lead == 0.0
+
+def test_timed_entries_start_each_video_where_the_last_ends():
+    timings = {
+        'head': PieceTiming(piece_info(1.46, 1.48, 1.0, 1.46)),
+        'body': PieceTiming(piece_info(1.42, 1.48, 2.0, 1.42)),
+        'seam': PieceTiming(piece_info(1.40, 1.50, 2.0, 1.40)),
+    }
+    paths = ['head', 'body', 'seam', 'body']
+    entries = timed_entries(paths, timings)
+    # Each file starts at the sum of the durations before it, counted from its first packet.
+    starts = [sum(entry[3] for entry in entries[:i]) for i in range(len(entries))]
+    video_starts = [start + timings[path].shift for start, path in zip(starts, paths)]
+    assert video_starts == pytest.approx([0.02, 1.02, 3.02, 5.02])
+
+def test_entries_loop_body_and_seam():
+    plan = SeamPlan(4.0, 1.0, 3.0, 0.0, FRAME_RATE, 1.0)
+    pieces = ['head', 'body', 'end']
+    assert plan.entries(pieces, 'seam', 3) == ['head', 'body', 'seam', 'body', 'seam', 'body', 'end']
+    assert plan.pieces_from(pieces, 3.0) == ['end']
+    tail_pieces = ['head', 'body_a', 'body_b', 'end']
+    assert plan.entries(tail_pieces, 'seam', 1, 2.0) == ['head', 'body_a', 'body_b', 'seam', 'body_a']
+
+def run(*args):
+    return subprocess.run(args, capture_output=True, timeout=120)
+
+@pytest.fixture(scope='module')
+def ffmpeg(tmp_path_factory):
+    """ffmpeg and ffprobe, skipping when they are missing or cannot read back MPEG-TS pieces."""
+    if not (FFMPEG_PATH and os.path.exists(FFMPEG_PATH) and FFPROBE_PATH and os.path.exists(FFPROBE_PATH)):
+        pytest.skip('ffmpeg is not available')
+    piece = str(tmp_path_factory.mktemp('ffmpeg') / 'check.ts')
+    made = run(FFMPEG_PATH, '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=duration=0.2', piece)
+    if made.returncode != 0 or run(FFMPEG_PATH, '-v', 'error', '-i', piece, '-f', 'null', '-').returncode != 0:
+        pytest.skip('this ffmpeg cannot write and read back MPEG-TS')
+    return FFMPEG_PATH, FFPROBE_PATH
+
+def make_source(ffmpeg_path, path):
+    result = run(ffmpeg_path, '-v', 'error',
+                 '-f', 'lavfi', '-i', f"testsrc=size=160x120:rate={FRAME_RATE}:duration={SOURCE_SECONDS}",
+                 '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=48000:duration={SOURCE_SECONDS}",
+                 '-c:v', 'libx264', '-g', str(FRAME_RATE), '-bf', '2', '-pix_fmt', 'yuv420p', '-c:a', 'aac', path)
+    if result.returncode != 0:
+        pytest.skip('this ffmpeg cannot encode H.264 and AAC')
+
+def packet_times(ffprobe_path, path, stream):
+    output = subprocess.check_output([ffprobe_path, '-v', 'error', '-select_streams', stream,
+                                      '-show_entries', 'packet=pts_time', '-of', 'csv=p=0', path])
+    return sorted(float(line.strip(',')) for line in output.decode().split() if line.strip(','))
+
+@pytest.mark.parametrize('crossfade', [0.0, 0.4])
+@pytest.mark.parametrize('ext', ['.mp4', '.mkv'])
+def test_seamless_output_runs_without_gaps(tmp_path, ffmpeg, ext, crossfade):
+    ffmpeg_path, ffprobe_path = ffmpeg
+    input_file = str(tmp_path / f"source{ext}")
+    make_source(ffmpeg_path, input_file)
+    times = 3
+    options = ExtendOptions(times=times, ffmpeg_path=ffmpeg_path, ffprobe_path=ffprobe_path,
+                            seamless=True, crossfade=crossfade)
+    engine = ExtenderEngine(options)
+    outputs = []
+    methods = []
+    engine.on_job_finished = lambda index, input_file, output_file, success: outputs.append(output_file)
+    engine.on_job_metrics = lambda index, job: methods.append(job.method)
+    engine.run([input_file])
+    assert methods == ['seamless']
+    assert engine.failed_files == 0 and os.path.exists(outputs[0])
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('videoextender_')]
+
+    video = packet_times(ffprobe_path, outputs[0], 'v:0')
+    # Every frame follows the last by one frame duration, across the seams and stream-copied pieces.
+    assert len(video) == round((SOURCE_SECONDS * times - crossfade * (times - 1)) * FRAME_RATE)
+    assert {round(b - a, 3) for a, b in zip(video, video[1:])} == {1 / FRAME_RATE}
+    audio = packet_times(ffprobe_path, outputs[0], 'a:0')
+    # Audio ends within a frame or two of the video, rather than drifting by a gap at every seam.
+    assert audio[-1] == pytest.approx(video[-1], abs=0.1)
@@ -0,0 +1,66 @@
+import os
+
+from extender.uptodate import INDEX_NAME, OutputIndex, partial_path
+
+PARAMS = {'hours': 1, 'minutes': 0, 'times': 0}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def write(path, data=b'data'):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def test_partial_path_keeps_extension():
+    assert partial_path(os.path.join('out', 'clip_1h.mp4')) == os.path.join('out', 'clip_1h.partial.mp4')
+
+def test_recorded_output_is_up_to_date(tmp_path):
+    input_file = write(os.path.join(tmp_path, 'in.mp4'))
+    output_file = write(os.path.join(tmp_path, 'in_1h.mp4'))
+    index = OutputIndex()
+    assert index.lookup(input_file, output_file, PARAMS) is None
+    index.record(input_file, output_file, PARAMS, [output_file])
+    assert index.lookup(input_file, output_file, PARAMS) == output_file
+    assert index.lookup(input_file, output_file, dict(PARAMS, hours=2)) is None
+
+def test_changed_input_or_output_is_stale(tmp_path):
+    input_file = write(os.path.join(tmp_path, 'in.mp4'))
+    output_file = write(os.path.join(tmp_path, 'in_1h.mp4'))
+    index = OutputIndex()
+    index.record(input_file, output_file, PARAMS, [output_file])
+    write(output_file, b'truncated')
+    assert index.lookup(input_file, output_file, PARAMS) is None
+
+    index.record(input_file, output_file, PARAMS, [output_file])
+    write(input_file, b'replaced input')
+    assert index.lookup(input_file, output_file, PARAMS) is None
+
+def test_records_are_written_in_batches(tmp_path):
+    clock = FakeClock()
+    input_file = write(os.path.join(tmp_path, 'in.mp4'))
+    outputs = [write(os.path.join(tmp_path, f'in_{hours}h.mp4')) for hours in (1, 2, 3)]
+    index_file = os.path.join(tmp_path, INDEX_NAME)
+    index = OutputIndex(flush_seconds=5, clock=clock)
+
+    index.record(input_file, outputs[0], PARAMS, [outputs[0]])
+    index.record(input_file, outputs[1], PARAMS, [outputs[1]])
+    assert not os.path.exists(index_file)
+
+    clock.now = 5
+    index.record(input_file, outputs[2], PARAMS, [outputs[2]])
+    assert all(OutputIndex().lookup(input_file, path, PARAMS) == path for path in outputs)
+
+def test_flush_writes_pending_records(tmp_path):
+    input_file = write(os.path.join(tmp_path, 'in.mp4'))
+    output_file = write(os.path.join(tmp_path, 'in_1h.mp4'))
+    index = OutputIndex(clock=FakeClock())
+    index.record(input_file, output_file, PARAMS, [output_file])
+    assert OutputIndex().lookup(input_file, output_file, PARAMS) is None
+    index.flush()
+    assert OutputIndex().lookup(input_file, output_file, PARAMS) == output_file
+    assert not os.path.exists(os.path.join(tmp_path, INDEX_NAME + '.partial'))